@@ -23,6 +23,10 @@ export default function VakilChat({ documentText }: VakilChatProps) { // <-- CHA
     const [isCollapsed, setIsCollapsed] = useState<boolean>(false);
 
     const messagesEndRef = useRef<null | HTMLDivElement>(null);
+    // Server-side id for the uploaded document, so it is sent only once per chat
+    const documentIdRef = useRef<string | null>(null);
+    // Server-side chat session, so follow-up questions are answered with the earlier turns
+    const sessionIdRef = useRef<string | null>(null);
 
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -39,10 +43,10 @@ export default function VakilChat({ documentText }: VakilChatProps) { // <-- CHA
         const getIntroMessage = async () => {
             setIsLoading(true);
             try {
-                const response = await fetch('http://127.0.0.1:5000/api/advise', {
+                const response = await fetch('https://legalmate-a36k.onrender.com/api/identify', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ case_text: `Briefly (in one sentence) identify this document: ${documentText.substring(0, 500)}...` })
+                    body: JSON.stringify({ text: documentText.substring(0, 2000) })
                 });
 
                 if (!response.ok) throw new Error('Failed to get intro');
@@ -50,8 +54,8 @@ export default function VakilChat({ documentText }: VakilChatProps) { // <-- CHA
                 const data = await response.json();
 
                 let introText = "Hello! I've reviewed your document. Ask me anything about it.";
-                if (data.analysis_points && data.analysis_points.length > 0) {
-                    introText = `Hello! I've reviewed your document. It looks like it's about "${data.analysis_points[0].title}". You can ask me any questions you have.`;
+                if (data.title) {
+                    introText = `Hello! I've reviewed your document. It looks like it's about "${data.title}". You can ask me any questions you have.`;
                 }
 
                 setMessages([{ sender: 'vakil', text: introText }]);
@@ -65,6 +69,59 @@ export default function VakilChat({ documentText }: VakilChatProps) { // <-- CHA
         getIntroMessage();
     }, [documentText]);
 
+    // Upload the document once; later questions only send its id
+    const uploadDocument = async (): Promise<string> => {
+        const response = await fetch('https://legalmate-a36k.onrender.com/api/documents', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ text: documentText })
+        });
+        if (!response.ok) throw new Error('Document upload failed');
+        const data = await response.json();
+        documentIdRef.current = data.document_id;
+        return data.document_id;
+    };
+
+    const askVakil = (documentId: string, question: string) =>
+        fetch('https://legalmate-a36k.onrender.com/api/ask-vakil', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                document_id: documentId,
+                question,
+                session_id: sessionIdRef.current ?? undefined,
+                stream: true
+            })
+        });
+
+    // Read the Server-Sent Events answer stream, passing each token to onText
+    const readAnswerStream = async (response: Response, onText: (text: string) => void) => {
+        const reader = response.body!.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop() ?? '';
+            for (const raw of events) {
+                const event = raw.match(/^event: (.*)$/m)?.[1];
+                const data = raw.match(/^data: (.*)$/m)?.[1];
+                if (!data) continue;
+                const payload = JSON.parse(data);
+                if (event === 'error') throw new Error(payload.error);
+                if (event === 'session') sessionIdRef.current = payload.session_id;
+                if (event === 'token') onText(payload.text);
+            }
+        }
+    };
+
+    useEffect(() => {
+        documentIdRef.current = null;
+        sessionIdRef.current = null;
+    }, [documentText]);
+
     const handleSendMessage = async (e: React.FormEvent) => {
         e.preventDefault();
         const userMessage = currentMessage.trim();
@@ -75,20 +132,24 @@ export default function VakilChat({ documentText }: VakilChatProps) { // <-- CHA
         setIsLoading(true);
 
         try {
-            const response = await fetch('https://legalmate-a36k.onrender.com/api/ask-vakil', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    document_text: documentText,
-                    question: userMessage
-                })
-            });
+            let response = await askVakil(documentIdRef.current ?? await uploadDocument(), userMessage);
+            if (response.status === 404) {
+                // The server evicted the document; upload it again and retry once
+                response = await askVakil(await uploadDocument(), userMessage);
+            }
 
             if (!response.ok) throw new Error('API request failed');
-            const data = await response.json();
-            if (data.error) throw new Error(data.error);
 
-            setMessages(prev => [...prev, { sender: 'vakil', text: data.answer }]);
+            let started = false;
+            await readAnswerStream(response, (text) => {
+                const first = !started;
+                started = true;
+                setMessages(prev => {
+                    if (first) return [...prev, { sender: 'vakil', text }];
+                    const last = prev[prev.length - 1];
+                    return [...prev.slice(0, -1), { ...last, text: last.text + text }];
+                });
+            });
         } catch  {
             setMessages(prev => [...prev, { sender: 'vakil', text: "Sorry, I ran into an error trying to answer that." }]);
         } finally {
@@ -135,7 +196,8 @@ export default function VakilChat({ documentText }: VakilChatProps) { // <-- CHA
                     </div>
                 ))}
 
-                {isLoading && (
+                {/* Hide the typing indicator once Vakil's streamed answer has started */}
+                {isLoading && (messages.length === 0 || messages[messages.length - 1].sender === 'user') && (
                     <div className="flex justify-start">
                         <div className="px-4 py-2 rounded-2xl bg-slate-700 text-slate-200 rounded-bl-lg">
                             <div className="flex items-center gap-1.5">
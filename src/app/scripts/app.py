@@ -1,19 +1,20 @@
 import os
-import json
-import re
+import threading
+import time
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 
 # --- LangChain & Google Generative AI Imports ---
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
-from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 
+# --- Local Imports ---
+from build_index import StaleIndexError, index_signature, load_index
+from json_extract import JSONStreamExtractor, clean_json_strings
+
 # Load environment variables
 load_dotenv()
 
@@ -36,98 +37,93 @@ llm = ChatGoogleGenerativeAI(
 # --- RAG Chain Cache ---
 rag_chain_cache = {}
 
-def get_rag_chain():
-    """Initialize and cache RAG chain for legal documents."""
-    if "rag_chain" in rag_chain_cache:
-        return rag_chain_cache["rag_chain"]
-
-    # Embeddings
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="models/embedding-001",
-        google_api_key=os.getenv("GOOGLE_API_KEY")
-    )
-
-    # Load legal document
-    kb_path = "./knowledge_base/payment_of_wages_act.txt"
-    if not os.path.exists(kb_path):
-        raise FileNotFoundError(f"{kb_path} not found!")
-
-    loader = TextLoader(kb_path)
-    docs = loader.load()
-
-    # Split into chunks
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    split_docs = splitter.split_documents(docs)
-
-    # Vector store
-    vector_store = FAISS.from_documents(split_docs, embeddings)
+def build_rag_chain():
+    """Load the saved FAISS index and wrap it in a RetrievalQA chain."""
+    vector_store = load_index()
     retriever = vector_store.as_retriever()
 
     # Create RetrievalQA chain
-    rag_chain = RetrievalQA.from_chain_type(
+    return RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
         retriever=retriever,
         return_source_documents=True
     )
+
+def get_rag_chain():
+    """Initialize and cache RAG chain for legal documents.
+
+    The FAISS index is prebuilt offline by build_index.py and loaded from disk,
+    so workers no longer re-embed the knowledge base on their first request.
+    """
+    if "rag_chain" in rag_chain_cache:
+        return rag_chain_cache["rag_chain"]
+
+    rag_chain = build_rag_chain()
     rag_chain_cache["rag_chain"] = rag_chain
     return rag_chain
 
-def clean_text_formatting(text):
-    """Clean up numbered lists and formatting issues in text."""
-    if not isinstance(text, str):
-        return text
-    
-    # Remove numbered list patterns like "1. ", "2. ", etc.
-    text = re.sub(r'\d+\.\s+\*\*([^*]+)\*\*:\s*', r'\1: ', text)
-    text = re.sub(r'\d+\.\s+', '', text)
-    
-    # Remove markdown bold formatting
-    text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
-    
-    # Clean up multiple spaces and newlines
-    text = re.sub(r'\s+', ' ', text)
-    text = text.strip()
-    
-    return text
+def reload_rag_chain():
+    """Reload the index (patching it first if the sources changed) and swap the chain in."""
+    rag_chain = build_rag_chain()
+    # The old chain keeps serving until the new one is ready
+    rag_chain_cache["rag_chain"] = rag_chain
+    return rag_chain
 
-def parse_json_from_response(content):
-    """Helper function to extract JSON from LLM response."""
-    try:
-        # First try direct parsing
-        parsed = json.loads(content)
-    except json.JSONDecodeError:
-        # Try to extract JSON from markdown code blocks
-        json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-        if json_match:
-            try:
-                parsed = json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                pass
-        else:
-            # Try to find any JSON object in the text
-            json_match = re.search(r'(\{.*\})', content, re.DOTALL)
-            if json_match:
-                try:
-                    parsed = json.loads(json_match.group(1))
-                except json.JSONDecodeError:
-                    pass
-            else:
-                raise ValueError("Could not parse JSON from LLM response")
-    
-    # Clean up text formatting in the parsed JSON
-    if isinstance(parsed, dict):
-        for key, value in parsed.items():
-            if isinstance(value, str):
-                parsed[key] = clean_text_formatting(value)
-            elif isinstance(value, list):
-                for i, item in enumerate(value):
-                    if isinstance(item, dict):
-                        for sub_key, sub_value in item.items():
-                            if isinstance(sub_value, str):
-                                item[sub_key] = clean_text_formatting(sub_value)
-    
-    return parsed
+
+def watch_knowledge_base(interval: float, signature: tuple):
+    """
+    Hot reload: poll knowledge_base/ and the saved manifest every `interval`
+    seconds and reload the chain when either changes, so edits are picked up
+    without restarting workers. Whichever worker notices first patches the
+    index under the build lock; the others just load the result.
+    """
+    while True:
+        time.sleep(interval)
+        current = index_signature()
+        if current == signature:
+            continue
+        # Taken before reloading, so an edit made meanwhile triggers another pass
+        signature = current
+        try:
+            reload_rag_chain()
+            print("Reloaded knowledge base index")
+        except Exception as e:
+            print(f"Error in watch_knowledge_base: {str(e)}")
+
+
+# Load the saved index at startup instead of on the first request.
+# Fingerprint first, so an edit made while loading is still noticed.
+kb_signature = index_signature()
+try:
+    get_rag_chain()
+except StaleIndexError:
+    # Missing or outdated index with KB_INDEX_ON_STALE=refuse: don't start half-configured
+    raise
+except Exception as e:
+    print(f"Warning: knowledge base index not loaded: {str(e)}")
+
+KB_HOT_RELOAD_SECONDS = float(os.getenv("KB_HOT_RELOAD_SECONDS", "0"))
+if KB_HOT_RELOAD_SECONDS > 0:
+    threading.Thread(
+        target=watch_knowledge_base, args=(KB_HOT_RELOAD_SECONDS, kb_signature),
+        name="kb-hot-reload", daemon=True
+    ).start()
+
+def invoke_json(prompt_text):
+    """Ask the LLM for JSON; returns (parsed and cleaned value, raw text received).
+
+    The reply is parsed while it streams in, and reading stops as soon as the
+    JSON object is complete, so trailing fences or prose are never waited for.
+    """
+    extractor = JSONStreamExtractor()
+    received = []
+    for chunk in llm.stream([{"role": "user", "content": prompt_text}]):
+        content = chunk.content if isinstance(chunk.content, str) else ""
+        received.append(content)
+        if extractor.feed(content):
+            break
+    return clean_json_strings(extractor.finish()), "".join(received)
 
 # --- API Endpoints ---
 
@@ -168,10 +164,7 @@ def know_your_rights():
         Respond with ONLY the JSON, no additional text:
         """
         
-        response = llm.invoke([{"role": "user", "content": formatting_prompt}])
-        content = response.content if hasattr(response, "content") else str(response)
-        
-        parsed_response = parse_json_from_response(content)
+        parsed_response, _ = invoke_json(formatting_prompt)
         return jsonify(parsed_response)
         
     except Exception as e:
@@ -203,13 +196,10 @@ def simplify_document():
     """
 
     try:
-        response = llm.invoke([{"role": "user", "content": prompt_text}])
-        content = response.content if hasattr(response, "content") else str(response)
+        parsed_response, content = invoke_json(prompt_text)
         
         print("Raw LLM response:", content)  # Debug log
         
-        parsed_response = parse_json_from_response(content)
-        
         # Validate the response structure
         if "summary_points" not in parsed_response or not isinstance(parsed_response["summary_points"], list):
             raise ValueError("Missing 'summary_points' key or invalid format")
@@ -261,13 +251,10 @@ def advise_case():
     """
 
     try:
-        response = llm.invoke([{"role": "user", "content": prompt_text}])
-        content = response.content if hasattr(response, "content") else str(response)
+        parsed_response, content = invoke_json(prompt_text)
         
         print("Raw LLM response:", content)  # Debug log
         
-        parsed_response = parse_json_from_response(content)
-        
         # Validate the response structure
         if "analysis_points" not in parsed_response or not isinstance(parsed_response["analysis_points"], list):
             raise ValueError("Missing 'analysis_points' key or invalid format")
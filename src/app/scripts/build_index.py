@@ -0,0 +1,287 @@
+"""
+Offline builder and loader for the knowledge base FAISS index.
+
+Build once, then again after editing knowledge_base/*.txt:
+
+    python build_index.py
+
+The index, its chunk docstore and a manifest of source hashes are written to
+KB_INDEX_DIR (default ./kb_index). The Dockerfile runs this at image build time.
+At startup app.py loads that directory and compares the manifest with
+knowledge_base/*.txt; on mismatch it either rebuilds or refuses to start,
+depending on KB_INDEX_ON_STALE ("rebuild", the default, or "refuse", which
+the Docker image sets so a missing index fails instead of re-embedding).
+
+Builds are incremental. Each file is chunked section by section and every
+chunk is identified by the hash of its text, so an edit only changes the
+chunks of the sections it touches: those are embedded and added, chunks that
+no longer exist are deleted, and the rest of the saved index is kept. Vectors
+are also cached on disk under KB_EMBEDDING_CACHE_DIR, keyed by embedding model
+and chunk hash, so a full rebuild (--full) or reverting an edit does not call
+the embedding API again for text it has already seen.
+"""
+import argparse
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+# --- Index Settings ---
+KB_DIR = os.getenv("KB_DIR", "./knowledge_base")
+KB_INDEX_DIR = os.getenv("KB_INDEX_DIR", "./kb_index")
+EMBEDDING_MODEL = "models/embedding-001"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+MANIFEST_FILE = "manifest.json"
+KB_EMBEDDING_CACHE_DIR = os.getenv("KB_EMBEDDING_CACHE_DIR", "./kb_embedding_cache")
+# Bump when chunking changes, so saved indexes are rebuilt rather than patched
+CHUNKING_VERSION = "sections-1"
+
+# Sections are separated by blank lines; the first block is the document title
+_BLOCK_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+class StaleIndexError(RuntimeError):
+    """Raised when the saved index does not match the knowledge base sources."""
+
+
+def get_embeddings():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return GoogleGenerativeAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        google_api_key=os.getenv("GOOGLE_API_KEY")
+    )
+
+
+def get_cached_embeddings(embeddings=None, cache_dir: str = KB_EMBEDDING_CACHE_DIR):
+    """Wrap the embeddings so document vectors are read from / written to the disk cache."""
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+
+    return CacheBackedEmbeddings.from_bytes_store(
+        embeddings or get_embeddings(),
+        LocalFileStore(cache_dir),
+        namespace=f"{EMBEDDING_MODEL}/",
+        key_encoder="sha256",
+    )
+
+
+# --- Manifest Helpers ---
+
+def source_manifest(kb_dir: str = KB_DIR) -> dict:
+    """Describe the current sources and build settings that the index depends on."""
+    files = {}
+    for path in sorted(glob.glob(os.path.join(kb_dir, "*.txt"))):
+        with open(path, "rb") as f:
+            files[os.path.basename(path)] = hashlib.sha256(f.read()).hexdigest()
+    if not files:
+        raise FileNotFoundError(f"No knowledge base files found in {kb_dir}")
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunking": CHUNKING_VERSION,
+        "files": files,
+    }
+
+
+def saved_manifest(index_dir: str = KB_INDEX_DIR):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def index_signature(kb_dir: str = KB_DIR, index_dir: str = KB_INDEX_DIR) -> tuple:
+    """Cheap fingerprint (mtimes and sizes) of the sources and the saved manifest."""
+    paths = sorted(glob.glob(os.path.join(kb_dir, "*.txt")))
+    paths.append(os.path.join(index_dir, MANIFEST_FILE))
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+@contextmanager
+def build_lock(index_dir: str):
+    """Serialize builds across worker processes sharing the same index dir."""
+    lock_path = os.path.abspath(index_dir) + ".lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# --- Chunking ---
+
+def chunk_file(name: str, text: str, splitter) -> list:
+    """
+    Chunks of one knowledge base file, each prefixed with the document title.
+
+    Sections are split independently, so editing or adding a section leaves
+    the chunks of every other section unchanged.
+    """
+    blocks = [b.strip() for b in _BLOCK_SPLIT_RE.split(text) if b.strip()]
+    if not blocks:
+        return []
+    title, sections = blocks[0], blocks[1:] or blocks[:1]
+    chunks = []
+    for section in sections:
+        for piece in splitter.split_text(section):
+            chunks.append(piece if piece == title else f"{title}\n\n{piece}")
+    return chunks
+
+
+def load_chunks(kb_dir: str, files) -> dict:
+    """Map chunk id -> Document for every chunk of the given files, in file order."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = {}
+    for name in files:
+        with open(os.path.join(kb_dir, name), "r", encoding="utf-8") as f:
+            texts = chunk_file(name, f.read(), splitter)
+        for text in texts:
+            chunk_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            # The same text twice in one file still needs two ids
+            chunk_id = f"{name}:{chunk_hash[:32]}"
+            while chunk_id in chunks:
+                chunk_id += "+"
+            chunks[chunk_id] = Document(
+                page_content=text,
+                metadata={"source": name, "chunk_hash": chunk_hash},
+            )
+    return chunks
+
+
+# --- Build & Load ---
+
+def _save_index(vector_store: FAISS, manifest: dict, index_dir: str) -> None:
+    """Write into a temp dir next to the target, then swap it in."""
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".kb_index-", dir=parent)
+    try:
+        vector_store.save_local(tmp_dir)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(index_dir):
+            shutil.rmtree(index_dir)
+        os.replace(tmp_dir, index_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def _load_patchable_index(embeddings, manifest: dict, index_dir: str):
+    """The saved index if it was built with the same model and chunking, else None."""
+    saved = saved_manifest(index_dir)
+    settings = ("embedding_model", "chunk_size", "chunk_overlap", "chunking")
+    if saved is None or any(saved.get(key) != manifest[key] for key in settings):
+        return None
+    try:
+        return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    except Exception as e:
+        print(f"Error in _load_patchable_index: {str(e)}")
+        return None
+
+
+def build_index(embeddings=None, kb_dir: str = KB_DIR, index_dir: str = KB_INDEX_DIR,
+                full: bool = False) -> FAISS:
+    """
+    Bring the saved index up to date with the knowledge base files.
+
+    Only chunks that are not in the saved index are embedded (and only those
+    missing from the embedding cache reach the API); chunks whose text is
+    gone are deleted. With full=True the index is rebuilt from all chunks.
+    """
+    embeddings = get_cached_embeddings(embeddings)
+    manifest = source_manifest(kb_dir)
+    chunks = load_chunks(kb_dir, manifest["files"])
+
+    vector_store = None if full else _load_patchable_index(embeddings, manifest, index_dir)
+    if vector_store is None:
+        ids = list(chunks)
+        vector_store = FAISS.from_documents([chunks[i] for i in ids], embeddings, ids=ids)
+        added, removed = ids, []
+    else:
+        existing = set(vector_store.index_to_docstore_id.values())
+        added = [chunk_id for chunk_id in chunks if chunk_id not in existing]
+        removed = [chunk_id for chunk_id in existing if chunk_id not in chunks]
+        if removed:
+            vector_store.delete(removed)
+        if added:
+            vector_store.add_documents([chunks[i] for i in added], ids=added)
+
+    manifest["chunks"] = len(chunks)
+    _save_index(vector_store, manifest, index_dir)
+
+    print(
+        f"Updated knowledge base index: {len(chunks)} chunks from {len(manifest['files'])} files "
+        f"({len(added)} added, {len(removed)} removed)"
+    )
+    return vector_store
+
+
+def is_index_current(kb_dir: str = KB_DIR, index_dir: str = KB_INDEX_DIR) -> bool:
+    saved = saved_manifest(index_dir)
+    if saved is None:
+        return False
+    saved = {k: v for k, v in saved.items() if k != "chunks"}
+    return saved == source_manifest(kb_dir)
+
+
+def load_index(embeddings=None, kb_dir: str = KB_DIR, index_dir: str = KB_INDEX_DIR,
+               on_stale: str = None) -> FAISS:
+    """Load the saved index, rebuilding or refusing if it no longer matches the sources."""
+    embeddings = embeddings or get_embeddings()
+    on_stale = on_stale or os.getenv("KB_INDEX_ON_STALE", "rebuild")
+
+    if not is_index_current(kb_dir, index_dir):
+        if on_stale != "rebuild":
+            raise StaleIndexError(
+                f"Index in {index_dir} is missing or out of date; run `python build_index.py`"
+            )
+        with build_lock(index_dir):
+            # Another worker may have finished the rebuild while we waited
+            if not is_index_current(kb_dir, index_dir):
+                return build_index(embeddings, kb_dir, index_dir)
+
+    return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build the knowledge base FAISS index.")
+    parser.add_argument("--kb-dir", default=KB_DIR)
+    parser.add_argument("--index-dir", default=KB_INDEX_DIR)
+    parser.add_argument("--check", action="store_true",
+                        help="Only report whether the saved index matches the sources")
+    parser.add_argument("--full", action="store_true",
+                        help="Rebuild from all chunks instead of patching the saved index")
+    args = parser.parse_args()
+
+    if args.check:
+        current = is_index_current(args.kb_dir, args.index_dir)
+        print("Index is up to date" if current else "Index is missing or stale")
+        raise SystemExit(0 if current else 1)
+
+    build_index(kb_dir=args.kb_dir, index_dir=args.index_dir, full=args.full)
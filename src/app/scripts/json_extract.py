@@ -0,0 +1,190 @@
+"""
+JSON extraction and text cleanup for LLM responses.
+
+The model is asked for bare JSON but often wraps it in a ```json fence or
+adds a sentence before or after. extract_json() finds the first complete JSON
+object in one left-to-right pass: the C decoder parses from the first opening
+bracket and stops where the value ends, so surrounding text is never
+re-scanned and no regex has to backtrack over the whole response. Every
+caller wants an object, so a bracketed list in the prose ("see [1]") is
+skipped; an array is only returned when the response has no object at all.
+
+JSONStreamExtractor does the same for a token stream: it tracks bracket depth
+(skipping brackets inside strings) across chunks, so the caller can stop
+reading as soon as the value is closed. If no object ever closes (e.g. an
+unmatched "{" in the prose before it), finish() falls back to extract_json()
+on the whole text. clean_json_strings() then walks the
+parsed value once and cleans every string in it, however deeply nested.
+"""
+import json
+import re
+from typing import Any, Iterable, List, Optional
+
+_DECODER = json.JSONDecoder()
+_MISSING = object()
+
+# Where a JSON value may start, and the characters that matter while scanning one
+_VALUE_START_RE = re.compile(r"[{\[]")
+_STRUCTURAL_RE = re.compile(r'[{}\[\]"]')
+_STRING_END_RE = re.compile(r'["\\]')
+
+# Numbered bold headings, other numbered list markers and markdown bold; applied in this order
+_NUMBERED_HEADING_RE = re.compile(r"\d+\.\s+\*\*([^*]+)\*\*:\s*")
+_NUMBER_MARKER_RE = re.compile(r"\d+\.\s+")
+_BOLD_RE = re.compile(r"\*\*([^*]+)\*\*")
+
+
+def extract_json(content: str) -> Any:
+    """
+    The first JSON object in `content`, else the first array; raises
+    ValueError if there is neither.
+    """
+    fallback = _MISSING
+    match = _VALUE_START_RE.search(content)
+    while match:
+        try:
+            value, end = _DECODER.raw_decode(content, match.start())
+        except json.JSONDecodeError:
+            # A stray bracket in prose; try the next one
+            match = _VALUE_START_RE.search(content, match.start() + 1)
+            continue
+        if isinstance(value, dict):
+            return value
+        if fallback is _MISSING:
+            fallback = value
+        match = _VALUE_START_RE.search(content, end)
+    if fallback is not _MISSING:
+        return fallback
+    raise ValueError("Could not parse JSON from LLM response")
+
+
+class JSONStreamExtractor:
+    """
+    Incremental extract_json() for streamed output.
+
+    feed() each chunk as it arrives; it returns True once a complete object
+    has been received, after which `value` holds it and the rest of the
+    stream can be dropped. Each chunk is scanned once and the value's text is
+    only joined when its closing bracket arrives. Otherwise finish() parses
+    the whole text with extract_json(), which also returns an array when
+    there is no object.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._parts: Optional[List[str]] = None  # text of the current value so far, once one has started
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False  # the previous chunk ended with a backslash inside a string
+        self.done = False
+        self.value: Any = None
+
+    def feed(self, chunk: str) -> bool:
+        if self.done or not chunk:
+            return self.done
+        self._chunks.append(chunk)
+        pos = 0
+        begin = 0  # where the current value starts in this chunk
+        if self._escaped:
+            pos, self._escaped = 1, False
+        while pos < len(chunk):
+            if self._parts is None:
+                match = _VALUE_START_RE.search(chunk, pos)
+                if match is None:
+                    return False
+                self._parts, self._depth = [], 0
+                begin = pos = match.start()
+            if self._in_string:
+                match = _STRING_END_RE.search(chunk, pos)
+                if match is None:
+                    break
+                if match.group() == "\\":
+                    # Skip the escaped character, which may be in the next chunk
+                    self._escaped = match.end() >= len(chunk)
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+            match = _STRUCTURAL_RE.search(chunk, pos)
+            if match is None:
+                break
+            char = match.group()
+            pos = match.end()
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._close("".join(self._parts) + chunk[begin:pos]):
+                        return True
+                    # Not JSON (e.g. "{like this}" in prose) or an array; look further on.
+                    # A bracket that never closes is left to finish()
+                    self._parts = None
+        if self._parts is not None:
+            self._parts.append(chunk[begin:])
+        return False
+
+    def finish(self) -> Any:
+        """The extracted object (or array); raises ValueError if the stream ended without one."""
+        if not self.done:
+            # Rescans from every bracket, so a stray unclosed one can't hide the value
+            self.value, self.done = extract_json("".join(self._chunks)), True
+        return self.value
+
+    def _close(self, candidate: str) -> bool:
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            return False
+        if not isinstance(value, dict):
+            return False
+        self.value, self.done = value, True
+        return True
+
+
+def extract_json_from_stream(chunks: Iterable[str]) -> Any:
+    """Feed chunks until a complete JSON object has arrived; later chunks are not read."""
+    extractor = JSONStreamExtractor()
+    for chunk in chunks:
+        if extractor.feed(chunk):
+            break
+    return extractor.finish()
+
+
+# --- Text Cleanup ---
+
+def clean_text_formatting(text):
+    """Clean up numbered lists and formatting issues in text.
+
+    "1. **Heading**: " becomes "Heading: ", other "1. " markers are dropped,
+    **bold** is unwrapped and whitespace is collapsed. Each pass runs on the
+    previous one's output, so they can't be merged into one alternation
+    ("**12. Terms**: ok" must become "Terms: ok").
+    """
+    if not isinstance(text, str):
+        return text
+    text = _NUMBERED_HEADING_RE.sub(r"\1: ", text)
+    text = _NUMBER_MARKER_RE.sub("", text)
+    text = _BOLD_RE.sub(r"\1", text)
+    return " ".join(text.split())
+
+
+def clean_json_strings(value: Any) -> Any:
+    """Apply clean_text_formatting to every string in a parsed JSON value, in place where possible."""
+    if isinstance(value, str):
+        return clean_text_formatting(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            value[key] = clean_json_strings(item)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            value[i] = clean_json_strings(item)
+    return value
+
+
+def parse_json_from_response(content: Optional[str]) -> Any:
+    """Extract the JSON value from an LLM response and clean the text in it."""
+    return clean_json_strings(extract_json(content or ""))
@@ -21,6 +21,8 @@ export default function DocumentSimplifierPage() {
     const [result, setResult] = useState<SimplifiedPoint[]>([]);
     const [text, setText] = useState<string>('');
     const [error, setError] = useState<string>('');
+    // Server-side copy of the uploaded PDF, reused while the extracted text is unedited
+    const [uploadedDocument, setUploadedDocument] = useState<{ id: string; text: string } | null>(null);
 
     // --- 2. ADD NEW STATE FOR THE CHAT ---
     const [showChat, setShowChat] = useState<boolean>(false);
@@ -39,13 +41,24 @@ export default function DocumentSimplifierPage() {
         
         const documentToSimplify = text.trim();
 
-        try {
-            // const response = await fetch('https://legalmate-a36k.onrender.com/api/simplify', {
-            const response = await fetch('https://legalmate-a36k.onrender.com/api/simplify', {
+        const simplify = (body: { document_id: string } | { text: string }) =>
+            // fetch('https://legalmate-a36k.onrender.com/api/simplify', {
+            fetch('https://legalmate-a36k.onrender.com/api/simplify', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: documentToSimplify })
+                body: JSON.stringify(body)
             });
+
+        try {
+            const reuseUpload = uploadedDocument !== null && uploadedDocument.text.trim() === documentToSimplify;
+            let response = await simplify(
+                reuseUpload ? { document_id: uploadedDocument.id } : { text: documentToSimplify }
+            );
+            if (reuseUpload && response.status === 404) {
+                // The server evicted the uploaded document; send the text instead
+                setUploadedDocument(null);
+                response = await simplify({ text: documentToSimplify });
+            }
             
             if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
             
@@ -81,13 +94,15 @@ export default function DocumentSimplifierPage() {
         setResult([]);
         setText('');
         setShowChat(false); // Close chat on new upload
+        setUploadedDocument(null);
 
         const formData = new FormData();
-        formData.append('pdf', file);
+        formData.append('file', file);
+        formData.append('include_text', 'true');
 
         try {
-            // NOTE: You still need to create this /api/extract-pdf endpoint!
-            const response = await fetch('/api/extract-pdf', {
+            // Extracted and stored server-side; identical uploads are only processed once
+            const response = await fetch('https://legalmate-a36k.onrender.com/api/documents/ingest', {
                 method: 'POST',
                 body: formData,
             });
@@ -99,6 +114,7 @@ export default function DocumentSimplifierPage() {
             }
 
             setText(data.text);
+            setUploadedDocument({ id: data.document_id, text: data.text });
         } catch (err) {
             setError(err instanceof Error ? err.message : 'An unknown error occurred during PDF processing.');
         } finally {
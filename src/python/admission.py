@@ -0,0 +1,404 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+# Lower numbers are admitted first when requests queue for quota
+PRIORITY_CHAT = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+
+# How often a queued request re-checks whether it may proceed
+_POLL_SECONDS = 0.05
+
+# Error markers for upstream conditions that are worth retrying
+_TRANSIENT_MARKERS = (
+    "429", "500", "502", "503", "504",
+    "resource_exhausted", "resourceexhausted", "quota", "rate limit",
+    "unavailable", "deadline", "timeout", "timed out", "overloaded",
+)
+
+
+class UpstreamUnavailable(Exception):
+    """The LLM upstream is out of quota or degraded; retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def is_transient_error(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in _TRANSIENT_MARKERS)
+
+
+# --- Token Bucket ---
+
+class TokenBucket:
+    """Continuously refilling bucket sized as `per_minute` units per minute (0 = unlimited)."""
+
+    def __init__(self, per_minute: float, now: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if it is available now)."""
+        if self.capacity <= 0:
+            return 0.0  # a limit of 0 disables this bucket
+        self._refill(now)
+        # Requests larger than the whole bucket wait for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        if self.capacity <= 0:
+            return
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+# --- Circuit Breaker ---
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and fails
+    fast for `reset_timeout` seconds. Then one probe call is let through
+    (half-open); its outcome closes or re-opens the circuit. A probe that ends
+    without an outcome (rejected, cancelled or abandoned) is released so the
+    next call probes instead, and one still pending after `probe_timeout`
+    seconds is replaced.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float],
+                 probe_timeout: Optional[float] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = reset_timeout if probe_timeout is None else probe_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self._probe = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> Optional[int]:
+        """Raises while the circuit is open; returns a probe id when this call is the half-open probe."""
+        with self._lock:
+            if self.state == "closed":
+                return None
+            now = self.clock()
+            if self.state == "half_open" and now - self.probe_started >= self.probe_timeout:
+                # The probe never reported back, e.g. a hung upstream call
+                self.state = "open"
+            remaining = self.opened_at + self.reset_timeout - now
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+                self.probe_started = now
+                self._probe += 1
+                return self._probe
+            raise UpstreamUnavailable(
+                "Upstream LLM is temporarily unavailable", max(remaining, 1.0)
+            )
+
+    def release_probe(self, probe: Optional[int]) -> None:
+        """Called when a call ends; a probe with no recorded outcome lets the next call probe."""
+        if probe is None:
+            return
+        with self._lock:
+            if self.state == "half_open" and probe == self._probe:
+                self.state = "open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = self.clock()
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(self.opened_at + self.reset_timeout - self.clock(), 1.0)
+
+
+# --- Admission Controller ---
+
+class AdmissionController:
+    """
+    Gatekeeper for every upstream LLM call.
+
+    Calls wait in a bounded priority queue until both the request and token
+    buckets have room, go through the circuit breaker, and are retried with
+    full-jitter exponential backoff on transient errors. Limits are per
+    process; size them as (project quota / number of workers).
+
+    `clock` and `sleep` are injectable so decisions can be exercised with a
+    fake LLM and a simulated clock.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 60,
+        tokens_per_minute: float = 250_000,
+        max_queue: int = 64,
+        max_wait: float = 20.0,
+        max_retries: int = 3,
+        base_backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+
+        now = clock()
+        self.request_bucket = TokenBucket(requests_per_minute, now)
+        self.token_bucket = TokenBucket(tokens_per_minute, now)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._counters = {
+            "admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0,
+            "rejected_circuit_open": 0, "retries": 0, "upstream_failures": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Build from ADMISSION_* environment variables (limits are per worker)."""
+        return cls(
+            requests_per_minute=float(os.getenv("ADMISSION_RPM", "60")),
+            tokens_per_minute=float(os.getenv("ADMISSION_TPM", "250000")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+            max_wait=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "20")),
+            max_retries=int(os.getenv("ADMISSION_MAX_RETRIES", "3")),
+            base_backoff=float(os.getenv("ADMISSION_BASE_BACKOFF_SECONDS", "0.5")),
+            max_backoff=float(os.getenv("ADMISSION_MAX_BACKOFF_SECONDS", "8")),
+            failure_threshold=int(os.getenv("ADMISSION_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("ADMISSION_BREAKER_RESET_SECONDS", "30")),
+        )
+
+    # --- Public API ---
+
+    def call(self, fn: Callable[[], Any], priority: int, tokens: int) -> Any:
+        for attempt in range(self.max_retries + 1):
+            probe = self._admit(priority, tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self._handle_failure(e, attempt)
+                self.sleep(self._backoff(attempt))
+                continue
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.breaker.release_probe(probe)
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], priority: int, tokens: int) -> Any:
+        for attempt in range(self.max_retries + 1):
+            probe = await self._aadmit(priority, tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                self._handle_failure(e, attempt)
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                # Also reached on cancellation (request timeout), which records no outcome
+                self.breaker.release_probe(probe)
+
+    def stream(self, make_stream: Callable[[], Iterator], priority: int, tokens: int) -> Iterator:
+        """Admit a streaming call; it is retried only if it fails before the first item."""
+        for attempt in range(self.max_retries + 1):
+            probe = self._admit(priority, tokens)
+            started = False
+            try:
+                for item in make_stream():
+                    started = True
+                    yield item
+            except Exception as e:
+                if started:
+                    self._record_error(e)
+                    raise
+                self._handle_failure(e, attempt)
+                self.sleep(self._backoff(attempt))
+                continue
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                # Also reached when the consumer abandons the stream (client disconnect)
+                self.breaker.release_probe(probe)
+
+    async def astream(self, make_stream: Callable[[], AsyncIterator], priority: int, tokens: int) -> AsyncIterator:
+        for attempt in range(self.max_retries + 1):
+            probe = await self._aadmit(priority, tokens)
+            started = False
+            try:
+                async for item in make_stream():
+                    started = True
+                    yield item
+            except Exception as e:
+                if started:
+                    self._record_error(e)
+                    raise
+                self._handle_failure(e, attempt)
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                # Also reached when the consumer abandons the stream (client disconnect)
+                self.breaker.release_probe(probe)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["queued"] = len(self._queue)
+        stats["circuit"] = self.breaker.state
+        return stats
+
+    # --- Queueing ---
+
+    def _enqueue(self, priority: int) -> tuple:
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self._counters["rejected_queue_full"] += 1
+                raise UpstreamUnavailable("Too many requests are waiting for the LLM", self.max_wait)
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            return ticket
+
+    def _try_admit(self, ticket: tuple, tokens: int, deadline: float) -> float:
+        """Returns 0 once admitted, otherwise how long to wait before retrying."""
+        with self._lock:
+            now = self.clock()
+            wait = 0.0
+            if self._queue[0] != ticket:
+                wait = _POLL_SECONDS
+            else:
+                wait = max(
+                    self.request_bucket.wait_time(1, now),
+                    self.token_bucket.wait_time(tokens, now),
+                )
+                if wait == 0.0:
+                    heapq.heappop(self._queue)
+                    self.request_bucket.take(1, now)
+                    self.token_bucket.take(tokens, now)
+                    self._counters["admitted"] += 1
+                    return 0.0
+            if now + wait > deadline:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._counters["rejected_timeout"] += 1
+                raise UpstreamUnavailable("LLM quota exhausted; request not admitted in time", wait)
+            return min(wait, max(_POLL_SECONDS, deadline - now))
+
+    def _check_breaker(self) -> Optional[int]:
+        try:
+            return self.breaker.before_call()
+        except UpstreamUnavailable:
+            with self._lock:
+                self._counters["rejected_circuit_open"] += 1
+            raise
+
+    def _admit(self, priority: int, tokens: int) -> Optional[int]:
+        """Waits until the call may proceed; returns its breaker probe id, if it is the probe."""
+        probe = self._check_breaker()
+        try:
+            ticket = self._enqueue(priority)
+            deadline = self.clock() + self.max_wait
+            while True:
+                wait = self._try_admit(ticket, tokens, deadline)
+                if wait == 0.0:
+                    return probe
+                self.sleep(wait)
+        except BaseException:
+            self.breaker.release_probe(probe)
+            raise
+
+    async def _aadmit(self, priority: int, tokens: int) -> Optional[int]:
+        probe = self._check_breaker()
+        ticket = None
+        try:
+            ticket = self._enqueue(priority)
+            deadline = self.clock() + self.max_wait
+            while True:
+                wait = self._try_admit(ticket, tokens, deadline)
+                if wait == 0.0:
+                    return probe
+                await asyncio.sleep(wait)
+        except BaseException:
+            # Cancelled (request timeout) or rejected: leave the queue and free the probe
+            with self._lock:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+            self.breaker.release_probe(probe)
+            raise
+
+    # --- Failures & Backoff ---
+
+    def _record_error(self, error: Exception) -> None:
+        if is_transient_error(error):
+            with self._lock:
+                self._counters["upstream_failures"] += 1
+            self.breaker.record_failure()
+        else:
+            # The upstream answered (e.g. unparseable output), so it is healthy
+            self.breaker.record_success()
+
+    def _handle_failure(self, error: Exception, attempt: int) -> None:
+        """Re-raise unless the error is transient and another attempt is allowed."""
+        self._record_error(error)
+        if not is_transient_error(error):
+            raise error
+        if self.breaker.state == "open":
+            raise UpstreamUnavailable(
+                "Upstream LLM is temporarily unavailable", self.breaker.retry_after()
+            ) from error
+        if attempt >= self.max_retries:
+            raise UpstreamUnavailable(
+                "Upstream LLM failed after retries", self._backoff_cap(attempt)
+            ) from error
+        with self._lock:
+            self._counters["retries"] += 1
+
+    def _backoff_cap(self, attempt: int) -> float:
+        return min(self.max_backoff, self.base_backoff * (2 ** attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter spreads retries from many workers across the window
+        return self.rng.uniform(0, self._backoff_cap(attempt))
@@ -0,0 +1,283 @@
+"""
+Precomputed know-your-rights answers for the common questions.
+
+Most questions are about a handful of knowledge base topics (security
+deposits, unpaid wages, defective goods, ...). An offline job writes, for
+every knowledge base section and language (English and Hindi), a few typical
+questions and the answer LegalRAG gives to each of them:
+
+    GOOGLE_API_KEY=... python answer_bank.py    # build or refresh kb_answer_bank.bin
+
+Entries whose section, language and prompt version are unchanged are reused,
+so a rebuild only calls Gemini for edited sections (--full regenerates all).
+
+The file is a small JSON header (sections, questions, offsets) followed by
+zlib-compressed answers. Workers memory-map it, so the answers are read from
+the shared page cache only when served. At request time a question is served
+from the bank when:
+  * its best-matching knowledge base section is the entry's section,
+  * its language is the entry's language, and
+  * it is at least ANSWER_BANK_THRESHOLD similar (semantic_cache.embed) to
+    one of the entry's questions and has the same guard terms (negations,
+    time qualifiers and quantities; semantic_cache.guard_terms).
+The answer served is the one generated for that matched question. Anything
+else falls through to the semantic cache and Gemini.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from knowledge_index import KnowledgeIndex
+from response_cache import normalize_text
+from semantic_cache import cosine, detect_language, embed, guard_terms
+
+MAGIC = b"LMABANK2"
+_HEADER_LENGTH = struct.Struct("<I")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kb_answer_bank.bin")
+
+LANGUAGES = {"en": "English", "hi": "Hindi, in Devanagari script"}
+
+
+def section_topic(section) -> str:
+    """Same topic string LegalRAG uses to key know-your-rights answers."""
+    return f"{section.source}: {section.title}"
+
+
+def section_hash(section) -> str:
+    return hashlib.sha256(section.text.encode("utf-8")).hexdigest()
+
+
+# --- File Format ---
+
+def write_bank(path: str, header: dict, entries: List[dict]) -> None:
+    """Write entries (topic, section_hash, language, questions, answers: one per question) atomically."""
+    blob, records = bytearray(), []
+    for entry in entries:
+        record = {k: v for k, v in entry.items() if k != "answers"}
+        record["answers"] = []
+        for answer in entry["answers"]:
+            data = zlib.compress(json.dumps(answer, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+            record["answers"].append([len(blob), len(data)])
+            blob += data
+        records.append(record)
+    header_bytes = json.dumps(dict(header, entries=records), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + _HEADER_LENGTH.pack(len(header_bytes)) + header_bytes)
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+
+def _read_header(data) -> Tuple[dict, int]:
+    """(header, offset of the answer blob) from the start of a bank file."""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not an answer bank file")
+    start = len(MAGIC) + _HEADER_LENGTH.size
+    (length,) = _HEADER_LENGTH.unpack(data[len(MAGIC):start])
+    return json.loads(bytes(data[start:start + length]).decode("utf-8")), start + length
+
+
+def read_entries(path: str) -> Tuple[dict, List[dict]]:
+    """Header and all entries with their answers decoded (for rebuilding)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    header, blob_start = _read_header(data)
+    entries = []
+    for record in header.pop("entries"):
+        entry = dict(record)
+        entry["answers"] = [
+            json.loads(zlib.decompress(data[blob_start + offset:blob_start + offset + length]))
+            for offset, length in record["answers"]
+        ]
+        entries.append(entry)
+    return header, entries
+
+
+# --- Matcher ---
+
+class _BankQuestion(NamedTuple):
+    vector: Dict[str, float]
+    guards: frozenset
+    offset: int
+    length: int
+
+
+class AnswerBank:
+    """Memory-mapped precomputed answers, looked up by (section topic, language) and the most similar question."""
+
+    def __init__(self, path: str, knowledge_index: KnowledgeIndex, threshold: float = 0.8):
+        self.path = path
+        self.threshold = threshold
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header, self._blob_start = _read_header(self._mmap)
+        self.model = header.get("model")
+        self.prompt_version = header.get("prompt_version")
+
+        # Entries for sections that changed (or no longer exist) since the build are skipped
+        current = {section_topic(s): section_hash(s) for s in knowledge_index.sections}
+        self._entries: Dict[Tuple[str, str], List[_BankQuestion]] = {}
+        self.stale_entries = 0
+        for record in header["entries"]:
+            if current.get(record["topic"]) != record["section_hash"]:
+                self.stale_entries += 1
+                continue
+            questions = []
+            for question, (offset, length) in zip(record["questions"], record["answers"]):
+                question = normalize_text(question)
+                vector = embed(question)
+                if vector:
+                    questions.append(_BankQuestion(vector, guard_terms(question), self._blob_start + offset, length))
+            self._entries[(record["topic"], record["language"])] = questions
+
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "hits": 0, "misses": 0}
+
+    @classmethod
+    def from_env(cls, knowledge_index: KnowledgeIndex) -> Optional["AnswerBank"]:
+        """Load ANSWER_BANK_PATH (default kb_answer_bank.bin); None if it hasn't been built."""
+        path = os.getenv("ANSWER_BANK_PATH") or DEFAULT_PATH
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path, knowledge_index, threshold=float(os.getenv("ANSWER_BANK_THRESHOLD", "0.8")))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error in AnswerBank.from_env: {e}")
+            return None
+
+    def match(self, question: str, topic: str) -> Optional[dict]:
+        """
+        The answer generated for the bank question most similar to `question`
+        (whose best section is `topic`), if one is close enough and has the same guard terms.
+        """
+        question = normalize_text(question)
+        best, best_score = None, 0.0
+        candidates = self._entries.get((topic, detect_language(question)), ())
+        if candidates:
+            vector, guards = embed(question), guard_terms(question)
+            for candidate in candidates:
+                if candidate.guards != guards:
+                    continue
+                score = cosine(vector, candidate.vector)
+                if score > best_score:
+                    best, best_score = candidate, score
+        hit = best is not None and best_score >= self.threshold
+        with self._lock:
+            self._counters["lookups"] += 1
+            self._counters["hits" if hit else "misses"] += 1
+        if not hit:
+            return None
+        return json.loads(zlib.decompress(self._mmap[best.offset:best.offset + best.length]))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["entries"] = len(self._entries)
+        stats["questions"] = sum(len(questions) for questions in self._entries.values())
+        stats["stale_entries"] = self.stale_entries
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+# --- Offline Build ---
+
+def _questions_chain(llm):
+    from langchain_core.prompts import ChatPromptTemplate
+    from pydantic.v1 import BaseModel, Field
+
+    class BankQuestions(BaseModel):
+        questions: List[str] = Field(description="Questions this section answers")
+
+    prompt = ChatPromptTemplate.from_template(
+        """
+        Below is a section of a guide to Indian law. Write {count} different questions
+        that an ordinary person might ask and that this section answers. Phrase them
+        the way people type them: short, informal, often about their own situation.
+        Write every question in {language}.
+
+        --- SECTION: {title} ---
+        {text}
+        """
+    )
+    return prompt | llm.with_structured_output(BankQuestions)
+
+
+def build_bank(rag, knowledge_index: KnowledgeIndex, path: str, questions_per_section: int = 6,
+               languages=tuple(LANGUAGES), full: bool = False, max_concurrency: int = 4) -> None:
+    """Generate (or refresh) the answer bank at `path` with LegalRAG `rag` (built without an answer bank)."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from rag_legal import PROMPT_VERSIONS
+
+    header = {"model": rag.model_name, "prompt_version": PROMPT_VERSIONS["get_rights"]}
+    previous = {}
+    if not full and os.path.exists(path):
+        try:
+            old_header, old_entries = read_entries(path)
+        except ValueError:
+            # Older file format; regenerate everything
+            old_header, old_entries = {}, []
+        if old_header.get("prompt_version") == header["prompt_version"]:
+            previous = {(e["topic"], e["language"]): e for e in old_entries}
+
+    chain = _questions_chain(rag.llm)
+
+    def generate(section, language: str) -> Optional[dict]:
+        topic, digest = section_topic(section), section_hash(section)
+        entry = previous.get((topic, language))
+        if entry is not None and entry["section_hash"] == digest:
+            return entry
+        generated = chain.invoke({
+            "count": questions_per_section, "language": LANGUAGES[language],
+            "title": section.title, "text": section.text,
+        })
+        # Keep the questions that would actually be matched against this entry at request time
+        questions = []
+        for question in generated.questions:
+            hits = knowledge_index.search(question, k=1, min_score=rag.kb_min_score)
+            if hits and section_topic(hits[0][0]) == topic and detect_language(question) == language:
+                questions.append(question)
+        if not questions:
+            print(f"Skipped {topic} ({language}): no generated question retrieves this section")
+            return None
+        # One answer per question: a match on any of them serves the answer written for it
+        answers = [rag.get_rights(question).dict() for question in questions]
+        return {"topic": topic, "section_hash": digest, "language": language,
+                "questions": questions, "answers": answers}
+
+    tasks = [(section, language) for section in knowledge_index.sections for language in languages]
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        results = list(pool.map(lambda task: generate(*task), tasks))
+    entries = [entry for entry in results if entry is not None]
+    reused = sum(1 for entry in entries if previous.get((entry["topic"], entry["language"])) is entry)
+    write_bank(path, header, entries)
+    print(f"Answer bank with {len(entries)} entries ({reused} reused, "
+          f"{len(tasks) - len(entries)} skipped) at {path}")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from rag_legal import LegalRAG
+
+    parser = argparse.ArgumentParser(description="Build the precomputed know-your-rights answer bank.")
+    parser.add_argument("--path", default=os.getenv("ANSWER_BANK_PATH") or DEFAULT_PATH)
+    parser.add_argument("--questions", type=int, default=6, help="Questions generated per section and language")
+    parser.add_argument("--languages", nargs="+", default=list(LANGUAGES), choices=list(LANGUAGES))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--full", action="store_true", help="Regenerate every entry")
+    args = parser.parse_args()
+
+    load_dotenv()
+    index = KnowledgeIndex.from_env()
+    handler = LegalRAG(api_key=os.getenv("GOOGLE_API_KEY"), knowledge_index=index)
+    build_bank(handler, index, args.path, args.questions, tuple(args.languages), args.full, args.concurrency)
@@ -1,37 +1,201 @@
 
 import os
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
 # --- Local Imports ---
-from rag_legal import LegalRAG
+from rag_legal import BATCH_OPERATIONS, LegalRAG
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+from document_store import DocumentStore
+from document_ingest import DocumentIngestor, DocumentTooLarge, UnsupportedDocument
+from conversation_store import ConversationStore, new_session_id, valid_session_id
+from single_flight import SingleFlight
+from admission import AdmissionController, UpstreamUnavailable
+from batch_jobs import BatchJobStore, InvalidBatchItem, batch_inputs
+from knowledge_index import KnowledgeIndex
+from answer_bank import AnswerBank
+from metrics import Metrics, set_route, stage
 
 # Load environment variables
 load_dotenv()
 
 # --- App Initialization ---
+ALLOWED_ORIGINS = [
+    "http://localhost:3000",
+    "https://legal-mate-ai.vercel.app",
+    "https://legal-mcci.vercel.app"
+]
+
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {
-    "origins": [
-        "http://localhost:3000",
-        "https://legal-mate-ai.vercel.app",
-        "https://legal-mcci.vercel.app"
-    ]
-}})
+CORS(app, resources={r"/api/*": {"origins": ALLOWED_ORIGINS}})
 
 # --- AI Handler Initialization ---
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Response cache: in-process LRU, plus a SQLite tier shared by all workers
+# when RESPONSE_CACHE_PATH is set (see Dockerfile).
+response_cache = ResponseCache.from_env()
+
+# Per-worker near-duplicate cache for know-your-rights; opt-in with SEMANTIC_CACHE_MAX_ENTRIES
+semantic_cache = SemanticCache.from_env()
+
+# Uploaded documents for the Vakil chatbot, so the client sends them only once
+document_store = DocumentStore.from_env()
+
+# PDF/text uploads extracted page by page into document_store, deduplicated by
+# upload hash and by extracted text
+document_ingestor = DocumentIngestor.from_env(document_store)
+
+# Vakil chat history per session, bounded in prompt tokens and total memory;
+# shared by all workers when CONVERSATION_STORE_PATH is set.
+conversations = ConversationStore.from_env()
+
+# Coalesces identical in-flight LLM calls; across workers too when
+# SINGLE_FLIGHT_LOCK_DIR is set.
+single_flight = SingleFlight.from_env()
+
+# Rate limits, priority queue, retries and circuit breaker around Gemini calls
+admission = AdmissionController.from_env()
+
+# Asynchronous /api/batch jobs; visible to every worker when BATCH_JOB_STORE_PATH is set
+batch_jobs = BatchJobStore.from_env()
+
+# Per-stage latency histograms and token counters, served on /metrics; summed
+# across workers when METRICS_DIR is set.
+metrics = Metrics.from_env()
+app.wsgi_app = metrics.wsgi_middleware(app.wsgi_app)
+
+@app.before_request
+def label_request_metrics():
+    set_route(request.url_rule.rule if request.url_rule else None)
+
+# BM25 over knowledge_base/ sections, used to ground know-your-rights answers;
+# loaded from KB_LEXICAL_INDEX_PATH when that file matches the sources.
+knowledge_index = KnowledgeIndex.from_env()
+
+# Precomputed answers for common know-your-rights questions, memory-mapped from
+# ANSWER_BANK_PATH (built offline with answer_bank.py); None until it is built.
+answer_bank = AnswerBank.from_env(knowledge_index)
+
 try:
     # --- MODIFIED ---
     # We no longer pass the knowledge base path
     # This handler will no longer fail on startup.
-    rag_handler = LegalRAG(api_key=GOOGLE_API_KEY)
+    rag_handler = LegalRAG(api_key=GOOGLE_API_KEY, cache=response_cache, single_flight=single_flight,
+                           admission=admission, knowledge_index=knowledge_index,
+                           semantic_cache=semantic_cache, conversations=conversations,
+                           answer_bank=answer_bank)
 except Exception as e:
     print(f"FATAL: Could not initialize LegalRAG handler: {e}")
     rag_handler = None
 
+# --- Error Helpers ---
+
+UPSTREAM_BUSY_MESSAGE = "The AI service is busy, please retry shortly"
+
+def upstream_unavailable(e: UpstreamUnavailable):
+    """503 with Retry-After while Gemini is out of quota or failing."""
+    response = jsonify({"error": UPSTREAM_BUSY_MESSAGE, "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+# --- Batch Helpers ---
+# Requests with up to BATCH_MAX_ITEMS items are answered inline; larger ones
+# (up to BATCH_JOB_MAX_ITEMS) must use "mode": "async" and poll the job.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_JOB_MAX_ITEMS = int(os.getenv("BATCH_JOB_MAX_ITEMS", "1000"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+def parse_batch_request(data):
+    """((operation, inputs, async mode), None) for a valid /api/batch body, else (None, (error, status))."""
+    if not rag_handler or not data or not isinstance(data, dict):
+        return None, ({"error": "Invalid request or RAG system not initialized"}, 400)
+    # A non-string operation (e.g. a list) is not hashable
+    if not isinstance(data.get('operation'), str) or data['operation'] not in BATCH_OPERATIONS:
+        return None, ({"error": f"operation must be one of {', '.join(BATCH_OPERATIONS)}"}, 400)
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return None, ({"error": "No items provided"}, 400)
+    run_async = data.get('mode') == 'async'
+    limit = BATCH_JOB_MAX_ITEMS if run_async else BATCH_MAX_ITEMS
+    if len(items) > limit:
+        hint = "" if run_async else '; use "mode": "async" for larger batches'
+        return None, ({"error": f"At most {limit} items per batch{hint}"}, 413)
+    _, fields = BATCH_OPERATIONS[data['operation']]
+    return (data['operation'], batch_inputs(fields, items), run_async), None
+
+def valid_batch_inputs(inputs: list) -> list:
+    return [item for item in inputs if not isinstance(item, InvalidBatchItem)]
+
+def batch_item_json(index: int, outcome) -> dict:
+    """One batch result: the endpoint's usual response body, or an error for that item."""
+    if isinstance(outcome, UpstreamUnavailable):
+        return {"index": index, "error": UPSTREAM_BUSY_MESSAGE, "retry_after": outcome.retry_after}
+    if isinstance(outcome, InvalidBatchItem):
+        return {"index": index, "error": str(outcome)}
+    if isinstance(outcome, Exception):
+        print(f"Error in batch item {index}: {outcome}")
+        return {"index": index, "error": "Failed to process item"}
+    return {"index": index, "result": outcome.dict() if hasattr(outcome, "dict") else {"answer": outcome}}
+
+def batch_response(inputs: list, outcomes: list) -> dict:
+    """Body for an inline batch; `outcomes` are for the valid inputs, in order."""
+    outcomes = iter(outcomes)
+    results = [
+        batch_item_json(i, item if isinstance(item, InvalidBatchItem) else next(outcomes))
+        for i, item in enumerate(inputs)
+    ]
+    failed = sum(1 for r in results if "error" in r)
+    return {"results": results, "succeeded": len(results) - failed, "failed": failed}
+
+def start_batch_job(operation: str, inputs: list):
+    """(body, 202) with the job's polling URLs, or a 503 when this worker is at its job limit."""
+    try:
+        job_id = batch_jobs.submit(
+            operation, inputs,
+            lambda valid: rag_handler.batch_as_completed(operation, valid, BATCH_MAX_CONCURRENCY),
+            batch_item_json,
+        )
+    except RuntimeError as e:
+        return {"error": str(e)}, 503
+    return {
+        "job_id": job_id,
+        "status_url": f"/api/batch/{job_id}",
+        "results_url": f"/api/batch/{job_id}/results",
+    }, 202
+
+# --- Streaming Helpers ---
+
+def wants_stream(data) -> bool:
+    """Clients opt into Server-Sent Events with "stream": true or an SSE Accept header."""
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def sse_response(events, error_message: str, log_name: str) -> Response:
+    """Wrap an iterator of (event, payload) pairs as an SSE response ending in 'done' or 'error'."""
+    def generate():
+        try:
+            for event, payload in events:
+                yield sse_event(event, payload)
+            yield sse_event("done", {})
+        except UpstreamUnavailable as e:
+            # Headers are already sent, so failures are reported in-band
+            yield sse_event("error", {"error": UPSTREAM_BUSY_MESSAGE, "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error in {log_name}: {e}")
+            yield sse_event("error", {"error": error_message})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- API Endpoints ---
 
 @app.route('/api/know-your-rights', methods=['POST'])
@@ -41,7 +205,10 @@ def know_your_rights():
         return jsonify({"error": "Invalid request or RAG system not initialized"}), 400
     try:
         result = rag_handler.get_rights(data['query'])
-        return jsonify(result.dict())
+        with stage("jsonify"):
+            return jsonify(result.dict())
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
     except Exception as e:
         print(f"Error in know_your_rights: {e}")
         return jsonify({"error": "Failed to process query"}), 500
@@ -49,11 +216,18 @@ def know_your_rights():
 @app.route('/api/simplify', methods=['POST'])
 def simplify_document():
     data = request.get_json()
-    if not rag_handler or not data or 'text' not in data:
+    if not rag_handler or not data or not isinstance(data, dict):
         return jsonify({"error": "Invalid request or RAG system not initialized"}), 400
+    text, error = request_document_text(data)
+    if error:
+        body, status = error
+        return jsonify(body), status
     try:
-        result = rag_handler.simplify_document(data['text'])
-        return jsonify(result.dict())
+        result = rag_handler.simplify_document(text)
+        with stage("jsonify"):
+            return jsonify(result.dict())
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
     except Exception as e:
         print(f"Error in simplify_document: {e}")
         return jsonify({"error": "Failed to simplify document"}), 500
@@ -63,33 +237,229 @@ def advise_case():
     data = request.get_json()
     if not rag_handler or not data or 'case_text' not in data:
         return jsonify({"error": "Invalid request or RAG system not initialized"}), 400
+    if wants_stream(data):
+        points = rag_handler.stream_advice(data['case_text'])
+        return sse_response(
+            (("point", point.dict()) for point in points), "Failed to analyze case", "advise_case"
+        )
     try:
         result = rag_handler.advise_on_case(data['case_text'])
-        return jsonify(result.dict())
+        with stage("jsonify"):
+            return jsonify(result.dict())
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
     except Exception as e:
         print(f"Error in advise_case: {e}")
         return jsonify({"error": "Failed to analyze case"}), 500
 
-# In app.py
+@app.route("/api/identify", methods=["POST"])
+def identify_document():
+    """A short name and one-line summary of a document, on the light model tier."""
+    data = request.get_json()
+    if not rag_handler or not data or not isinstance(data, dict):
+        return jsonify({"error": "No document text provided"}), 400
+    text, error = request_document_text(data)
+    if error:
+        body, status = error
+        return jsonify(body), status
+    try:
+        result = rag_handler.identify_document(text)
+        with stage("jsonify"):
+            return jsonify(result.dict())
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
+    except Exception as e:
+        print(f"Error in identify_document: {e}")
+        return jsonify({"error": "Failed to identify document"}), 500
+
+@app.route("/api/documents", methods=["POST"])
+def upload_document():
+    data = request.get_json()
+    if not data or not isinstance(data.get('text'), str) or not data['text'].strip():
+        return jsonify({"error": "No document text provided"}), 400
+    try:
+        document_id = document_store.put(data['text'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413
+    return jsonify({"document_id": document_id, "characters": len(data['text'])})
+
+def ingest_upload(upload, include_text: bool):
+    """(body, status) for ingesting an uploaded file; shared with asgi.py."""
+    if upload is None or not upload.filename:
+        return {"error": "No file uploaded"}, 400
+    try:
+        result = document_ingestor.ingest(upload.stream, upload.mimetype, upload.filename)
+    except DocumentTooLarge as e:
+        return {"error": str(e)}, 413
+    except UnsupportedDocument as e:
+        return {"error": str(e)}, 415
+    except Exception as e:
+        print(f"Error in ingest_document: {e}")
+        return {"error": "Failed to extract text from the document"}, 500
+    body = result._asdict()
+    if include_text:
+        document = document_store.get(result.document_id)
+        body["text"] = document.text if document else None
+    return body, 200
+
+def upload_too_large(content_length) -> bool:
+    # Multipart framing adds a little on top of the file itself
+    return content_length is not None and content_length > document_ingestor.max_upload_bytes + 64 * 1024
+
+@app.route("/api/documents/ingest", methods=["POST"])
+def ingest_document():
+    """Multipart PDF or text upload (field "file"); returns a document_id for the other endpoints."""
+    if upload_too_large(request.content_length):
+        return jsonify({"error": f"Upload exceeds {document_ingestor.max_upload_bytes} bytes"}), 413
+    # Files are spooled to disk by the form parser, not read into memory
+    upload = request.files.get("file") or request.files.get("pdf")
+    body, status = ingest_upload(upload, request.form.get("include_text") in ("1", "true"))
+    return jsonify(body), status
+
+def vakil_document_index(document):
+    """Chunk and index a stored document once, not on every question."""
+    if document is None or not rag_handler.uses_retrieval(document.text):
+        return None
+    document_index = document_store.get_derived(document.document_id, "vakil_index")
+    if document_index is None:
+        document_index = rag_handler.build_document_index(document.text)
+        document_store.put_derived(
+            document.document_id, "vakil_index", document_index, document_index.size_bytes()
+        )
+    return document_index
+
+def request_document_text(data, field: str = 'text'):
+    """
+    (text, None) from the request's document_id (see /api/documents and
+    /api/documents/ingest) or its inline `field`; (None, (body, status)) otherwise.
+    `data` must already be checked to be a JSON object.
+    """
+    if 'document_id' in data:
+        if not isinstance(data['document_id'], str):
+            return None, ({"error": "Invalid document_id"}, 400)
+        document = document_store.get(data['document_id'])
+        if document is None:
+            return None, ({"error": "Unknown or expired document_id"}, 404)
+        return document.text, None
+    text = data.get(field)
+    if not isinstance(text, str) or not text.strip():
+        return None, ({"error": "No document text provided"}, 400)
+    return text, None
+
+def vakil_session_id(data) -> str:
+    """The chat session named in the request, or a new one; None if the id is malformed."""
+    session_id = data.get('session_id') or new_session_id()
+    return session_id if valid_session_id(session_id) else None
 
 @app.route("/api/ask-vakil", methods=["POST"])
 def ask_vakil():
     data = request.get_json()
-    # The frontend must send BOTH the original text and the new question
-    if not rag_handler or not data or 'document_text' not in data or 'question' not in data:
+    # The frontend sends the question plus either a document_id from
+    # /api/documents or (for older clients) the full document_text
+    if not rag_handler or not data or not isinstance(data, dict) or 'question' not in data:
         return jsonify({"error": "Invalid request"}), 400
+    document = None
+    if 'document_id' in data:
+        if not isinstance(data['document_id'], str):
+            return jsonify({"error": "Invalid document_id"}), 400
+        document = document_store.get(data['document_id'])
+        if document is None:
+            # Expired or evicted: the client should upload the document again
+            return jsonify({"error": "Unknown or expired document_id"}), 404
+        document_text = document.text
+    elif 'document_text' in data:
+        document_text = data['document_text']
+    else:
+        return jsonify({"error": "Invalid request"}), 400
+    # Follow-up questions send back the session_id returned with the first answer
+    session_id = vakil_session_id(data)
+    if session_id is None:
+        return jsonify({"error": "Invalid session_id"}), 400
+    if wants_stream(data):
+        def tokens():
+            yield "session", {"session_id": session_id}
+            answer = rag_handler.stream_question_about_document(
+                document_text, data['question'], document_index=vakil_document_index(document),
+                session_id=session_id,
+            )
+            for text in answer:
+                yield "token", {"text": text}
+        return sse_response(tokens(), "Failed to get answer", "ask_vakil")
     try:
         # We call a new method in our AI handler
         result = rag_handler.ask_question_about_document(
-            data['document_text'], 
-            data['question']
+            document_text, 
+            data['question'],
+            document_index=vakil_document_index(document),
+            session_id=session_id,
         )
         # The 'result' would just be a simple JSON with the answer
-        return jsonify({"answer": result})
+        with stage("jsonify"):
+            return jsonify({"answer": result, "session_id": session_id})
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
     except Exception as e:
         print(f"Error in ask_vakil: {e}")
         return jsonify({"error": "Failed to get answer"}), 500
 
+@app.route("/api/batch", methods=["POST"])
+def batch_items():
+    parsed, error = parse_batch_request(request.get_json())
+    if error:
+        body, status = error
+        return jsonify(body), status
+    operation, inputs, run_async = parsed
+    if run_async:
+        body, status = start_batch_job(operation, inputs)
+        return jsonify(body), status
+    outcomes = rag_handler.batch(operation, valid_batch_inputs(inputs), BATCH_MAX_CONCURRENCY)
+    with stage("jsonify"):
+        return jsonify(batch_response(inputs, outcomes))
+
+@app.route("/api/batch/<job_id>", methods=["GET"])
+def batch_status(job_id):
+    status = batch_jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown or expired job_id"}), 404
+    return jsonify(status)
+
+@app.route("/api/batch/<job_id>/results", methods=["GET"])
+def batch_results(job_id):
+    """NDJSON, one line per item in order; streams while the job is still running."""
+    if batch_jobs.status(job_id) is None:
+        return jsonify({"error": "Unknown or expired job_id"}), 404
+    return Response(
+        stream_with_context(batch_jobs.stream_results(job_id)),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "responses": response_cache.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache else None,
+        "answer_bank": rag_handler.answer_bank.stats() if rag_handler and rag_handler.answer_bank else None,
+        "documents": document_store.stats(),
+        "ingest": document_ingestor.stats(),
+        "conversations": conversations.stats(),
+        "single_flight": single_flight.stats(),
+        "admission": admission.stats(),
+        "batch_jobs": batch_jobs.stats(),
+        "routing": rag_handler.router.config() if rag_handler else None,
+    })
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))  # Render provides $PORT
+    if rag_handler:
+        # Under gunicorn this happens in post_fork (see gunicorn.conf.py)
+        try:
+            rag_handler.warm_up()
+        except Exception as e:
+            # Still serve; chains are built on first use instead
+            print(f"Error in warm_up: {e}")
     app.run(host='0.0.0.0', port=port, debug=True)
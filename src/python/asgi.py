@@ -0,0 +1,372 @@
+"""
+Async serving path for the Python API.
+
+The sync Flask app in app.py blocks a whole worker for every Gemini call.
+This Quart app serves the same endpoints but awaits the LLM (ainvoke/astream),
+so one worker can hold many in-flight requests:
+
+    hypercorn --workers 4 --bind 0.0.0.0:$PORT asgi:app
+
+State (LegalRAG, response cache, document store) is shared with app.py, which
+remains the entry point for local development (python app.py).
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+
+# --- Local Imports ---
+from admission import UpstreamUnavailable
+from metrics import set_route, stage
+# Importing app reuses its handler, caches and stores instead of building new ones
+from app import (
+    ALLOWED_ORIGINS,
+    BATCH_MAX_CONCURRENCY,
+    UPSTREAM_BUSY_MESSAGE,
+    admission,
+    batch_jobs,
+    batch_response,
+    conversations,
+    document_ingestor,
+    document_store,
+    metrics,
+    rag_handler,
+    response_cache,
+    semantic_cache,
+    single_flight,
+    parse_batch_request,
+    ingest_upload,
+    request_document_text,
+    sse_event,
+    start_batch_job,
+    upload_too_large,
+    valid_batch_inputs,
+    vakil_document_index,
+    vakil_session_id,
+)
+
+# --- Concurrency Limits ---
+# Each endpoint gets its own limit and timeout, e.g. ASYNC_LIMIT_SIMPLIFY=10,
+# ASYNC_TIMEOUT_SIMPLIFY=120. Requests wait up to ASYNC_QUEUE_TIMEOUT_SECONDS
+# for a free slot before getting a 503.
+DEFAULT_LIMIT = int(os.getenv("ASYNC_MAX_CONCURRENCY", "100"))
+DEFAULT_TIMEOUT = float(os.getenv("ASYNC_REQUEST_TIMEOUT_SECONDS", "60"))
+QUEUE_TIMEOUT = float(os.getenv("ASYNC_QUEUE_TIMEOUT_SECONDS", "10"))
+
+
+class ServerBusy(Exception):
+    """No concurrency slot became free within the queue timeout."""
+
+
+class EndpointLimiter:
+    def __init__(self, name: str):
+        env_name = name.upper().replace("-", "_")
+        self.limit = int(os.getenv(f"ASYNC_LIMIT_{env_name}", str(DEFAULT_LIMIT)))
+        self.timeout = float(os.getenv(f"ASYNC_TIMEOUT_{env_name}", str(DEFAULT_TIMEOUT)))
+        # Created lazily so it binds to the worker's event loop
+        self._semaphore = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ServerBusy()
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def run(self, make_awaitable):
+        """Run make_awaitable() inside a slot, bounded by this endpoint's timeout."""
+        async with self.slot():
+            return await asyncio.wait_for(make_awaitable(), timeout=self.timeout)
+
+    async def stream(self, make_iterator):
+        """Iterate make_iterator() inside a slot; the whole stream is bounded by this endpoint's timeout."""
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            iterator = make_iterator().__aiter__()
+            try:
+                while True:
+                    try:
+                        remaining = max(deadline - loop.time(), 0)
+                        item = await asyncio.wait_for(iterator.__anext__(), timeout=remaining)
+                    except StopAsyncIteration:
+                        return
+                    yield item
+            finally:
+                await iterator.aclose()
+
+
+LIMITERS = {
+    name: EndpointLimiter(name)
+    for name in ("know-your-rights", "simplify", "advise", "identify", "ask-vakil", "batch", "ingest")
+}
+
+# --- App Initialization ---
+app = cors(Quart(__name__), allow_origin=ALLOWED_ORIGINS)
+# Quart refuses bodies over 16MB by default; uploads may be up to INGEST_MAX_UPLOAD_BYTES
+app.config["MAX_CONTENT_LENGTH"] = max(16 * 1024 * 1024, document_ingestor.max_upload_bytes + 64 * 1024)
+app.asgi_app = metrics.asgi_middleware(app.asgi_app)
+
+
+@app.before_serving
+async def warm_up():
+    """Compile the chains before this worker accepts requests (hypercorn waits for it)."""
+    if rag_handler is None:
+        return
+    try:
+        seconds = await asyncio.to_thread(rag_handler.warm_up)
+        print(f"Worker {os.getpid()} warmed up in {seconds:.2f}s")
+    except Exception as e:
+        # Still serve; chains are built on first use instead
+        print(f"Error in warm_up: {e}")
+
+
+@app.before_request
+async def label_request_metrics():
+    set_route(request.url_rule.rule if request.url_rule else None)
+
+
+async def run_limited(endpoint: str, make_awaitable, to_json, error_message: str, log_name: str):
+    """Shared request path: limit, timeout and map failures to HTTP errors."""
+    try:
+        result = await LIMITERS[endpoint].run(make_awaitable)
+        with stage("jsonify"):
+            return jsonify(to_json(result))
+    except ServerBusy:
+        return jsonify({"error": "Server busy, please retry"}), 503
+    except UpstreamUnavailable as e:
+        response = jsonify({"error": UPSTREAM_BUSY_MESSAGE, "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 503
+    except asyncio.TimeoutError:
+        print(f"Timeout in {log_name}")
+        return jsonify({"error": "Request timed out"}), 504
+    except Exception as e:
+        print(f"Error in {log_name}: {e}")
+        return jsonify({"error": error_message}), 500
+
+
+def sse_response(endpoint: str, make_events, error_message: str, log_name: str) -> Response:
+    """Async SSE response; the endpoint slot is held until the stream finishes or times out."""
+    async def generate():
+        try:
+            async for event, payload in LIMITERS[endpoint].stream(make_events):
+                yield sse_event(event, payload).encode("utf-8")
+            yield sse_event("done", {}).encode("utf-8")
+        except ServerBusy:
+            yield sse_event("error", {"error": "Server busy, please retry"}).encode("utf-8")
+        except asyncio.TimeoutError:
+            print(f"Timeout in {log_name}")
+            yield sse_event("error", {"error": "Request timed out"}).encode("utf-8")
+        except UpstreamUnavailable as e:
+            payload = {"error": UPSTREAM_BUSY_MESSAGE, "retry_after": e.retry_after}
+            yield sse_event("error", payload).encode("utf-8")
+        except Exception as e:
+            print(f"Error in {log_name}: {e}")
+            yield sse_event("error", {"error": error_message}).encode("utf-8")
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def wants_stream(data) -> bool:
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+# --- API Endpoints ---
+
+@app.route('/api/know-your-rights', methods=['POST'])
+async def know_your_rights():
+    data = await request.get_json()
+    if not rag_handler or not data or 'query' not in data:
+        return jsonify({"error": "Invalid request or RAG system not initialized"}), 400
+    return await run_limited(
+        "know-your-rights", lambda: rag_handler.aget_rights(data['query']),
+        lambda result: result.dict(), "Failed to process query", "know_your_rights"
+    )
+
+@app.route('/api/simplify', methods=['POST'])
+async def simplify_document():
+    data = await request.get_json()
+    if not rag_handler or not data or not isinstance(data, dict):
+        return jsonify({"error": "Invalid request or RAG system not initialized"}), 400
+    text, error = await asyncio.to_thread(request_document_text, data)
+    if error:
+        body, status = error
+        return jsonify(body), status
+    return await run_limited(
+        "simplify", lambda: rag_handler.asimplify_document(text),
+        lambda result: result.dict(), "Failed to simplify document", "simplify_document"
+    )
+
+@app.route("/api/advise", methods=["POST"])
+async def advise_case():
+    data = await request.get_json()
+    if not rag_handler or not data or 'case_text' not in data:
+        return jsonify({"error": "Invalid request or RAG system not initialized"}), 400
+    if wants_stream(data):
+        async def points():
+            async for point in rag_handler.astream_advice(data['case_text']):
+                yield "point", point.dict()
+        return sse_response("advise", points, "Failed to analyze case", "advise_case")
+    return await run_limited(
+        "advise", lambda: rag_handler.aadvise_on_case(data['case_text']),
+        lambda result: result.dict(), "Failed to analyze case", "advise_case"
+    )
+
+@app.route("/api/identify", methods=["POST"])
+async def identify_document():
+    data = await request.get_json()
+    if not rag_handler or not data or not isinstance(data, dict):
+        return jsonify({"error": "No document text provided"}), 400
+    text, error = await asyncio.to_thread(request_document_text, data)
+    if error:
+        body, status = error
+        return jsonify(body), status
+    return await run_limited(
+        "identify", lambda: rag_handler.aidentify_document(text),
+        lambda result: result.dict(), "Failed to identify document", "identify_document"
+    )
+
+@app.route("/api/documents", methods=["POST"])
+async def upload_document():
+    data = await request.get_json()
+    if not data or not isinstance(data.get('text'), str) or not data['text'].strip():
+        return jsonify({"error": "No document text provided"}), 400
+    try:
+        document_id = await asyncio.to_thread(document_store.put, data['text'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413
+    return jsonify({"document_id": document_id, "characters": len(data['text'])})
+
+@app.route("/api/documents/ingest", methods=["POST"])
+async def ingest_document():
+    if upload_too_large(request.content_length):
+        return jsonify({"error": f"Upload exceeds {document_ingestor.max_upload_bytes} bytes"}), 413
+    files, form = await request.files, await request.form
+    upload = files.get("file") or files.get("pdf")
+    include_text = form.get("include_text") in ("1", "true")
+    try:
+        # PDF parsing is CPU-bound, so keep it off the event loop
+        body, status = await LIMITERS["ingest"].run(
+            lambda: asyncio.to_thread(ingest_upload, upload, include_text)
+        )
+    except ServerBusy:
+        return jsonify({"error": "Server busy, please retry"}), 503
+    except asyncio.TimeoutError:
+        print("Timeout in ingest_document")
+        return jsonify({"error": "Request timed out"}), 504
+    return jsonify(body), status
+
+@app.route("/api/ask-vakil", methods=["POST"])
+async def ask_vakil():
+    data = await request.get_json()
+    if not rag_handler or not data or not isinstance(data, dict) or 'question' not in data:
+        return jsonify({"error": "Invalid request"}), 400
+    document = None
+    if 'document_id' in data:
+        if not isinstance(data['document_id'], str):
+            return jsonify({"error": "Invalid document_id"}), 400
+        # SQLite reads and BM25 indexing block, so they run off the event loop
+        document = await asyncio.to_thread(document_store.get, data['document_id'])
+        if document is None:
+            return jsonify({"error": "Unknown or expired document_id"}), 404
+        document_text = document.text
+    elif 'document_text' in data:
+        document_text = data['document_text']
+    else:
+        return jsonify({"error": "Invalid request"}), 400
+    session_id = vakil_session_id(data)
+    if session_id is None:
+        return jsonify({"error": "Invalid session_id"}), 400
+
+    if wants_stream(data):
+        async def tokens():
+            yield "session", {"session_id": session_id}
+            document_index = await asyncio.to_thread(vakil_document_index, document)
+            answer = rag_handler.astream_question_about_document(
+                document_text, data['question'], document_index=document_index,
+                session_id=session_id,
+            )
+            async for text in answer:
+                yield "token", {"text": text}
+        return sse_response("ask-vakil", tokens, "Failed to get answer", "ask_vakil")
+
+    async def answer():
+        document_index = await asyncio.to_thread(vakil_document_index, document)
+        return await rag_handler.aask_question_about_document(
+            document_text, data['question'], document_index=document_index,
+            session_id=session_id,
+        )
+    return await run_limited(
+        "ask-vakil", answer,
+        lambda result: {"answer": result, "session_id": session_id}, "Failed to get answer", "ask_vakil"
+    )
+
+@app.route("/api/batch", methods=["POST"])
+async def batch_items():
+    parsed, error = parse_batch_request(await request.get_json())
+    if error:
+        body, status = error
+        return jsonify(body), status
+    operation, inputs, run_async = parsed
+    if run_async:
+        # Writes the job to SQLite
+        body, status = await asyncio.to_thread(start_batch_job, operation, inputs)
+        return jsonify(body), status
+    return await run_limited(
+        "batch",
+        lambda: rag_handler.abatch(operation, valid_batch_inputs(inputs), BATCH_MAX_CONCURRENCY),
+        lambda outcomes: batch_response(inputs, outcomes), "Failed to process batch", "batch_items"
+    )
+
+@app.route("/api/batch/<job_id>", methods=["GET"])
+async def batch_status(job_id):
+    status = await asyncio.to_thread(batch_jobs.status, job_id)
+    if status is None:
+        return jsonify({"error": "Unknown or expired job_id"}), 404
+    return jsonify(status)
+
+@app.route("/api/batch/<job_id>/results", methods=["GET"])
+async def batch_results(job_id):
+    if await asyncio.to_thread(batch_jobs.status, job_id) is None:
+        return jsonify({"error": "Unknown or expired job_id"}), 404
+
+    async def lines():
+        async for line in batch_jobs.astream_results(job_id):
+            yield line.encode("utf-8")
+
+    return Response(
+        lines(),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/api/cache/stats", methods=["GET"])
+async def cache_stats():
+    return jsonify({
+        "responses": response_cache.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache else None,
+        "answer_bank": rag_handler.answer_bank.stats() if rag_handler and rag_handler.answer_bank else None,
+        "documents": document_store.stats(),
+        "ingest": document_ingestor.stats(),
+        "conversations": conversations.stats(),
+        "single_flight": single_flight.stats(),
+        "admission": admission.stats(),
+        "batch_jobs": batch_jobs.stats(),
+        "routing": rag_handler.router.config() if rag_handler else None,
+    })
+
+@app.route("/metrics", methods=["GET"])
+async def prometheus_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence
+
+
+# --- Request Parsing ---
+
+class InvalidBatchItem(ValueError):
+    """A batch item without the fields its operation needs; reported in that item's slot."""
+
+
+def batch_inputs(fields: Sequence[str], items: list) -> List[object]:
+    """
+    Argument tuples for each batch item, or an InvalidBatchItem in the item's slot.
+
+    Items are objects with the same fields as the single-item endpoint; for
+    one-field operations a plain string is accepted too.
+    """
+    inputs = []
+    for item in items:
+        if isinstance(item, str) and len(fields) == 1:
+            item = {fields[0]: item}
+        if not isinstance(item, dict):
+            inputs.append(InvalidBatchItem(f"Item must be an object with {', '.join(fields)}"))
+        elif not all(isinstance(item.get(f), str) and item[f].strip() for f in fields):
+            inputs.append(InvalidBatchItem(f"Item is missing {', '.join(fields)}"))
+        else:
+            inputs.append(tuple(item[f] for f in fields))
+    return inputs
+
+
+# --- Job Store ---
+
+class BatchJobStore:
+    """
+    Status and per-item results of asynchronous batch jobs, in SQLite.
+
+    With disk_path set, every worker pointing at the same file sees every job,
+    so progress can be polled through any of them while the worker that
+    accepted the job runs it. Without it, jobs live in a per-process
+    in-memory database.
+
+    The running worker records its pid and refreshes a heartbeat with every
+    result (and periodically in between). A running job whose heartbeat is
+    older than heartbeat_timeout belongs to a worker that died (restart, OOM,
+    max_requests), so it is reported as failed and its result streams end.
+    """
+
+    def __init__(
+        self,
+        disk_path: Optional[str] = None,
+        ttl_seconds: float = 24 * 3600,
+        max_running: int = 4,
+        heartbeat_timeout: float = 120,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_running = max_running
+        self.heartbeat_timeout = heartbeat_timeout
+        self._running = 0
+        self._lock = threading.Lock()
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._database, self._uri = disk_path, False
+            self._db_lock = nullcontext()
+        else:
+            # A shared-cache memory database lives as long as one connection is open
+            self._database, self._uri = f"file:batch-jobs-{uuid.uuid4().hex}?mode=memory&cache=shared", True
+            self._keeper = sqlite3.connect(self._database, uri=True, check_same_thread=False)
+            # Shared-cache tables are locked without honouring the busy timeout, so take turns
+            self._db_lock = threading.Lock()
+        self._init_db()
+
+    @classmethod
+    def from_env(cls) -> "BatchJobStore":
+        """Build a store from BATCH_JOB_* environment variables."""
+        return cls(
+            disk_path=os.getenv("BATCH_JOB_STORE_PATH") or None,
+            ttl_seconds=float(os.getenv("BATCH_JOB_TTL_SECONDS", str(24 * 3600))),
+            max_running=int(os.getenv("BATCH_JOB_MAX_RUNNING", "4")),
+            heartbeat_timeout=float(os.getenv("BATCH_JOB_HEARTBEAT_TIMEOUT_SECONDS", "120")),
+        )
+
+    # --- Public API ---
+
+    def submit(self, operation: str, inputs: list, run: Callable[[list], Iterator[tuple]],
+               to_json: Callable[[int, object], dict]) -> str:
+        """
+        Start a job in a background thread and return its id.
+
+        `run(runnable_inputs)` yields (position, outcome) as items finish and
+        `to_json(index, outcome)` turns each outcome into its result line.
+        Items that failed validation are recorded straight away. Raises
+        RuntimeError when this worker is already running max_running jobs.
+        """
+        with self._lock:
+            if self._running >= self.max_running:
+                raise RuntimeError("Too many batch jobs running")
+            self._running += 1
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM batch_results WHERE job_id IN "
+                             "(SELECT job_id FROM batch_jobs WHERE expires_at <= ?)", (now,))
+                conn.execute("DELETE FROM batch_jobs WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "INSERT INTO batch_jobs (job_id, operation, status, total, created_at, updated_at, expires_at, "
+                    "owner_pid, heartbeat_at) VALUES (?, ?, 'running', ?, ?, ?, ?, ?, ?)",
+                    (job_id, operation, len(inputs), now, now, now + self.ttl_seconds, os.getpid(), now),
+                )
+        except sqlite3.Error:
+            with self._lock:
+                self._running -= 1
+            raise
+
+        threading.Thread(
+            target=self._run, args=(job_id, inputs, run, to_json), name=f"batch-{job_id[:8]}", daemon=True
+        ).start()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT operation, status, total, completed, failed, created_at, updated_at, owner_pid, "
+                "COALESCE(heartbeat_at, updated_at) FROM batch_jobs WHERE job_id = ? AND expires_at > ?",
+                (job_id, now)
+            ).fetchone()
+            if row is None:
+                return None
+            operation, status, total, completed, failed, created_at, updated_at, owner_pid, heartbeat_at = row
+            if status == "running" and heartbeat_at < now - self.heartbeat_timeout:
+                # The worker running it is gone; fail the job so streams end and clients can resubmit
+                conn.execute(
+                    "UPDATE batch_jobs SET status = 'failed', updated_at = ? WHERE job_id = ? AND status = 'running'",
+                    (now, job_id),
+                )
+                print(f"Error in batch job {job_id}: worker {owner_pid} stopped responding")
+                status, updated_at = "failed", now
+        return {
+            "job_id": job_id,
+            "operation": operation,
+            "status": status,
+            "total": total,
+            "completed": completed,
+            "failed": failed,
+            "progress": completed / total if total else 1.0,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def results_after(self, job_id: str, index: int) -> List[str]:
+        """Result lines (JSON) for the finished items from `index` on, up to the first unfinished one."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT item_index, body FROM batch_results WHERE job_id = ? AND item_index >= ? "
+                "ORDER BY item_index", (job_id, index)
+            ).fetchall()
+        lines = []
+        for item_index, body in rows:
+            if item_index != index + len(lines):
+                break
+            lines.append(body)
+        return lines
+
+    def stream_results(self, job_id: str, poll_seconds: float = 0.25) -> Iterator[str]:
+        """NDJSON lines in item order, waiting for items that are still running."""
+        index = 0
+        while True:
+            lines, finished = self._poll(job_id, index)
+            for line in lines:
+                yield line
+            index += len(lines)
+            if finished:
+                return
+            if not lines:
+                time.sleep(poll_seconds)
+
+    async def astream_results(self, job_id: str, poll_seconds: float = 0.25) -> AsyncIterator[str]:
+        """Async counterpart of stream_results, for the ASGI app."""
+        index = 0
+        while True:
+            lines, finished = await asyncio.to_thread(self._poll, job_id, index)
+            for line in lines:
+                yield line
+            index += len(lines)
+            if finished:
+                return
+            if not lines:
+                await asyncio.sleep(poll_seconds)
+
+    def _poll(self, job_id: str, index: int) -> tuple:
+        # Status is read first: once a job is finished, all its results are already stored
+        status = self.status(job_id)
+        lines = [line + "\n" for line in self.results_after(job_id, index)]
+        finished = status is None or status["status"] != "running" or index + len(lines) >= status["total"]
+        return lines, finished
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM batch_jobs GROUP BY status").fetchall())
+        with self._lock:
+            counts["running_here"] = self._running
+        return counts
+
+    # --- Job Runner ---
+
+    def _run(self, job_id: str, inputs: list, run, to_json) -> None:
+        # Items can take a while (LLM retries), so beat in between results too
+        stopped = threading.Event()
+        threading.Thread(
+            target=self._keep_alive, args=(job_id, stopped), name=f"batch-{job_id[:8]}-heartbeat", daemon=True
+        ).start()
+        try:
+            positions = [i for i, item in enumerate(inputs) if not isinstance(item, Exception)]
+            for i, item in enumerate(inputs):
+                if isinstance(item, Exception):
+                    self._record(job_id, i, to_json(i, item), failed=True)
+            for position, outcome in run([inputs[i] for i in positions]):
+                index = positions[position]
+                self._record(job_id, index, to_json(index, outcome), failed=isinstance(outcome, Exception))
+            self._finish(job_id, "done")
+        except Exception as e:
+            print(f"Error in batch job {job_id}: {e}")
+            self._finish(job_id, "failed")
+        finally:
+            stopped.set()
+            with self._lock:
+                self._running -= 1
+
+    def _keep_alive(self, job_id: str, stopped: threading.Event) -> None:
+        while not stopped.wait(self.heartbeat_timeout / 4):
+            try:
+                with self._connect() as conn:
+                    conn.execute("UPDATE batch_jobs SET heartbeat_at = ? WHERE job_id = ?", (time.time(), job_id))
+            except sqlite3.Error as e:
+                print(f"Batch job store error: {e}")
+
+    def _record(self, job_id: str, index: int, result: dict, failed: bool) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO batch_results (job_id, item_index, body) VALUES (?, ?, ?)",
+                (job_id, index, json.dumps(result, ensure_ascii=False)),
+            )
+            conn.execute(
+                "UPDATE batch_jobs SET completed = completed + 1, failed = failed + ?, updated_at = ?, "
+                "heartbeat_at = ? WHERE job_id = ?", (int(failed), now, now, job_id),
+            )
+
+    def _finish(self, job_id: str, status: str) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE batch_jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                    (status, time.time(), job_id),
+                )
+        except sqlite3.Error as e:
+            print(f"Batch job store error: {e}")
+
+    # --- SQLite ---
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A fresh connection per operation keeps this safe across gunicorn forks
+        with self._db_lock:
+            conn = sqlite3.connect(self._database, timeout=5, uri=self._uri)
+            try:
+                if not self._uri:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def _init_db(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS batch_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    operation TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    owner_pid INTEGER,
+                    heartbeat_at REAL
+                )
+                """
+            )
+            # Store files created before jobs had heartbeats
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(batch_jobs)")}
+            for column in ("owner_pid INTEGER", "heartbeat_at REAL"):
+                if column.split()[0] not in columns:
+                    conn.execute(f"ALTER TABLE batch_jobs ADD COLUMN {column}")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS batch_results (
+                    job_id TEXT NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    body TEXT NOT NULL,
+                    PRIMARY KEY (job_id, item_index)
+                )
+                """
+            )
@@ -0,0 +1,144 @@
+"""
+Fake-clock checks for the admission controller's circuit breaker.
+
+Drives AdmissionController with a simulated clock (no real sleeping, no LLM)
+through the ways a half-open probe can end, and asserts the circuit never
+stays stuck half-open. Run from src/python:
+
+    python -m benchmarks.breaker
+"""
+import asyncio
+
+from admission import AdmissionController, UpstreamUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def controller(clock: FakeClock, **kwargs) -> AdmissionController:
+    options = dict(requests_per_minute=0, tokens_per_minute=0, max_retries=0,
+                   failure_threshold=1, reset_timeout=30.0, clock=clock, sleep=clock.sleep)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def overloaded():
+    raise RuntimeError("503 overloaded")
+
+
+def trip(admission: AdmissionController, clock: FakeClock) -> None:
+    """Open the circuit with one transient failure, then wait out reset_timeout."""
+    try:
+        admission.call(overloaded, priority=0, tokens=1)
+    except UpstreamUnavailable:
+        pass
+    assert admission.breaker.state == "open", admission.breaker.state
+    clock.sleep(admission.breaker.reset_timeout)
+
+
+def assert_recovers(admission: AdmissionController, scenario: str) -> None:
+    """The next call must be let through as a probe and close the circuit."""
+    assert admission.call(lambda: "ok", priority=0, tokens=1) == "ok", scenario
+    assert admission.breaker.state == "closed", (scenario, admission.breaker.state)
+    print(f"ok  {scenario}")
+
+
+def check_probe_outcomes() -> None:
+    clock = FakeClock()
+    admission = controller(clock)
+    trip(admission, clock)
+    assert_recovers(admission, "successful probe closes the circuit")
+
+    trip(admission, clock)
+    try:
+        admission.call(overloaded, priority=0, tokens=1)
+    except UpstreamUnavailable:
+        pass
+    assert admission.breaker.state == "open", "failed probe must re-open the circuit"
+    try:
+        admission.call(lambda: "ok", priority=0, tokens=1)
+        raise AssertionError("open circuit let a call through before reset_timeout")
+    except UpstreamUnavailable:
+        pass
+    clock.sleep(admission.breaker.reset_timeout)
+    assert_recovers(admission, "failed probe re-opens, later probe closes")
+
+
+def check_cancelled_probe() -> None:
+    clock = FakeClock()
+    admission = controller(clock)
+    trip(admission, clock)
+
+    async def cancelled():
+        async def hang():
+            await asyncio.sleep(3600)
+        task = asyncio.ensure_future(admission.acall(hang, priority=0, tokens=1))
+        await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(cancelled())
+    assert_recovers(admission, "cancelled acall probe is released")
+
+
+def check_rejected_probe() -> None:
+    clock = FakeClock()
+    admission = controller(clock, max_queue=1)
+    trip(admission, clock)
+    # Fill the queue so the probe is rejected after passing the breaker
+    admission._queue.append((0, -1))
+    try:
+        admission.call(lambda: "ok", priority=0, tokens=1)
+        raise AssertionError("probe should have been rejected by the full queue")
+    except UpstreamUnavailable:
+        pass
+    admission._queue.clear()
+    assert_recovers(admission, "probe rejected by the queue is released")
+
+
+def check_abandoned_stream() -> None:
+    clock = FakeClock()
+    admission = controller(clock)
+    trip(admission, clock)
+    stream = admission.stream(lambda: iter(["a", "b", "c"]), priority=0, tokens=1)
+    assert next(stream) == "a"
+    stream.close()
+    assert_recovers(admission, "abandoned stream probe is released")
+
+
+def check_hung_probe() -> None:
+    clock = FakeClock()
+    admission = controller(clock)
+    trip(admission, clock)
+    # A probe that is admitted but never reports back (a hung thread)
+    admission._check_breaker()
+    try:
+        admission.call(lambda: "ok", priority=0, tokens=1)
+        raise AssertionError("second call let through while the probe is pending")
+    except UpstreamUnavailable:
+        pass
+    clock.sleep(admission.breaker.probe_timeout)
+    assert_recovers(admission, "hung probe expires after probe_timeout")
+
+
+def main():
+    check_probe_outcomes()
+    check_cancelled_probe()
+    check_rejected_probe()
+    check_abandoned_stream()
+    check_hung_probe()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Deterministic stand-in for ChatGoogleGenerativeAI.
+
+It sleeps for a configurable latency, produces output of a configurable size,
+and returns valid JSON (or tool calls, for with_structured_output) for every
+prompt the services send, so the full request path can be exercised without
+network access.
+"""
+import asyncio
+import contextvars
+import json
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+_WORDS = (
+    "the tenant may recover the security deposit within one month of vacating "
+    "and the employer must pay wages before the seventh day of the following month"
+).split()
+
+
+def filler_text(chars: int, seed: int = 0) -> str:
+    """Deterministic prose of roughly `chars` characters."""
+    words, size, i = [], 0, seed
+    while size < chars:
+        word = _WORDS[i % len(_WORDS)]
+        words.append(word)
+        size += len(word) + 1
+        i += 1
+    return " ".join(words)
+
+
+class LLMTimer:
+    """
+    Accumulates simulated upstream time per request, so callers can subtract it.
+
+    The context variable holds a mutable cell, so time recorded in executor
+    threads or child tasks (which run on a copy of the context) still counts.
+    """
+
+    def __init__(self):
+        self._cell = contextvars.ContextVar("llm_time")
+
+    def start(self) -> None:
+        self._cell.set([0.0])
+
+    def add(self, seconds: float) -> None:
+        cell = self._cell.get(None)
+        if cell is not None:
+            cell[0] += seconds
+
+    @property
+    def total(self) -> float:
+        cell = self._cell.get(None)
+        return cell[0] if cell else 0.0
+
+
+class FakeChatModel(BaseChatModel):
+    """Fake chat model with fixed latency, output size and token streaming."""
+
+    latency: float = 0.2
+    output_chars: int = 1200
+    items: int = 4
+    stream_chunks: int = 20
+    timer: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-legalmate"
+
+    # --- Output Synthesis ---
+
+    def _item_text(self, i: int) -> str:
+        return filler_text(max(20, self.output_chars // max(self.items, 1)), seed=i)
+
+    def _payload_for(self, prompt: str) -> Optional[dict]:
+        """JSON payload matching the schema a prompt asks for, or None for plain text."""
+        if "analysis_points" in prompt:
+            return {"analysis_points": [
+                {"type": "point" if i % 2 == 0 else "recommendation",
+                 "title": f"Point {i + 1}", "text": self._item_text(i)}
+                for i in range(self.items)
+            ]}
+        if "summary_points" in prompt:
+            return {"summary_points": [
+                {"title": f"Point {i + 1}", "text": self._item_text(i)} for i in range(self.items)
+            ]}
+        if "relevantLaws" in prompt:
+            return self._rights_payload()
+        if prompt == "title summary":
+            # IdentifyResponse, only ever requested as structured output
+            return {"title": "Residential rental agreement", "summary": self._item_text(0)}
+        return None
+
+    def _rights_payload(self) -> dict:
+        return {
+            "explanation": self._item_text(0),
+            "relevantLaws": [
+                {"title": f"Law {i + 1}", "text": self._item_text(i)} for i in range(self.items)
+            ],
+            "guidance": self._item_text(self.items),
+            "disclaimer": "This is for informational purposes only.",
+        }
+
+    def _content_for(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        payload = self._payload_for(prompt)
+        return json.dumps(payload) if payload is not None else filler_text(self.output_chars)
+
+    def _message_for(self, messages: List[BaseMessage], tools: Optional[list]) -> AIMessage:
+        if not tools:
+            return AIMessage(content=self._content_for(messages))
+        # Structured output: call the (single) bound tool with arguments for its schema
+        function = tools[0]["function"]
+        fields = " ".join(function.get("parameters", {}).get("properties", {}))
+        args = self._payload_for(fields) or {}
+        return AIMessage(content="", tool_calls=[{"name": function["name"], "args": args, "id": "call_0"}])
+
+    def _record(self, seconds: float) -> None:
+        if self.timer is not None:
+            self.timer.add(seconds)
+
+    # --- BaseChatModel Hooks ---
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        self._record(self.latency)
+        message = self._message_for(messages, kwargs.get("tools"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        self._record(self.latency)
+        message = self._message_for(messages, kwargs.get("tools"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _pieces(self, content: str) -> List[str]:
+        size = max(1, len(content) // self.stream_chunks)
+        return [content[i:i + size] for i in range(0, len(content), size)]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        pieces = self._pieces(self._content_for(messages))
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            # Recorded per piece, since callers may stop reading early
+            self._record(self.latency / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        pieces = self._pieces(self._content_for(messages))
+        for piece in pieces:
+            await asyncio.sleep(self.latency / len(pieces))
+            self._record(self.latency / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        """Tool binding in the same (OpenAI-style) format Gemini receives, so the
+        stock with_structured_output and its output parser are exercised."""
+        formatted = [convert_to_openai_tool(tool) for tool in tools]
+        return self.bind(tools=formatted, tool_choice=tool_choice, **kwargs)
+
+
+def patch_chat_model(model_cls, fake: FakeChatModel) -> None:
+    """Route a real chat model class's calls to `fake`, keeping its own tool binding."""
+    model_cls._generate = lambda self, messages, stop=None, run_manager=None, **kw: (
+        fake._generate(messages, stop, **kw)
+    )
+    model_cls._agenerate = lambda self, messages, stop=None, run_manager=None, **kw: (
+        fake._agenerate(messages, stop, **kw)
+    )
+    model_cls._stream = lambda self, messages, stop=None, run_manager=None, **kw: (
+        fake._stream(messages, stop, **kw)
+    )
+    model_cls._astream = lambda self, messages, stop=None, run_manager=None, **kw: (
+        fake._astream(messages, stop, **kw)
+    )
@@ -0,0 +1,233 @@
+"""
+Micro benchmark: legacy LLM-response JSON parsing, old vs new.
+
+Compares the regex-based parse_json_from_response/clean_text_formatting that
+the legacy scripts API used (copied below as the baseline) with
+json_extract.py, on responses shaped like Gemini's: bare JSON, fenced JSON,
+JSON with prose around it, a large response and a response with no JSON.
+The streaming extractor is timed too (extraction only, no cleanup), fed in
+20-character chunks. Run from
+src/python:
+
+    python -m benchmarks.json_parsing --iterations 2000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEGACY_DIR = os.path.normpath(os.path.join(HERE, "..", "..", "app", "scripts"))
+sys.path.insert(0, LEGACY_DIR)
+
+from json_extract import (  # noqa: E402
+    clean_text_formatting, extract_json, extract_json_from_stream, parse_json_from_response,
+)
+
+from benchmarks.fake_llm import filler_text  # noqa: E402
+
+
+# --- Baseline (the previous implementation, unchanged) ---
+
+def baseline_clean_text_formatting(text):
+    if not isinstance(text, str):
+        return text
+    text = re.sub(r'\d+\.\s+\*\*([^*]+)\*\*:\s*', r'\1: ', text)
+    text = re.sub(r'\d+\.\s+', '', text)
+    text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = text.strip()
+    return text
+
+
+def baseline_parse_json_from_response(content):
+    try:
+        parsed = json.loads(content)
+    except json.JSONDecodeError:
+        json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
+        if json_match:
+            try:
+                parsed = json.loads(json_match.group(1))
+            except json.JSONDecodeError:
+                pass
+        else:
+            json_match = re.search(r'(\{.*\})', content, re.DOTALL)
+            if json_match:
+                try:
+                    parsed = json.loads(json_match.group(1))
+                except json.JSONDecodeError:
+                    pass
+            else:
+                raise ValueError("Could not parse JSON from LLM response")
+
+    if isinstance(parsed, dict):
+        for key, value in parsed.items():
+            if isinstance(value, str):
+                parsed[key] = baseline_clean_text_formatting(value)
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    if isinstance(item, dict):
+                        for sub_key, sub_value in item.items():
+                            if isinstance(sub_value, str):
+                                item[sub_key] = baseline_clean_text_formatting(sub_value)
+    return parsed
+
+
+def baseline_attempt(content):
+    try:
+        return baseline_parse_json_from_response(content)
+    except Exception:
+        return None
+
+
+# --- Regression Checks ---
+
+# Inputs where the passes interact; each must clean exactly as the baseline does
+CLEAN_CASES = [
+    "**12. Terms**: ok",
+    "**1. Security Deposit**: text",
+    "**Note 1. x**",
+    "1. **Notice**: The   employer must\n\n2. pay **all** dues.",
+    "3. **a** b **c**: d 4.  e",
+    "Section 1.2. applies; see 10. **Rule**:x",
+    "** 1. **: **",
+]
+CLEAN_ALPHABET = ["1", "2", "12", ".", " ", "\n", "*", "**", ":", "a", "Note", "\t"]
+
+
+def check_clean_text(fuzz: int, seed: int = 0) -> None:
+    """Assert clean_text_formatting matches the baseline on CLEAN_CASES and `fuzz` random inputs."""
+    import random
+
+    rng = random.Random(seed)
+    cases = CLEAN_CASES + [
+        "".join(rng.choice(CLEAN_ALPHABET) for _ in range(rng.randint(1, 24))) for _ in range(fuzz)
+    ]
+    for text in cases:
+        expected = baseline_clean_text_formatting(text)
+        assert clean_text_formatting(text) == expected, (text, clean_text_formatting(text), expected)
+
+
+# Responses with brackets in the prose; extract_json and the streaming extractor must agree
+EXTRACT_CASES = [
+    ('Sure {here is the result: ```json{"a":1}```', {"a": 1}),
+    ('Here [1] is: {"a": 1}', {"a": 1}),
+    ('See [note {x] then ```json\n{"points": [{"t": "[(}"}]}\n```', {"points": [{"t": "[(}"}]}),
+    ('{"a": "}{"} and a stray { after', {"a": "}{"}),
+    ("[1, 2] but no object", [1, 2]),
+    ("no JSON { at all [", None),
+]
+
+
+def check_extract() -> None:
+    """Assert extract_json and extract_json_from_stream (at several chunk sizes) on EXTRACT_CASES."""
+    for content, expected in EXTRACT_CASES:
+        parsers = [extract_json] + [
+            lambda text, size=size: extract_json_from_stream(chunked(text, size)) for size in (1, 3, 20, 1000)
+        ]
+        for parse in parsers:
+            try:
+                value = parse(content)
+            except ValueError:
+                value = None
+            assert value == expected, (content, value, expected)
+
+
+# --- Sample Responses ---
+
+def advise_payload(points: int) -> dict:
+    return {"analysis_points": [
+        {
+            "type": "point" if i % 2 else "recommendation",
+            "title": f"{i + 1}. **Point {i + 1}**: wages",
+            "text": f"1. **Claim**: {filler_text(400)}\n\n2. File within the **limitation** period.",
+        }
+        for i in range(points)
+    ]}
+
+
+def sample_responses() -> dict:
+    small = json.dumps(advise_payload(4), ensure_ascii=False, indent=2)
+    large = json.dumps(advise_payload(200), ensure_ascii=False, indent=2)
+    return {
+        "bare (2KB)": small,
+        "fenced (2KB)": f"```json\n{small}\n```",
+        "prose + fenced (2KB)": f"Here is the analysis you asked for:\n```json\n{small}\n```\nLet me know {{more}}.",
+        "prose, no fence (2KB)": f"Here is the analysis: {small} I hope this helps.",
+        "fenced (100KB)": f"```json\n{large}\n```",
+        "prose, no fence (100KB)": f"Analysis follows. {large} Anything else? {{ }}",
+    }
+
+
+def chunked(text: str, size: int = 20) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def time_call(fn, iterations: int) -> float:
+    fn()  # warm up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy JSON parsing micro benchmark.")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    parser.add_argument("--fuzz", type=int, default=200000, help="Random inputs checked against the baseline cleaner")
+    args = parser.parse_args()
+
+    check_clean_text(args.fuzz)
+    print(f"clean_text_formatting matches the baseline on {len(CLEAN_CASES) + args.fuzz} inputs")
+    check_extract()
+    print(f"extract_json and the streaming extractor agree on {len(EXTRACT_CASES)} bracket cases\n")
+
+    print(f"{'response':<26} {'baseline us':>12} {'new us':>10} {'stream us':>10} {'speedup':>8}")
+    print(f"{'':<26} {'(parse+clean)':>12} {'':>10} {'(parse)':>10}")
+    results = []
+    for name, content in sample_responses().items():
+        try:
+            expected = baseline_parse_json_from_response(content)
+        except Exception:
+            # The greedy regex ran past the JSON into later braces
+            expected = None
+        # Same output on these shapes; the new cleaner also reaches deeper nesting
+        if expected is not None:
+            assert json.dumps(parse_json_from_response(content)) == json.dumps(expected), name
+        chunks = chunked(content)
+        iterations = max(1, args.iterations // 50) if len(content) > 50000 else args.iterations
+        row = {
+            "response": name,
+            "baseline_us": time_call(lambda: baseline_attempt(content), iterations),
+            "baseline_fails": expected is None,
+            "new_us": time_call(lambda: parse_json_from_response(content), iterations),
+            "stream_us": time_call(lambda: extract_json_from_stream(chunks), iterations),
+        }
+        row["speedup"] = None if expected is None else row["baseline_us"] / row["new_us"]
+        results.append(row)
+        speedup = "baseline fails" if expected is None else f"{row['speedup']:>7.1f}x"
+        print(f"{name:<26} {row['baseline_us']:>12.1f} {row['new_us']:>10.1f} "
+              f"{row['stream_us']:>10.1f} {speedup:>8}")
+
+    clean_input = "1. **Notice**: The   employer must\n\n2. pay **all** dues. " * 20
+    assert baseline_clean_text_formatting(clean_input) == clean_text_formatting(clean_input)
+    row = {
+        "response": "clean_text_formatting",
+        "baseline_us": time_call(lambda: baseline_clean_text_formatting(clean_input), args.iterations),
+        "new_us": time_call(lambda: clean_text_formatting(clean_input), args.iterations),
+    }
+    row["speedup"] = row["baseline_us"] / row["new_us"]
+    results.append(row)
+    print(f"{row['response']:<26} {row['baseline_us']:>12.1f} {row['new_us']:>10.1f} "
+          f"{'':>10} {row['speedup']:>7.1f}x")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
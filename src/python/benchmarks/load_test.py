@@ -0,0 +1,273 @@
+"""
+Offline benchmark and load test for the Python API and the legacy scripts API.
+
+Gemini is replaced by FakeChatModel, so runs need no network or API key and
+are repeatable. Run from src/python:
+
+    python -m benchmarks.load_test --target flask asgi legacy --concurrency 1,8,32
+    python -m benchmarks.load_test --micro
+
+For each target, endpoint and concurrency level it reports throughput,
+p50/p95/p99 latency, our own overhead (latency minus simulated LLM time) and
+process RSS. --micro times chain building, parsing and serialization alone.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure the services for offline, uncached, unthrottled runs before they are imported
+os.environ.update({
+    "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY") or "benchmark",
+    "ADMISSION_RPM": "0",
+    "ADMISSION_TPM": "0",
+    "RESPONSE_CACHE_PATH": "",
+    "SEMANTIC_CACHE_MAX_ENTRIES": "0",
+    "DOCUMENT_STORE_PATH": "",
+    "SINGLE_FLIGHT_LOCK_DIR": "",
+})
+
+from benchmarks.fake_llm import FakeChatModel, LLMTimer, filler_text
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEGACY_DIR = os.path.normpath(os.path.join(HERE, "..", "..", "app", "scripts"))
+
+SAMPLE_DOCUMENT = filler_text(6000)
+
+# endpoint name -> (path, payload builder). Every request across all runs gets a
+# unique input so caching and request coalescing don't hide the work being measured.
+_request_ids = itertools.count()
+
+ENDPOINTS = {
+    "know-your-rights": ("/api/know-your-rights",
+                         lambda i: {"query": f"My landlord kept my deposit ({i}). What can I do?"}),
+    "simplify": ("/api/simplify", lambda i: {"text": f"{SAMPLE_DOCUMENT} Reference {i}."}),
+    "advise": ("/api/advise", lambda i: {"case_text": f"Employer has not paid wages for case {i}."}),
+    "identify": ("/api/identify", lambda i: {"text": f"Reference {i}. {SAMPLE_DOCUMENT}"}),
+    "ask-vakil": ("/api/ask-vakil",
+                  lambda i: {"document_text": SAMPLE_DOCUMENT, "question": f"What is clause {i} about?"}),
+}
+LEGACY_ENDPOINTS = ("know-your-rights", "simplify", "advise")
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process (one process = one worker)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def summarize(target, endpoint, concurrency, latencies, overheads, errors, elapsed) -> dict:
+    return {
+        "target": target,
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "overhead_p50_ms": percentile(overheads, 50) * 1000,
+        "overhead_p95_ms": percentile(overheads, 95) * 1000,
+        "rss_mb": rss_mb(),
+    }
+
+
+# --- Targets ---
+
+def load_flask_target(fake: FakeChatModel):
+    import app as service
+    service.rag_handler.llm = fake
+    return service.app
+
+
+def fake_kb_index(*args, **kwargs):
+    """The legacy knowledge base index with fake vectors, so startup embeds nothing."""
+    import build_index
+    from langchain_community.embeddings import FakeEmbeddings
+    from langchain_community.vectorstores import FAISS
+
+    chunks = build_index.load_chunks(build_index.KB_DIR, build_index.source_manifest()["files"])
+    return FAISS.from_documents(list(chunks.values()), FakeEmbeddings(size=768))
+
+
+def load_legacy_target(fake: FakeChatModel):
+    sys.path.insert(0, LEGACY_DIR)
+    try:
+        import build_index
+        build_index.load_index = fake_kb_index
+        spec = importlib.util.spec_from_file_location("legacy_app", os.path.join(LEGACY_DIR, "app.py"))
+        legacy = importlib.util.module_from_spec(spec)
+        cwd = os.getcwd()
+        os.chdir(LEGACY_DIR)  # the legacy app resolves knowledge_base relative to cwd
+        try:
+            spec.loader.exec_module(legacy)
+        finally:
+            os.chdir(cwd)
+    finally:
+        sys.path.remove(LEGACY_DIR)
+    legacy.llm = fake
+    return legacy.app
+
+
+def run_wsgi(flask_app, endpoint, concurrency, requests, timer) -> tuple:
+    path, payload = ENDPOINTS[endpoint]
+
+    def one(_):
+        client = flask_app.test_client()
+        body = payload(next(_request_ids))
+        timer.start()
+        started = time.perf_counter()
+        response = client.post(path, json=body)
+        latency = time.perf_counter() - started
+        return latency, latency - timer.total, response.status_code != 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    return [r[0] for r in results], [r[1] for r in results], sum(r[2] for r in results), elapsed
+
+
+def run_asgi(quart_app, endpoint, concurrency, requests, timer) -> tuple:
+    path, payload = ENDPOINTS[endpoint]
+
+    async def main():
+        client = quart_app.test_client()
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(_):
+            async with gate:
+                body = payload(next(_request_ids))
+                timer.start()
+                started = time.perf_counter()
+                response = await client.post(path, json=body)
+                await response.get_data()
+                latency = time.perf_counter() - started
+                return latency, latency - timer.total, response.status_code != 200
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(requests)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(main())
+    return [r[0] for r in results], [r[1] for r in results], sum(r[2] for r in results), elapsed
+
+
+# --- Micro Benchmarks ---
+
+def run_micro(fake: FakeChatModel, iterations: int) -> list:
+    """Time the pieces of our own request path that don't involve the LLM."""
+    import app as service
+    from rag_legal import AdviseResponse, KnowYourRightsResponse
+
+    handler = service.rag_handler
+    handler.llm = fake
+    rights_payload = fake._payload_for("relevantLaws")
+    advise_json = json.dumps(fake._payload_for("analysis_points"))
+    rights = KnowYourRightsResponse.parse_obj(rights_payload)
+
+    def jsonify_rights():
+        with service.app.app_context():
+            service.jsonify(rights.dict()).get_data()
+
+    cases = {
+        "build rights chain": lambda: handler._rights_chain(fake),
+        "build simplify chain": lambda: handler._simplify_chain(fake),
+        "build advise chain": lambda: handler._advise_chain(fake),
+        "build vakil chain": lambda: handler._vakil_chain(fake),
+        "parse KnowYourRightsResponse": lambda: KnowYourRightsResponse.parse_obj(rights_payload),
+        "parse AdviseResponse from JSON": lambda: AdviseResponse.parse_raw(advise_json),
+        "jsonify rights response": jsonify_rights,
+        "render vakil prompt": lambda: handler._vakil_chain(fake).first.invoke(
+            {"document": SAMPLE_DOCUMENT, "history": "(none)", "question": "What is the notice period?"}
+        ),
+    }
+    results = []
+    for name, fn in cases.items():
+        fn()  # warm up
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        per_call = (time.perf_counter() - started) / iterations
+        results.append({"case": name, "us_per_call": per_call * 1e6})
+    return results
+
+
+# --- CLI ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test with a fake LLM.")
+    parser.add_argument("--target", nargs="+", default=["flask"], choices=["flask", "asgi", "legacy"])
+    parser.add_argument("--endpoint", nargs="+", default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per level")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated LLM latency (s)")
+    parser.add_argument("--output-chars", type=int, default=1200, help="Simulated output size")
+    parser.add_argument("--micro", action="store_true", help="Run micro benchmarks instead")
+    parser.add_argument("--iterations", type=int, default=2000, help="Micro benchmark iterations")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    timer = LLMTimer()
+    fake = FakeChatModel(latency=args.latency, output_chars=args.output_chars, timer=timer)
+
+    if args.micro:
+        results = run_micro(fake, args.iterations)
+        for row in results:
+            print(f"{row['case']:<34} {row['us_per_call']:>10.1f} us")
+    else:
+        results = []
+        levels = [int(c) for c in args.concurrency.split(",")]
+        header = f"{'target':<7} {'endpoint':<17} {'conc':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'ovh50':>7} {'ovh95':>7} {'err':>4} {'rss':>7}"
+        print(header)
+        for target in args.target:
+            if target == "asgi":
+                import asgi
+                asgi.rag_handler.llm = fake
+                app, runner = asgi.app, run_asgi
+            elif target == "legacy":
+                app, runner = load_legacy_target(fake), run_wsgi
+            else:
+                app, runner = load_flask_target(fake), run_wsgi
+            for endpoint in args.endpoint:
+                if target == "legacy" and endpoint not in LEGACY_ENDPOINTS:
+                    continue
+                for concurrency in levels:
+                    # The services log every request; keep the report readable
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        measured = runner(app, endpoint, concurrency, args.requests, timer)
+                    row = summarize(target, endpoint, concurrency, *measured)
+                    results.append(row)
+                    print(f"{target:<7} {endpoint:<17} {concurrency:>4} {row['throughput_rps']:>8.1f} "
+                          f"{row['p50_ms']:>7.0f}m {row['p95_ms']:>7.0f}m {row['p99_ms']:>7.0f}m "
+                          f"{row['overhead_p50_ms']:>6.1f}m {row['overhead_p95_ms']:>6.1f}m "
+                          f"{row['errors']:>4} {row['rss_mb']:>6.0f}M")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
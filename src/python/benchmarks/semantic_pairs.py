@@ -0,0 +1,117 @@
+"""
+Calibration of the know-your-rights semantic cache (and answer bank) matching.
+
+Scores labelled question pairs with the same checks SemanticCache.get applies:
+cosine similarity, language, guard terms (negations, time qualifiers and
+quantities) and the best-matching knowledge base section. Paraphrases should
+be served from each other; contrasts must never be. Run from src/python:
+
+    python -m benchmarks.semantic_pairs
+    python -m benchmarks.semantic_pairs --verbose
+
+It prints, for each candidate threshold, how many paraphrases would hit and
+how many contrasts would be served the wrong answer, plus the lowest threshold
+with no wrong answers. Add pairs here when /api/cache/stats shows a bad hit.
+"""
+import argparse
+
+from knowledge_index import KnowledgeIndex
+from response_cache import normalize_text
+from semantic_cache import cosine, detect_language, embed, guard_terms
+
+# Same question, phrased differently: one answer serves both
+PARAPHRASES = [
+    ("My landlord won't return my security deposit", "landlord is not returning my security deposit"),
+    ("Can my landlord keep my security deposit?", "can the landlord keep my security deposit"),
+    ("How much security deposit can a landlord ask for?", "how much security deposit can the landlord demand"),
+    ("My landlord wants to evict me without notice", "landlord evicting me without notice"),
+    ("Can my landlord increase rent whenever he wants?", "can landlord increase my rent anytime"),
+    ("Who pays for repairs in a rented house?", "who has to pay for repairs in a rented flat"),
+    ("Does a rent agreement need to be registered?", "is registration of rent agreement required"),
+    ("My boss hasn't paid my salary for 2 months", "employer has not paid my salary for 60 days"),
+    ("My employer has not paid my wages", "boss not paying my wages"),
+    ("How many hours can my employer make me work?", "how many working hours are allowed for employees"),
+    ("Am I entitled to maternity leave?", "am i eligible for maternity leave"),
+    ("Can I be fired without notice?", "can my employer fire me without notice"),
+    ("When do I get gratuity?", "when is gratuity paid to an employee"),
+    ("The product I bought online is defective", "i bought a defective product online"),
+    ("How do I file a consumer complaint?", "how to file a complaint in consumer commission"),
+    ("Can I get a refund for defective goods?", "refund for defective goods"),
+    ("मकान मालिक सिक्योरिटी डिपॉजिट वापस नहीं कर रहा", "मेरा मकान मालिक डिपॉजिट वापस नहीं कर रहा है"),
+    ("मेरी सैलरी 2 महीने से नहीं मिली", "मुझे दो महीने से वेतन नहीं मिला"),
+]
+
+# Close in wording but needing different answers: must never be served from each other
+CONTRASTS = [
+    ("Can my landlord keep my security deposit?", "Can my landlord not keep my security deposit?"),
+    ("Can I be evicted with notice?", "Can I be evicted without notice?"),
+    ("Landlord gave me 6 months notice", "Landlord gave me 2 months notice"),
+    ("My rent agreement is for one year", "My rent agreement is for one month"),
+    ("My employer has not paid my salary", "My employer paid my salary late"),
+    ("Can I be fired during maternity leave?", "Can I be fired after maternity leave?"),
+    ("My boss hasn't paid salary for 2 months", "My boss hasn't paid salary for 6 months"),
+    ("I work 9 hours a day", "I work 12 hours a day"),
+    ("Can my landlord enter my house without permission?", "Can my landlord enter my house with permission?"),
+    ("Is a rent agreement for 11 months registered?", "Is a rent agreement for 12 months registered?"),
+    ("मेरी सैलरी 2 महीने से नहीं मिली", "मेरी सैलरी 6 महीने से नहीं मिली"),
+    ("Can I be fired before my notice period ends?", "Can I be fired after my notice period ends?"),
+    ("My landlord has not returned my deposit", "My landlord has returned only part of my deposit"),
+    ("Can the seller refuse a refund?", "Can the seller give a refund?"),
+    ("Can my employer deduct my salary?", "Can my employer delay my salary?"),
+    ("Can I get a refund for a defective product?", "Can I get a replacement for a defective product?"),
+    ("Can my landlord increase the rent?", "Can my landlord increase the security deposit?"),
+    ("Can my landlord cut my water supply?", "Can my landlord cut my electricity supply?"),
+    ("How do I resign from my job?", "How do I get my job back?"),
+    ("Is overtime paid at double rate?", "Is overtime compulsory?"),
+]
+
+THRESHOLDS = (0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9)
+
+
+def pair_score(a: str, b: str, index: KnowledgeIndex, min_score: float) -> tuple:
+    """(cosine, reason the cache would refuse the pair or None)."""
+    a, b = normalize_text(a), normalize_text(b)
+    score = cosine(embed(a), embed(b))
+    if detect_language(a) != detect_language(b):
+        return score, "language"
+    if guard_terms(a) != guard_terms(b):
+        return score, "guards"
+    topics = []
+    for question in (a, b):
+        hits = index.search(question, k=1, min_score=min_score)
+        topics.append(f"{hits[0][0].source}: {hits[0][0].title}" if hits else "(none)")
+    if topics[0] != topics[1]:
+        return score, "topic"
+    return score, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the semantic cache threshold.")
+    parser.add_argument("--min-score", type=float, default=2.5, help="KB_MIN_SCORE used for topics")
+    parser.add_argument("--verbose", action="store_true", help="Print every pair")
+    args = parser.parse_args()
+
+    index = KnowledgeIndex.build()
+    scored = {
+        label: [(a, b) + pair_score(a, b, index, args.min_score) for a, b in pairs]
+        for label, pairs in (("paraphrase", PARAPHRASES), ("contrast", CONTRASTS))
+    }
+    if args.verbose:
+        for label, rows in scored.items():
+            for a, b, score, refused in rows:
+                print(f"{label:<10} {score:.3f} {refused or 'eligible':<8} {a!r} / {b!r}")
+        print()
+
+    print(f"{'threshold':>9} {'paraphrase hits':>16} {'wrong answers':>14}")
+    safe = None
+    for threshold in THRESHOLDS:
+        hits = sum(1 for *_, score, refused in scored["paraphrase"] if refused is None and score >= threshold)
+        wrong = sum(1 for *_, score, refused in scored["contrast"] if refused is None and score >= threshold)
+        print(f"{threshold:>9.2f} {hits:>10}/{len(PARAPHRASES):<5} {wrong:>8}/{len(CONTRASTS)}")
+        if wrong == 0 and safe is None:
+            safe = threshold
+    print(f"\nLowest threshold with no wrong answers: {safe}")
+
+
+if __name__ == "__main__":
+    main()
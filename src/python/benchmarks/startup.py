@@ -0,0 +1,142 @@
+"""
+Cold-start benchmark: import time, warm-up time and first-request latency.
+
+Every run is a fresh interpreter, like a new worker on a cold instance. The
+Gemini client is created for real (no network is needed for that), but its
+calls are routed to FakeChatModel with zero latency, so the numbers are our
+own overhead. Run from src/python:
+
+    python -m benchmarks.startup --target flask asgi --runs 5
+
+"warm" runs call LegalRAG.warm_up() before the first request, as the gunicorn
+post_fork hook and the Quart before_serving hook do; "lazy" runs build
+everything on the first request instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(HERE)
+
+CHILD_ENV = {
+    "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY") or "benchmark",
+    "ADMISSION_RPM": "0",
+    "ADMISSION_TPM": "0",
+    "RESPONSE_CACHE_PATH": "",
+    "SEMANTIC_CACHE_MAX_ENTRIES": "0",
+    "DOCUMENT_STORE_PATH": "",
+    "SINGLE_FLIGHT_LOCK_DIR": "",
+    "METRICS_DIR": "",
+}
+
+REQUEST = ("/api/know-your-rights", {"query": "Can my landlord keep my deposit?"})
+
+
+# --- Child Process ---
+
+def child(target: str, mode: str) -> dict:
+    timings = {}
+    started = time.perf_counter()
+    if target == "asgi":
+        import asgi as service
+    else:
+        import app as service
+    timings["import_s"] = time.perf_counter() - started
+
+    from benchmarks.fake_llm import FakeChatModel, patch_chat_model
+
+    handler = service.rag_handler
+    create_llm = handler._create_llm
+
+    def create_patched_llm(model):
+        llm = create_llm(model)
+        patch_chat_model(type(llm), FakeChatModel(latency=0))
+        return llm
+
+    handler._create_llm = create_patched_llm
+
+    started = time.perf_counter()
+    if mode == "warm":
+        handler.warm_up()
+    timings["warm_up_s"] = time.perf_counter() - started
+
+    path, payload = REQUEST
+    if target == "asgi":
+        async def requests():
+            client = service.app.test_client()
+            latencies = []
+            for i in range(2):
+                started = time.perf_counter()
+                response = await client.post(path, json={"query": f"{payload['query']} ({i})"})
+                await response.get_data()
+                assert response.status_code == 200, response.status_code
+                latencies.append(time.perf_counter() - started)
+            return latencies
+        first, second = asyncio.run(requests())
+    else:
+        client = service.app.test_client()
+        latencies = []
+        for i in range(2):
+            started = time.perf_counter()
+            response = client.post(path, json={"query": f"{payload['query']} ({i})"})
+            assert response.status_code == 200, response.status_code
+            latencies.append(time.perf_counter() - started)
+        first, second = latencies
+
+    timings["first_request_ms"] = first * 1000
+    timings["second_request_ms"] = second * 1000
+    return timings
+
+
+# --- Parent ---
+
+def run_child(target: str, mode: str) -> dict:
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", target, mode],
+        cwd=SERVICE_DIR, env={**os.environ, **CHILD_ENV},
+        capture_output=True, text=True, check=True,
+    ).stdout
+    # The services print while starting; the result is the last line
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process_s"] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark with a fake LLM.")
+    parser.add_argument("--target", nargs="+", default=["flask", "asgi"], choices=["flask", "asgi"])
+    parser.add_argument("--mode", nargs="+", default=["lazy", "warm"], choices=["lazy", "warm"])
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per combination")
+    parser.add_argument("--child", nargs=2, metavar=("TARGET", "MODE"), help=argparse.SUPPRESS)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(*args.child)))
+        return
+
+    columns = ("process_s", "import_s", "warm_up_s", "first_request_ms", "second_request_ms")
+    print(f"{'target':<7} {'mode':<5} " + " ".join(f"{c:>17}" for c in columns))
+    results = []
+    for target in args.target:
+        for mode in args.mode:
+            runs = [run_child(target, mode) for _ in range(args.runs)]
+            row = {"target": target, "mode": mode, "runs": args.runs}
+            row.update({c: statistics.median(r[c] for r in runs) for c in columns})
+            results.append(row)
+            print(f"{target:<7} {mode:<5} " + " ".join(f"{row[c]:>17.3f}" for c in columns))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
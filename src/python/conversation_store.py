@@ -0,0 +1,297 @@
+"""
+Server-side chat history for the Vakil chatbot, with bounded prompt size.
+
+Each session keeps its latest turns verbatim while they fit in
+recent_tokens. When a new turn pushes them over, the oldest turns are folded
+into a rolling summary (at most summary_tokens), so the history sent with
+every question stays within recent_tokens + summary_tokens however long the
+chat runs.
+
+Folding is two-step so no LLM call happens under a lock or before the
+response: append() folds the overflow into the summary extractively (clipped
+questions and answers) and returns a Compaction; the caller may then ask the
+model for a better summary in the background and store it with
+set_summary(), which only applies if nobody changed the summary in between.
+If that call fails, the extractive summary stays.
+
+Sessions live in SQLite (a per-process in-memory database, or a file shared
+by all workers when disk_path is set) and are evicted least recently used
+first, by TTL and under global session and byte caps.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from document_chunks import estimate_tokens
+
+# Longest session id accepted from clients
+MAX_SESSION_ID_LENGTH = 64
+
+# How much of each folded turn the extractive summary keeps
+SUMMARY_QUESTION_CHARS = 200
+SUMMARY_ANSWER_CHARS = 300
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id) -> bool:
+    return isinstance(session_id, str) and 0 < len(session_id) <= MAX_SESSION_ID_LENGTH
+
+
+def clip_tokens(text: str, tokens: int, keep_end: bool = False) -> str:
+    """`text` cut to about `tokens` tokens, keeping the start (or the end)."""
+    limit = max(tokens, 1) * 4
+    if len(text) <= limit:
+        return text
+    return "..." + text[-limit:] if keep_end else text[:limit] + "..."
+
+
+# --- Conversation ---
+
+Turn = Tuple[str, str]
+
+
+class Conversation(NamedTuple):
+    summary: str
+    turns: List[Turn]
+
+    def render(self, recent_tokens: int) -> str:
+        """
+        History as prompt text: the summary, then the newest turns that fit in
+        recent_tokens (the latest one clipped if it alone is too long).
+        """
+        lines, used = [], 0
+        for question, answer in reversed(self.turns):
+            text = f"User: {question}\nVakil: {answer}"
+            cost = estimate_tokens(text)
+            if lines and used + cost > recent_tokens:
+                break
+            lines.append(clip_tokens(text, recent_tokens))
+            used += cost
+        lines.reverse()
+        if self.summary:
+            lines.insert(0, f"Summary of the earlier conversation: {self.summary}")
+        return "\n\n".join(lines) if lines else "(none)"
+
+
+class Compaction(NamedTuple):
+    """Turns just folded into the summary, for the caller to summarize properly."""
+    session_id: str
+    previous_summary: str
+    turns: List[Turn]
+    summary: str  # the extractive summary now stored
+
+
+def extractive_summary(previous: str, turns: List[Turn], tokens: int) -> str:
+    """The previous summary plus clipped folded turns, trimmed from the front to `tokens`."""
+    parts = [previous] if previous else []
+    for question, answer in turns:
+        parts.append(
+            f"User asked: {clip_tokens(question, SUMMARY_QUESTION_CHARS // 4)} "
+            f"Vakil answered: {clip_tokens(answer, SUMMARY_ANSWER_CHARS // 4)}"
+        )
+    return clip_tokens(" ".join(parts), tokens, keep_end=True)
+
+
+# --- Conversation Store ---
+
+class ConversationStore:
+    """LRU/TTL store of Vakil conversations, bounded by session count and total bytes."""
+
+    def __init__(
+        self,
+        max_sessions: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: float = 2 * 3600,
+        recent_tokens: int = 1500,
+        summary_tokens: int = 400,
+        disk_path: Optional[str] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        self._lock = threading.Lock()
+        self._counters = {
+            "lookups": 0,
+            "turns": 0,
+            "compactions": 0,
+            "summaries": 0,
+            "stale_summaries": 0,
+            "evictions": 0,
+        }
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._database, self._uri = disk_path, False
+            self._db_lock = nullcontext()
+        else:
+            # A shared-cache memory database lives as long as one connection is open
+            self._database, self._uri = f"file:conversations-{uuid.uuid4().hex}?mode=memory&cache=shared", True
+            self._keeper = sqlite3.connect(self._database, uri=True, check_same_thread=False)
+            # Shared-cache tables are locked without honouring the busy timeout, so take turns
+            self._db_lock = threading.Lock()
+        self._init_db()
+
+    @classmethod
+    def from_env(cls) -> "ConversationStore":
+        """Build a store from CONVERSATION_* environment variables."""
+        return cls(
+            max_sessions=int(os.getenv("CONVERSATION_STORE_MAX_SESSIONS", "1024")),
+            max_bytes=int(os.getenv("CONVERSATION_STORE_MAX_BYTES", str(16 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("CONVERSATION_STORE_TTL_SECONDS", str(2 * 3600))),
+            recent_tokens=int(os.getenv("CONVERSATION_RECENT_TOKENS", "1500")),
+            summary_tokens=int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "400")),
+            disk_path=os.getenv("CONVERSATION_STORE_PATH") or None,
+        )
+
+    # --- Public API ---
+
+    def get(self, session_id: str) -> Conversation:
+        """The session's history; empty for a new, expired or evicted session."""
+        self._count("lookups")
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT summary, turns FROM conversations WHERE session_id = ? AND expires_at > ?",
+                (session_id, time.time()),
+            ).fetchone()
+        if row is None:
+            return Conversation("", [])
+        return Conversation(row[0], [tuple(turn) for turn in json.loads(row[1])])
+
+    def append(self, session_id: str, question: str, answer: str) -> Optional[Compaction]:
+        """
+        Add a turn. If the verbatim turns no longer fit in recent_tokens, the
+        oldest are folded into the summary and returned as a Compaction.
+        """
+        now = time.time()
+        compaction = None
+        with self._connect() as conn:
+            # Read-modify-write across workers, so take the write lock up front
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT summary, turns FROM conversations WHERE session_id = ? AND expires_at > ?",
+                (session_id, now),
+            ).fetchone()
+            summary, turns = (row[0], [tuple(t) for t in json.loads(row[1])]) if row else ("", [])
+            turns.append((question, answer))
+
+            folded = []
+            tokens = sum(estimate_tokens(q) + estimate_tokens(a) for q, a in turns)
+            # The latest turn always stays verbatim; render() clips it if needed
+            while len(turns) > 1 and tokens > self.recent_tokens:
+                question_, answer_ = turns.pop(0)
+                tokens -= estimate_tokens(question_) + estimate_tokens(answer_)
+                folded.append((question_, answer_))
+            if folded:
+                new_summary = extractive_summary(summary, folded, self.summary_tokens)
+                compaction = Compaction(session_id, summary, folded, new_summary)
+                summary = new_summary
+
+            body = json.dumps(turns, ensure_ascii=False)
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (session_id, summary, turns, bytes, last_used, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, summary, body, len(summary.encode("utf-8")) + len(body.encode("utf-8")),
+                 now, now + self.ttl_seconds),
+            )
+            evicted = self._evict(conn, session_id, now)
+        with self._lock:
+            self._counters["turns"] += 1
+            self._counters["compactions"] += compaction is not None
+            self._counters["evictions"] += evicted
+        return compaction
+
+    def set_summary(self, compaction: Compaction, summary: str) -> bool:
+        """Replace the extractive summary from `compaction`; False if the session moved on meanwhile."""
+        summary = clip_tokens(summary.strip(), self.summary_tokens, keep_end=True)
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE conversations SET summary = ?, bytes = ? + length(CAST(turns AS BLOB)) "
+                "WHERE session_id = ? AND summary = ?",
+                (summary, len(summary.encode("utf-8")), compaction.session_id, compaction.summary),
+            ).rowcount
+        self._count("summaries" if updated else "stale_summaries")
+        return bool(updated)
+
+    def delete(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            sessions, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM conversations WHERE expires_at > ?",
+                (time.time(),),
+            ).fetchone()
+        with self._lock:
+            stats = dict(self._counters)
+        stats["sessions"] = sessions
+        stats["bytes"] = total_bytes
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    # --- Eviction (inside the append transaction) ---
+
+    def _evict(self, conn: sqlite3.Connection, keep: str, now: float) -> int:
+        conn.execute("DELETE FROM conversations WHERE expires_at <= ?", (now,))
+        sessions, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM conversations"
+        ).fetchone()
+        if sessions <= self.max_sessions and total_bytes <= self.max_bytes:
+            return 0
+        evicted = 0
+        # Least recently used first; the session just written always stays
+        for session_id, size in conn.execute(
+            "SELECT session_id, bytes FROM conversations WHERE session_id != ? ORDER BY last_used", (keep,)
+        ).fetchall():
+            if sessions <= self.max_sessions and total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+            sessions -= 1
+            total_bytes -= size
+            evicted += 1
+        return evicted
+
+    # --- SQLite ---
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A fresh connection per operation keeps this safe across gunicorn forks
+        with self._db_lock:
+            conn = sqlite3.connect(self._database, timeout=5, uri=self._uri, isolation_level=None)
+            try:
+                if not self._uri:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def _init_db(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversations (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    turns TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_last_used ON conversations (last_used)")
@@ -0,0 +1,122 @@
+import re
+from typing import List, NamedTuple
+
+from lexical_index import BM25Index
+
+# Headings we split on: knowledge-base style "--- SECTION: X ---", numbered
+# clauses ("4.", "4.2)", "Clause 4", "Section 12") and short ALL-CAPS lines.
+_HEADING_RE = re.compile(
+    r"^[ \t]*("
+    r"---\s*SECTION:\s*.+?\s*---"
+    r"|(?:clause|section|article|schedule)\s+[\dIVXivx]+[^\n]{0,100}"
+    r"|\d+(?:\.\d+)*[.)]\s+[^\n]{1,100}"
+    r"|(?-i:[A-Z][A-Z0-9 ,&'()/-]{3,80}):?"
+    r")[ \t]*$",
+    re.MULTILINE | re.IGNORECASE,
+)
+_SECTION_MARKER_RE = re.compile(r"^---\s*SECTION:\s*(.+?)\s*---$", re.IGNORECASE)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?।])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) for budgeting prompts."""
+    return len(text) // 4 + 1
+
+
+class Chunk(NamedTuple):
+    index: int
+    title: str
+    text: str
+
+
+# --- Splitting ---
+
+def _split_sections(text: str) -> List[tuple]:
+    """Split on headings; returns (title, body) pairs in document order."""
+    matches = list(_HEADING_RE.finditer(text))
+    if not matches:
+        return [("", text)]
+
+    sections = []
+    if text[:matches[0].start()].strip():
+        sections.append(("", text[:matches[0].start()]))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        heading = match.group(1).strip()
+        marker = _SECTION_MARKER_RE.match(heading)
+        title = marker.group(1) if marker else heading
+        body = text[match.start():end] if not marker else text[match.end():end]
+        sections.append((title, body))
+    return sections
+
+
+def _pack(pieces: List[str], max_chars: int, sep: str) -> List[str]:
+    """Greedily join pieces into runs no longer than max_chars."""
+    packed, current = [], ""
+    for piece in pieces:
+        candidate = f"{current}{sep}{piece}" if current else piece
+        if len(candidate) <= max_chars or not current:
+            current = candidate
+        else:
+            packed.append(current)
+            current = piece
+    if current:
+        packed.append(current)
+    return packed
+
+
+def _split_long(body: str, max_chars: int) -> List[str]:
+    parts = []
+    for paragraph in _pack(_PARAGRAPH_RE.split(body), max_chars, "\n\n"):
+        if len(paragraph) <= max_chars:
+            parts.append(paragraph)
+            continue
+        for run in _pack(_SENTENCE_RE.split(paragraph), max_chars, " "):
+            # A single run-on "sentence" still gets a hard split
+            parts.extend(run[i:i + max_chars] for i in range(0, len(run), max_chars))
+    return parts
+
+
+def split_document(text: str, max_chars: int = 2000) -> List[Chunk]:
+    """Split a document into chunks that follow its section structure where it has one."""
+    chunks: List[Chunk] = []
+    for title, body in _split_sections(text):
+        body = body.strip()
+        if not body:
+            continue
+        for part in _split_long(body, max_chars) if len(body) > max_chars else [body]:
+            part = part.strip()
+            if part:
+                chunks.append(Chunk(len(chunks), title, part))
+    return chunks
+
+
+# --- Per-Document Index ---
+
+class DocumentIndex:
+    """Chunks of one document plus a BM25 index over them, built once per document."""
+
+    def __init__(self, text: str, max_chars: int = 2000):
+        self.total_tokens = estimate_tokens(text)
+        self.chunks = split_document(text, max_chars=max_chars)
+        self.index = BM25Index([f"{c.title}\n{c.text}" for c in self.chunks])
+
+    def retrieve(self, question: str, token_budget: int, k: int = 8) -> List[Chunk]:
+        """Top-k chunks for the question that fit the budget, in document order."""
+        ranked = [self.chunks[i] for i, _ in self.index.search(question, k=k)]
+        if not ranked:
+            # Nothing matched lexically; the opening sections are the best guess
+            ranked = self.chunks[:k]
+
+        selected, used = [], 0
+        for chunk in ranked:
+            cost = estimate_tokens(chunk.text)
+            if used + cost > token_budget and selected:
+                continue
+            selected.append(chunk)
+            used += cost
+        return sorted(selected, key=lambda c: c.index)
+
+    def size_bytes(self) -> int:
+        return sum(len(c.text.encode("utf-8")) for c in self.chunks) + self.index.size_bytes()
@@ -0,0 +1,270 @@
+"""
+Server-side ingestion of uploaded PDF and text documents.
+
+Uploads arrive as multipart files, which the web framework spools to disk
+past a small size, so nothing here holds the raw upload in memory. Text is
+extracted one page at a time and passed through a generator pipeline:
+
+    pages (pdf_pages / text_pages) -> normalize_page -> strip_running_lines
+
+and only the normalized text is kept, stopping as soon as it exceeds the
+document store's size limit.
+
+Ingestion is content-addressed twice over. The upload's hash is recorded as
+an alias of the resulting document, so the same file uploaded again returns
+at once without re-extracting. The document id is the hash of the extracted
+text (document_store.document_id_for), so the same agreement from different
+files also ends up as one document. Chunking (Vakil's index) and answers
+(the response cache) are keyed on that document, so they are done once too.
+"""
+import codecs
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional
+
+from document_store import DocumentStore, document_id_for
+
+_READ_CHUNK = 64 * 1024
+
+# Page-level cleanup
+_HYPHEN_BREAK_RE = re.compile(r"([a-z])-\n([a-z])")
+_SPACES_RE = re.compile(r"[ \t\u00a0\u2000-\u200a\u202f\u3000]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_CONTROL_RE = re.compile(r"[\u00ad\u200b\ufeff\x00-\x08\x0b\x0e-\x1f]")
+
+# Lines that are only a page number: "3", "- 3 -", "Page 3", "Page 3 of 10", "3/10"
+_PAGE_NUMBER_RE = re.compile(r"^[-\s]*(?:page\s*)?\d+(?:\s*(?:of|/)\s*\d+)?[-\s]*$", re.IGNORECASE)
+_DIGITS_RE = re.compile(r"\d+")
+
+# Lines at the top and bottom of a page that may be running headers or footers
+RUNNING_LINES = 2
+# Headers and footers are short; longer lines are always body text
+RUNNING_MAX_CHARS = 100
+# Pages buffered to learn which of those lines repeat
+RUNNING_WINDOW = 4
+
+
+class UnsupportedDocument(ValueError):
+    """The upload is not a PDF or text file, or no text could be extracted from it."""
+
+
+class DocumentTooLarge(ValueError):
+    """The upload or its extracted text exceeds the configured limits."""
+
+
+# --- Page Sources ---
+
+def pdf_pages(stream: IO[bytes]) -> Iterator[str]:
+    """Text of each PDF page in order; pages are parsed lazily as they are read."""
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError:
+        raise UnsupportedDocument("PDF support is not installed on this server")
+    try:
+        reader = PdfReader(stream)
+        if reader.is_encrypted and not reader.decrypt(""):
+            raise UnsupportedDocument("The PDF is password protected")
+        for page in reader.pages:
+            yield page.extract_text() or ""
+    except PdfReadError as e:
+        raise UnsupportedDocument(f"Could not read the PDF: {e}")
+
+
+def text_pages(stream: IO[bytes], page_chars: int = _READ_CHUNK) -> Iterator[str]:
+    """Pages of a UTF-8 text upload: split on form feeds, or at a line break every page_chars."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    while True:
+        data = stream.read(_READ_CHUNK)
+        buffer += decoder.decode(data, final=not data)
+        *pages, buffer = buffer.split("\f")
+        yield from pages
+        while len(buffer) > page_chars:
+            cut = buffer.rfind("\n", 0, page_chars)
+            cut = cut + 1 if cut > 0 else page_chars
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+        if not data:
+            break
+    if buffer:
+        yield buffer
+
+
+# --- Normalization ---
+
+def normalize_page(text: str) -> str:
+    """Whitespace cleanup that keeps line structure (headings are detected per line)."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _CONTROL_RE.sub("", text)
+    # Words hyphenated across a line break in the PDF layout
+    text = _HYPHEN_BREAK_RE.sub(r"\1\2", text)
+    lines = (_SPACES_RE.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _line_key(line: str) -> str:
+    line = line.lower()
+    # "Page 3 of 10 | Confidential" and "Page 4 of 10 | Confidential" are the same running line,
+    # but numbered headings ("Clause 3.") are not
+    return _DIGITS_RE.sub("#", line) if "page" in line else line
+
+
+def _edge_lines(lines: List[str]) -> set:
+    """Indexes of the top and bottom text lines, the only ones that can be headers or footers."""
+    text_lines = [i for i, line in enumerate(lines) if line]
+    edge = min(RUNNING_LINES, len(text_lines) // 2)
+    return {i for i in text_lines[:edge] + text_lines[len(text_lines) - edge:]
+            if len(lines[i]) <= RUNNING_MAX_CHARS}
+
+
+def _edge_keys(page: str) -> set:
+    lines = page.split("\n")
+    return {_line_key(lines[i]) for i in _edge_lines(lines)}
+
+
+def _strip_page(page: str, running: set) -> str:
+    lines = page.split("\n")
+    edge = _edge_lines(lines)
+    kept = [
+        line for i, line in enumerate(lines)
+        if not (i in edge and (_PAGE_NUMBER_RE.match(line) or _line_key(line) in running))
+    ]
+    return "\n".join(kept).strip()
+
+
+def strip_running_lines(pages: Iterable[str], window: int = RUNNING_WINDOW) -> Iterator[str]:
+    """
+    Drop page numbers and running headers/footers.
+
+    A short top or bottom line counts as running if it appears on at least two
+    of the first `window` pages; only those pages are buffered.
+    """
+    pages = iter(pages)
+    head: List[str] = []
+    for page in pages:
+        head.append(page)
+        if len(head) >= window:
+            break
+    counts = Counter(key for page in head for key in _edge_keys(page))
+    running = {key for key, n in counts.items() if n >= 2} if len(head) > 1 else set()
+    for page in head:
+        yield _strip_page(page, running)
+    for page in pages:
+        yield _strip_page(page, running)
+
+
+def extract_pages(stream: IO[bytes], kind: str) -> Iterator[str]:
+    """Normalized text of each page of an upload of `kind` ("pdf" or "text")."""
+    pages = pdf_pages(stream) if kind == "pdf" else text_pages(stream)
+    return strip_running_lines(normalize_page(page) for page in pages)
+
+
+def upload_kind(head: bytes, content_type: Optional[str], filename: Optional[str]) -> str:
+    """"pdf" or "text" from the file's first bytes, falling back to its declared type."""
+    if not head:
+        raise UnsupportedDocument("The uploaded file is empty")
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    name = (filename or "").lower()
+    if (content_type or "").startswith("text/") or name.endswith((".txt", ".md")):
+        return "text"
+    raise UnsupportedDocument("Upload a PDF or a plain text file")
+
+
+# --- Ingestor ---
+
+class IngestResult(NamedTuple):
+    document_id: str
+    characters: int
+    pages: int
+    # "upload" when this exact file was ingested before, "content" when the same text was
+    deduplicated: Optional[str]
+
+
+class DocumentIngestor:
+    """Extracts uploads into the document store, once per distinct file and text."""
+
+    def __init__(self, document_store: DocumentStore, max_upload_bytes: int = 20 * 1024 * 1024):
+        self.document_store = document_store
+        self.max_upload_bytes = max_upload_bytes
+        self._lock = threading.Lock()
+        self._counters = {
+            "uploads": 0,
+            "upload_dedup_hits": 0,
+            "content_dedup_hits": 0,
+            "pages": 0,
+            "extraction_seconds": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls, document_store: DocumentStore) -> "DocumentIngestor":
+        return cls(document_store, int(os.getenv("INGEST_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024))))
+
+    def ingest(self, stream: IO[bytes], content_type: Optional[str] = None,
+               filename: Optional[str] = None) -> IngestResult:
+        """
+        Extract a seekable upload stream and store the text. Raises
+        DocumentTooLarge or UnsupportedDocument.
+        """
+        upload_hash = self._hash_upload(stream)
+        self._count("uploads")
+        document = self.document_store.get_by_alias(upload_hash)
+        if document is not None:
+            self._count("upload_dedup_hits")
+            return IngestResult(document.document_id, len(document.text), 0, "upload")
+
+        kind = upload_kind(stream.read(8), content_type, filename)
+        stream.seek(0)
+        started = time.perf_counter()
+        parts, size, pages = [], 0, 0
+        for page in extract_pages(stream, kind):
+            pages += 1
+            if not page:
+                continue
+            size += len(page.encode("utf-8")) + 2
+            # Stop early rather than extract text the store would refuse anyway
+            if size > self.document_store.max_document_bytes:
+                raise DocumentTooLarge(f"Document exceeds {self.document_store.max_document_bytes} bytes of text")
+            parts.append(page)
+        text = "\n\n".join(parts)
+        with self._lock:
+            self._counters["pages"] += pages
+            self._counters["extraction_seconds"] += time.perf_counter() - started
+        if not text:
+            raise UnsupportedDocument("No text found; scanned PDFs are not supported")
+
+        deduplicated = None
+        if self.document_store.get(document_id_for(text)) is not None:
+            self._count("content_dedup_hits")
+            deduplicated = "content"
+        document_id = self.document_store.put(text)
+        self.document_store.put_alias(upload_hash, document_id)
+        return IngestResult(document_id, len(text), pages, deduplicated)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["extraction_seconds"] = round(stats["extraction_seconds"], 4)
+        return stats
+
+    def _hash_upload(self, stream: IO[bytes]) -> str:
+        digest, size = hashlib.sha256(), 0
+        while True:
+            data = stream.read(_READ_CHUNK)
+            if not data:
+                break
+            size += len(data)
+            if size > self.max_upload_bytes:
+                raise DocumentTooLarge(f"Upload exceeds {self.max_upload_bytes} bytes")
+            digest.update(data)
+        stream.seek(0)
+        return f"upload:{digest.hexdigest()}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+# --- Stored Document ---
+
+class StoredDocument:
+    """A user document plus anything derived from it (chunks, indexes, ...)."""
+
+    def __init__(self, document_id: str, text: str, expires_at: float):
+        self.document_id = document_id
+        self.text = text
+        self.expires_at = expires_at
+        self.derived: Dict[str, Any] = {}
+        self.derived_bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        # Python str overhead is ignored; UTF-8 length is a stable estimate
+        return len(self.text.encode("utf-8")) + self.derived_bytes
+
+
+def document_id_for(text: str) -> str:
+    """Documents are content-addressed, so re-uploading the same text is free."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# --- Bounded Document Store ---
+
+class DocumentStore:
+    """
+    LRU/TTL document store bounded by entry count and total bytes.
+
+    Documents are kept in process memory for fast access. When disk_path is
+    set, the raw text is also written to SQLite so a document uploaded through
+    one gunicorn worker can be read by the others. Derived data is per-process
+    and is rebuilt on demand.
+
+    Documents are shared by everyone who uploads the same text, so they are
+    only removed by expiry and eviction, never on a client's request.
+    """
+
+    def __init__(
+        self,
+        max_documents: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 2 * 3600,
+        max_document_bytes: int = 2 * 1024 * 1024,
+        disk_path: Optional[str] = None,
+    ):
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_document_bytes = max_document_bytes
+        self.disk_path = disk_path
+
+        self._documents: "OrderedDict[str, StoredDocument]" = OrderedDict()
+        # Other keys for a document, e.g. the hash of the uploaded file it was extracted from
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"puts": 0, "hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if self.disk_path:
+            self._init_disk()
+
+    @classmethod
+    def from_env(cls) -> "DocumentStore":
+        """Build a store from DOCUMENT_STORE_* environment variables."""
+        return cls(
+            max_documents=int(os.getenv("DOCUMENT_STORE_MAX_DOCUMENTS", "256")),
+            max_bytes=int(os.getenv("DOCUMENT_STORE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("DOCUMENT_STORE_TTL_SECONDS", str(2 * 3600))),
+            max_document_bytes=int(os.getenv("DOCUMENT_STORE_MAX_DOCUMENT_BYTES", str(2 * 1024 * 1024))),
+            disk_path=os.getenv("DOCUMENT_STORE_PATH") or None,
+        )
+
+    # --- Public API ---
+
+    def put(self, text: str) -> str:
+        """Store a document and return its id. Raises ValueError if it is too large."""
+        if len(text.encode("utf-8")) > self.max_document_bytes:
+            raise ValueError(f"Document exceeds {self.max_document_bytes} bytes")
+
+        document_id = document_id_for(text)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._counters["puts"] += 1
+            existing = self._documents.get(document_id)
+            if existing is not None:
+                existing.expires_at = expires_at
+                self._documents.move_to_end(document_id)
+            else:
+                self._insert(StoredDocument(document_id, text, expires_at))
+        if self.disk_path:
+            self._disk_put(document_id, text, expires_at)
+        return document_id
+
+    def get(self, document_id: str) -> Optional[StoredDocument]:
+        """Return the document and refresh its TTL, or None if unknown/expired."""
+        now = time.time()
+        with self._lock:
+            doc = self._documents.get(document_id)
+            if doc is not None and doc.expires_at > now:
+                doc.expires_at = now + self.ttl_seconds
+                self._documents.move_to_end(document_id)
+                self._counters["hits"] += 1
+                return doc
+            if doc is not None:
+                self._remove(document_id)
+
+        text = self._disk_get(document_id, now) if self.disk_path else None
+        with self._lock:
+            if text is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            doc = self._documents.get(document_id)
+            if doc is None:
+                doc = StoredDocument(document_id, text, now + self.ttl_seconds)
+                self._insert(doc)
+            return doc
+
+    def get_text(self, document_id: str) -> Optional[str]:
+        doc = self.get(document_id)
+        return doc.text if doc else None
+
+    def get_derived(self, document_id: str, key: str) -> Optional[Any]:
+        with self._lock:
+            doc = self._documents.get(document_id)
+            return doc.derived.get(key) if doc else None
+
+    def put_derived(self, document_id: str, key: str, value: Any, size_bytes: int) -> None:
+        """Attach derived data to a resident document, counting it toward the memory cap."""
+        with self._lock:
+            doc = self._documents.get(document_id)
+            if doc is None:
+                return
+            self._total_bytes -= doc.size_bytes
+            doc.derived[key] = value
+            doc.derived_bytes += size_bytes
+            self._total_bytes += doc.size_bytes
+            self._evict_over_budget()
+
+    def put_alias(self, alias: str, document_id: str) -> None:
+        """Record another key (e.g. an upload hash) for a stored document."""
+        with self._lock:
+            self._aliases[alias] = document_id
+            self._aliases.move_to_end(alias)
+            while len(self._aliases) > self.max_documents * 4:
+                self._aliases.popitem(last=False)
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO document_aliases (alias, id) VALUES (?, ?)", (alias, document_id)
+                    )
+            except sqlite3.Error as e:
+                print(f"Document store disk error: {e}")
+
+    def get_by_alias(self, alias: str) -> Optional[StoredDocument]:
+        """The document recorded under `alias`, if it is still stored."""
+        with self._lock:
+            document_id = self._aliases.get(alias)
+        if document_id is None and self.disk_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT id FROM document_aliases WHERE alias = ?", (alias,)).fetchone()
+                document_id = row[0] if row else None
+            except sqlite3.Error as e:
+                print(f"Document store disk error: {e}")
+        return self.get(document_id) if document_id else None
+
+    def delete(self, document_id: str) -> None:
+        with self._lock:
+            if document_id in self._documents:
+                self._remove(document_id)
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            except sqlite3.Error as e:
+                print(f"Document store disk error: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["documents"] = len(self._documents)
+            stats["bytes"] = self._total_bytes
+        return stats
+
+    # --- Memory Tier (call with lock held) ---
+
+    def _insert(self, doc: StoredDocument) -> None:
+        self._documents[doc.document_id] = doc
+        self._total_bytes += doc.size_bytes
+        self._evict_over_budget()
+
+    def _remove(self, document_id: str) -> None:
+        doc = self._documents.pop(document_id)
+        self._total_bytes -= doc.size_bytes
+
+    def _evict_over_budget(self) -> None:
+        # Never evict the most recent entry, so a single large document still fits
+        while len(self._documents) > 1 and (
+            len(self._documents) > self.max_documents or self._total_bytes > self.max_bytes
+        ):
+            document_id = next(iter(self._documents))
+            self._remove(document_id)
+            self._counters["evictions"] += 1
+
+    # --- Disk Tier (SQLite, shared across workers) ---
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.disk_path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_disk(self) -> None:
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    id TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS document_aliases (
+                    alias TEXT PRIMARY KEY,
+                    id TEXT NOT NULL
+                )
+                """
+            )
+
+    def _disk_put(self, document_id: str, text: str, expires_at: float) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (id, text, expires_at) VALUES (?, ?, ?)",
+                    (document_id, text, expires_at),
+                )
+                conn.execute("DELETE FROM documents WHERE expires_at <= ?", (time.time(),))
+                conn.execute("DELETE FROM document_aliases WHERE id NOT IN (SELECT id FROM documents)")
+        except sqlite3.Error as e:
+            print(f"Document store disk error: {e}")
+
+    def _disk_get(self, document_id: str, now: float) -> Optional[str]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT text FROM documents WHERE id = ? AND expires_at > ?",
+                    (document_id, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE documents SET expires_at = ? WHERE id = ?",
+                        (now + self.ttl_seconds, document_id),
+                    )
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Document store disk error: {e}")
+            return None
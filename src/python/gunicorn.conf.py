@@ -0,0 +1,31 @@
+"""
+Gunicorn settings for the sync Flask app:
+
+    gunicorn -c gunicorn.conf.py --workers 4 --bind 0.0.0.0:$PORT app:app
+"""
+
+
+def when_ready(server):
+    # Import the app once in the master so workers fork with it already loaded,
+    # instead of each worker paying for the import on a cold start. This runs
+    # after the listening socket is bound (preload_app and on_starting run
+    # before it, delaying the bind by the ~1.5s import), and workers are only
+    # spawned afterwards, so they still share these pages. app.py leaves the
+    # Gemini client import lazy, so it is imported here too.
+    import app  # noqa: F401
+    import langchain_google_genai  # noqa: F401
+
+
+def post_fork(server, worker):
+    # The Gemini client holds gRPC channels, which must not cross a fork, so
+    # each worker creates its own client and compiles its chains before it
+    # takes requests.
+    from app import rag_handler
+    if rag_handler is None:
+        return
+    try:
+        seconds = rag_handler.warm_up()
+        server.log.info(f"Worker {worker.pid} warmed up in {seconds:.2f}s")
+    except Exception as e:
+        # e.g. no credentials: still serve (and fail per request) rather than crash-loop
+        server.log.warning(f"Error in warm_up: {e}")
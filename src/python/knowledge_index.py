@@ -0,0 +1,170 @@
+"""
+Local BM25 retrieval over the knowledge_base/*.txt sections.
+
+The know-your-rights prompt is grounded in the most relevant sections, found
+without embeddings or any network call. Sources are split on their
+"--- SECTION: ... ---" markers and indexed with section titles weighted
+double. Hindi (and Hinglish) queries are expanded through a small legal
+glossary so they match the English texts.
+
+The index is built at startup (the corpus is small), or loaded from
+KB_LEXICAL_INDEX_PATH if that file was built from the same sources:
+
+    python knowledge_index.py    # build or refresh the file, e.g. in the Dockerfile
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from lexical_index import TOKENIZER_VERSION, BM25Index, normalize_token, tokenize
+
+KB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base")
+
+_TITLE_RE = re.compile(r"^TITLE:\s*(.+)$", re.MULTILINE)
+_SECTION_RE = re.compile(r"^---\s*SECTION:\s*(.+?)\s*---\s*$", re.MULTILINE)
+
+# Hindi, romanized Hindi and informal English terms -> terms used in the knowledge base
+QUERY_GLOSSARY = {
+    # Tenancy
+    "किराया": "rent", "किराये": "rent", "किरायेदार": "tenant tenancy", "भाड़ा": "rent",
+    "मकान": "landlord premises property", "मालिक": "landlord owner", "मकानमालिक": "landlord",
+    "जमा": "deposit", "जमानत": "deposit", "सिक्योरिटी": "security deposit", "डिपॉजिट": "deposit",
+    "एडवांस": "deposit", "बेदखल": "evict eviction", "बेदखली": "eviction", "निकाल": "evict",
+    "खाली": "vacate vacated", "अनुबंध": "agreement contract", "एग्रीमेंट": "agreement",
+    "करार": "agreement", "रजिस्ट्रेशन": "registered", "पंजीकरण": "registered",
+    "मरम्मत": "repairs maintenance", "पानी": "water", "बिजली": "electricity",
+    "गोपनीयता": "privacy", "निजता": "privacy", "बढ़ोतरी": "increase", "वृद्धि": "increase",
+    "kiraya": "rent", "kirayedar": "tenant", "makan": "landlord", "malik": "landlord owner",
+    # Employment
+    "वेतन": "salary wages", "तनख्वाह": "salary wages", "सैलरी": "salary", "मजदूरी": "wages",
+    "नौकरी": "employment employee job", "कर्मचारी": "employee", "नियोक्ता": "employer",
+    "कंपनी": "employer company", "घंटे": "hours", "ओवरटाइम": "overtime", "छुट्टी": "leave holidays",
+    "अवकाश": "leave holidays", "मातृत्व": "maternity", "उत्पीड़न": "harassment",
+    "सुरक्षा": "safety safe", "बर्खास्त": "termination terminated", "निकाला": "termination",
+    "इस्तीफा": "resignation notice", "नोटिस": "notice", "ग्रेच्युटी": "gratuity",
+    "tankhwah": "salary", "naukri": "employment job", "chhutti": "leave",
+    # Consumer protection
+    "उपभोक्ता": "consumer", "ग्राहक": "consumer", "शिकायत": "complaint", "रिफंड": "refund",
+    "वापसी": "refund", "खराब": "defective", "दोषपूर्ण": "defective", "सामान": "goods",
+    "सेवा": "services", "ऑनलाइन": "e-commerce online", "विज्ञापन": "advertisement advertisements",
+    "भ्रामक": "misleading", "धोखा": "unfair misleading", "आयोग": "commission",
+    "मुआवजा": "compensation", "अदालत": "court", "कोर्ट": "court",
+    # Everyday English that the texts phrase formally
+    "fire": "termination", "fired": "termination", "sacked": "termination", "boss": "employer",
+    "owner": "landlord", "pay": "salary wages", "paid": "salary wages", "kicked": "evict",
+}
+
+_GLOSSARY = {normalize_token(term): tokenize(english) for term, english in QUERY_GLOSSARY.items()}
+
+
+class KnowledgeSection(NamedTuple):
+    source: str
+    title: str
+    text: str
+
+
+def split_sections(source: str, text: str) -> List[KnowledgeSection]:
+    """Sections of one knowledge base file; text before the first marker is skipped."""
+    title_match = _TITLE_RE.search(text)
+    document_title = title_match.group(1).strip() if title_match else source
+    markers = list(_SECTION_RE.finditer(text))
+    sections = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        body = text[marker.end():end].strip()
+        if body:
+            sections.append(KnowledgeSection(source, f"{document_title}: {marker.group(1)}", body))
+    return sections
+
+
+def expand_query(query: str) -> set:
+    """Query terms plus the knowledge base terms that glossary entries map them to."""
+    terms = set(tokenize(query))
+    for term in list(terms):
+        terms.update(_GLOSSARY.get(term, ()))
+    return terms
+
+
+def canonical_terms(query: str) -> set:
+    """Query terms with glossary entries replaced by the knowledge base terms they map to."""
+    terms = set()
+    for term in tokenize(query):
+        terms.update(_GLOSSARY.get(term, (term,)))
+    return terms
+
+
+def source_manifest(kb_dir: str = KB_DIR) -> dict:
+    files = {}
+    for path in sorted(glob.glob(os.path.join(kb_dir, "*.txt"))):
+        with open(path, "rb") as f:
+            files[os.path.basename(path)] = hashlib.sha256(f.read()).hexdigest()
+    return {"tokenizer_version": TOKENIZER_VERSION, "files": files}
+
+
+# --- Knowledge Index ---
+
+class KnowledgeIndex:
+    """BM25 over knowledge base sections; search() returns the best sections."""
+
+    def __init__(self, sections: List[KnowledgeSection], bm25: Optional[BM25Index] = None):
+        self.sections = sections
+        # Titles are repeated so a match in a section heading counts double
+        self.bm25 = bm25 or BM25Index([f"{s.title}\n{s.title}\n{s.text}" for s in sections])
+
+    @classmethod
+    def build(cls, kb_dir: str = KB_DIR) -> "KnowledgeIndex":
+        sections = []
+        for path in sorted(glob.glob(os.path.join(kb_dir, "*.txt"))):
+            with open(path, encoding="utf-8") as f:
+                sections.extend(split_sections(os.path.basename(path), f.read()))
+        return cls(sections)
+
+    @classmethod
+    def load_or_build(cls, path: Optional[str] = None, kb_dir: str = KB_DIR) -> "KnowledgeIndex":
+        """Load the index saved at `path` if it matches the sources, else build (and save) it."""
+        manifest = source_manifest(kb_dir)
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data["manifest"] == manifest:
+                    sections = [KnowledgeSection(*s) for s in data["sections"]]
+                    return cls(sections, BM25Index.from_dict(data["bm25"]))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Error in KnowledgeIndex.load_or_build: {e}")
+        index = cls.build(kb_dir)
+        if path:
+            index.save(path, manifest)
+        return index
+
+    @classmethod
+    def from_env(cls) -> "KnowledgeIndex":
+        return cls.load_or_build(os.getenv("KB_LEXICAL_INDEX_PATH") or None)
+
+    def save(self, path: str, manifest: dict) -> None:
+        data = {
+            "manifest": manifest,
+            "sections": [list(s) for s in self.sections],
+            "bm25": self.bm25.to_dict(),
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error in KnowledgeIndex.save: {e}")
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0) -> List[Tuple[KnowledgeSection, float]]:
+        hits = self.bm25.search_terms(expand_query(query), k)
+        return [(self.sections[doc_id], score) for doc_id, score in hits if score > min_score]
+
+
+if __name__ == "__main__":
+    path = os.getenv("KB_LEXICAL_INDEX_PATH") or os.path.join(os.path.dirname(KB_DIR), "kb_lexical_index.json")
+    index = KnowledgeIndex.load_or_build(path)
+    print(f"Knowledge index with {len(index.sections)} sections at {path}")
@@ -0,0 +1,130 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+# Word characters plus Devanagari vowel signs and viramas, which \w alone splits on
+_TOKEN_RE = re.compile(r"[\w\u0900-\u097F]+")
+_DEVANAGARI_RE = re.compile(r"[\u0900-\u097F]")
+
+# Bump when tokenization changes, so indexes saved to disk are rebuilt
+TOKENIZER_VERSION = "2"
+
+# Very common English and Hindi words that add noise to lexical scores
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in into is it its my "
+    "no not of on or so that the their then there these they this to was were "
+    "what when which who will with you your "
+    "का की के को में से है हैं और या पर क्या मैं मेरा मेरी मेरे यह वह ये वे कि "
+    "तो भी था थी थे हो कर ने एक लिए नहीं कैसे क्यों कब कौन अपना अपनी अपने आप हम "
+    "रहा रही रहे गया गई गए सकता सकती सकते चाहिए".split()
+)
+
+# Inflectional Hindi suffixes, longest first (a light stemmer in the style of
+# Ramanathan & Rao), so e.g. किरायेदारों and किरायेदार match
+_HINDI_SUFFIXES = sorted(
+    "ों ें ाओं ाएं ाएँ ियों ियां ियाँ ी ा े ो ि ु ू".split(),
+    key=len, reverse=True,
+)
+
+
+def _normalize_hindi(token: str) -> str:
+    # Nukta and chandrabindu are spelled inconsistently, so fold them away
+    token = token.replace("\u093c", "").replace("\u0901", "\u0902")
+    for suffix in _HINDI_SUFFIXES:
+        if len(token) > len(suffix) + 1 and token.endswith(suffix):
+            return token[: -len(suffix)]
+    return token
+
+
+def _normalize_english(token: str) -> str:
+    # Plurals only; enough for "deposits"/"deposit" without a full stemmer
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def normalize_token(token: str) -> str:
+    if _DEVANAGARI_RE.search(token):
+        return _normalize_hindi(token)
+    return _normalize_english(token)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, lightly stemmed word tokens with English and Hindi stopwords removed."""
+    return [
+        normalize_token(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS
+    ]
+
+
+# --- BM25 Index ---
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of texts, stored as an inverted index.
+
+    A term's BM25 contribution to a document depends only on the corpus, so
+    each posting stores its precomputed impact and a search just sums the
+    impacts in the query terms' postings.
+    """
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_count = len(texts)
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+
+        term_counts = [Counter(tokenize(text)) for text in texts]
+        doc_lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(doc_lengths) / self.doc_count if self.doc_count else 0.0) or 1.0
+
+        frequencies: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, counts in enumerate(term_counts):
+            for term, tf in counts.items():
+                frequencies.setdefault(term, []).append((doc_id, tf))
+
+        for term, postings in frequencies.items():
+            idf = math.log(1 + (self.doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            self.postings[term] = [
+                (doc_id, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_lengths[doc_id] / avg_length)))
+                for doc_id, tf in postings
+            ]
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """Return up to k (doc_id, score) pairs with a positive score, best first."""
+        return self.search_terms(set(tokenize(query)), k)
+
+    def search_terms(self, terms, k: int = 5) -> List[Tuple[int, float]]:
+        """Like search, for callers that tokenize (or expand) the query themselves."""
+        scores: Dict[int, float] = {}
+        for term in terms:
+            for doc_id, impact in self.postings.get(term, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + impact
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+    def size_bytes(self) -> int:
+        """Rough memory estimate, used for store accounting."""
+        entries = sum(len(p) for p in self.postings.values())
+        return entries * 64 + sum(len(t) + 64 for t in self.postings)
+
+    # --- Serialization ---
+
+    def to_dict(self) -> dict:
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_count": self.doc_count,
+            "postings": {term: [[d, round(w, 6)] for d, w in p] for term, p in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        index = cls.__new__(cls)
+        index.k1 = data["k1"]
+        index.b = data["b"]
+        index.doc_count = data["doc_count"]
+        index.postings = {term: [(d, w) for d, w in p] for term, p in data["postings"].items()}
+        return index
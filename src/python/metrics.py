@@ -0,0 +1,468 @@
+"""
+Per-request latency breakdown and Prometheus-style metrics.
+
+Every HTTP request gets a RequestTrace (set by the WSGI/ASGI middleware).
+Code on the request path records named stages into it:
+
+    with stage("chain_assembly"):
+        chain = self._rights_chain()
+    chain.invoke(question, config=run_config())
+
+run_config() attaches a LangChain callback handler that times the prompt,
+LLM and output-parser steps of a chain and counts LLM tokens; LLM latency,
+tokens and cost are labelled with the model tier from the run metadata that
+model_router sets (ModelTier.metadata()). Stages feed
+histograms, and with slow_request_seconds set, requests slower than that are
+logged with their per-stage breakdown.
+
+Each worker keeps its own counters. When METRICS_DIR is set, workers write
+snapshots there and /metrics sums them, so one scrape covers the whole
+container. Snapshots of workers that have exited are kept, so totals survive
+worker restarts.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from document_chunks import estimate_tokens
+
+# Histogram buckets (seconds), from in-process steps up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_HELP = {
+    "legalmate_request_seconds": ("histogram", "HTTP request latency, including streamed bodies."),
+    "legalmate_stage_seconds": ("histogram", "Time spent in each stage of a LegalRAG operation."),
+    "legalmate_llm_tokens_total": ("counter", "LLM tokens by direction (usage metadata, else estimated)."),
+    "legalmate_llm_seconds": ("histogram", "LLM call latency by model tier."),
+    "legalmate_llm_cost_usd_total": ("counter", "Estimated LLM cost in USD by model tier."),
+    "legalmate_slow_requests_total": ("counter", "Requests slower than SLOW_REQUEST_SECONDS."),
+}
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """Stages and token counts recorded while serving one request."""
+
+    def __init__(self, metrics: "Metrics", route: str = "unmatched"):
+        self.metrics = metrics
+        self.route = route
+        self.operation: Optional[str] = None
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.tokens = {"input": 0, "output": 0}
+        self.cost_usd = 0.0
+        self.tiers: List[str] = []
+        self._callbacks: Optional[list] = None
+
+    @property
+    def callbacks(self) -> list:
+        # Built on first use so importing this module doesn't pull in LangChain
+        if self._callbacks is None:
+            self._callbacks = [_stage_callback_handler_class()(self)]
+        return self._callbacks
+
+    def record_stage(self, name: str, seconds: float) -> None:
+        self.stages.append((name, seconds))
+        labels = {"operation": self.operation or "none", "stage": name}
+        self.metrics.observe("legalmate_stage_seconds", labels, seconds)
+
+    def record_tokens(self, direction: str, count: int, tier: str = "default") -> None:
+        if count <= 0:
+            return
+        self.tokens[direction] += count
+        labels = {"operation": self.operation or "none", "direction": direction, "tier": tier}
+        self.metrics.inc("legalmate_llm_tokens_total", labels, count)
+
+    def record_llm(self, seconds: float, input_tokens: int, output_tokens: int, metadata: Optional[dict]) -> None:
+        """One finished LLM call; `metadata` is the run metadata set by the model router."""
+        metadata = metadata or {}
+        tier = metadata.get("model_tier", "default")
+        self.tiers.append(tier)
+        labels = {"operation": self.operation or "none", "tier": tier}
+        self.metrics.observe("legalmate_llm_seconds", labels, seconds)
+        self.record_tokens("input", input_tokens, tier)
+        self.record_tokens("output", output_tokens, tier)
+        cost = (
+            input_tokens * metadata.get("usd_per_million_input", 0.0)
+            + output_tokens * metadata.get("usd_per_million_output", 0.0)
+        ) / 1_000_000
+        if cost > 0:
+            self.cost_usd += cost
+            self.metrics.inc("legalmate_llm_cost_usd_total", labels, cost)
+
+    def breakdown(self) -> Dict[str, dict]:
+        """Total seconds and count per stage (batched calls record a stage several times)."""
+        totals: Dict[str, dict] = {}
+        for name, seconds in self.stages:
+            entry = totals.setdefault(name, {"seconds": 0.0, "count": 0})
+            entry["seconds"] = round(entry["seconds"] + seconds, 4)
+            entry["count"] += 1
+        return totals
+
+
+# --- Recording Helpers (no-ops outside a request) ---
+
+@contextmanager
+def stage(name: str):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.record_stage(name, time.perf_counter() - started)
+
+
+def run_config(**config) -> dict:
+    """LangChain run config with the stage-timing callbacks of the current request."""
+    trace = _current_trace.get()
+    if trace is not None:
+        config["callbacks"] = trace.callbacks
+    return config
+
+
+def traced(operation: str):
+    """Label the current request's stages with a LegalRAG operation name."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.operation = operation
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def set_route(route: Optional[str]) -> None:
+    """Called once the web framework has matched the request to a route."""
+    trace = _current_trace.get()
+    if trace is not None and route:
+        trace.route = route
+
+
+@functools.lru_cache(maxsize=None)
+def _stage_callback_handler_class():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class _StageCallbackHandler(BaseCallbackHandler):
+        """
+        Times prompt formatting, LLM calls and output parsing inside chains.
+
+        For streamed calls the parser consumes chunks as they arrive, so its time
+        overlaps the LLM stage rather than following it.
+        """
+
+        # Run in the caller's thread/task so timings aren't skewed by an executor hop
+        run_inline = True
+
+        _STAGES = {"prompt": "prompt", "parser": "parse"}
+
+        def __init__(self, trace: RequestTrace):
+            self.trace = trace
+            self._runs: dict = {}
+
+        def _start(self, run_id, name: str, input_tokens: int = 0, metadata: Optional[dict] = None) -> None:
+            self._runs[run_id] = (name, time.perf_counter(), input_tokens, metadata)
+
+        def _end(self, run_id):
+            run = self._runs.pop(run_id, None)
+            if run is not None:
+                self.trace.record_stage(run[0], time.perf_counter() - run[1])
+            return run
+
+        def on_chain_start(self, serialized, inputs, *, run_id, run_type=None, **kwargs):
+            if run_type in self._STAGES:
+                self._start(run_id, self._STAGES[run_type])
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+            prompt_tokens = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+            self._start(run_id, "llm", prompt_tokens, metadata)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            run = self._end(run_id)
+            if run is None:
+                return
+            seconds = time.perf_counter() - run[1]
+            usage = _usage_metadata(response)
+            if usage:
+                input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+            else:
+                input_tokens, output_tokens = run[2], _estimate_output_tokens(response)
+            self.trace.record_llm(seconds, input_tokens, output_tokens, run[3])
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id)
+
+    return _StageCallbackHandler
+
+
+def _usage_metadata(response) -> Optional[dict]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage
+    return None
+
+
+def _estimate_output_tokens(response) -> int:
+    total = 0
+    for generations in response.generations:
+        for generation in generations:
+            total += estimate_tokens(generation.text or "")
+            for call in getattr(getattr(generation, "message", None), "tool_calls", None) or []:
+                total += estimate_tokens(json.dumps(call.get("args", {}), ensure_ascii=False))
+    return total
+
+
+# --- Metric Registry ---
+
+def _label_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """Counters and histograms for one worker, rendered in Prometheus text format."""
+
+    def __init__(
+        self,
+        metrics_dir: Optional[str] = None,
+        slow_request_seconds: float = 0,
+        flush_interval: float = 5.0,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.metrics_dir = metrics_dir
+        self.slow_request_seconds = slow_request_seconds
+        self.flush_interval = flush_interval
+        self.buckets = buckets
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+
+        self._counters: dict = {}
+        # (name, labels) -> [per-bucket counts..., +Inf count, sum, count]
+        self._histograms: dict = {}
+        self._lock = threading.Lock()
+        self._flusher_pid: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        return cls(
+            metrics_dir=os.getenv("METRICS_DIR") or None,
+            slow_request_seconds=float(os.getenv("SLOW_REQUEST_SECONDS", "0")),
+            flush_interval=float(os.getenv("METRICS_FLUSH_SECONDS", "5")),
+        )
+
+    def inc(self, name: str, labels: dict, amount: float = 1) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 3)
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    # --- Request Lifecycle ---
+
+    def start_request(self) -> Tuple[RequestTrace, contextvars.Token]:
+        trace = RequestTrace(self)
+        return trace, _current_trace.set(trace)
+
+    def finish_request(self, trace: RequestTrace, status: int) -> None:
+        seconds = time.perf_counter() - trace.started
+        self.observe("legalmate_request_seconds", {"route": trace.route, "status": status}, seconds)
+        if self.slow_request_seconds and seconds >= self.slow_request_seconds:
+            self.inc("legalmate_slow_requests_total", {"route": trace.route})
+            print("Slow request: " + json.dumps({
+                "route": trace.route,
+                "operation": trace.operation,
+                "status": status,
+                "seconds": round(seconds, 4),
+                "stages": trace.breakdown(),
+                "tokens": trace.tokens,
+                "tiers": trace.tiers,
+                "cost_usd": round(trace.cost_usd, 6),
+            }, ensure_ascii=False))
+        self._ensure_flusher()
+
+    def wsgi_middleware(self, wsgi_app):
+        """Wrap a WSGI app so each request (including streamed bodies) is traced."""
+        from werkzeug.wsgi import ClosingIterator
+
+        def middleware(environ, start_response):
+            trace, token = self.start_request()
+            status = [500]
+
+            def traced_start_response(status_line, headers, exc_info=None):
+                status[0] = int(status_line.split(" ", 1)[0])
+                return start_response(status_line, headers, exc_info)
+
+            def finish(status_code: int) -> None:
+                self.finish_request(trace, status_code)
+                try:
+                    _current_trace.reset(token)
+                except ValueError:
+                    pass  # the body was consumed in another context
+
+            try:
+                body = wsgi_app(environ, traced_start_response)
+            except BaseException:
+                finish(500)
+                raise
+            # Streamed bodies are produced after we return, so the trace stays
+            # current until the server closes the response
+            return ClosingIterator(body, lambda: finish(status[0]))
+
+        return middleware
+
+    def asgi_middleware(self, asgi_app):
+        """Wrap an ASGI app; the request is finished once its last body chunk is sent."""
+        async def middleware(scope, receive, send):
+            if scope["type"] != "http":
+                return await asgi_app(scope, receive, send)
+            trace, token = self.start_request()
+            status = [500]
+            finished = [False]
+
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    status[0] = message["status"]
+                await send(message)
+                if message["type"] == "http.response.body" and not message.get("more_body"):
+                    finished[0] = True
+                    self.finish_request(trace, status[0])
+
+            try:
+                await asgi_app(scope, receive, traced_send)
+            finally:
+                if not finished[0]:
+                    self.finish_request(trace, status[0])
+                _current_trace.reset(token)
+
+        return middleware
+
+    # --- Cross-Worker Aggregation ---
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.metrics_dir, f"worker-{pid}.json")
+
+    def flush(self) -> None:
+        if not self.metrics_dir:
+            return
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error in metrics flush: {e}")
+
+    def _ensure_flusher(self) -> None:
+        """Start one background flusher per worker process (after any fork)."""
+        if not self.metrics_dir or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush()
+
+        threading.Thread(target=loop, name="metrics-flush", daemon=True).start()
+
+    def _collect(self) -> List[dict]:
+        snapshots = [self.snapshot()]
+        if not self.metrics_dir:
+            return snapshots
+        own = os.path.basename(self._snapshot_path(os.getpid()))
+        for filename in sorted(os.listdir(self.metrics_dir)):
+            if filename == own or not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.metrics_dir, filename)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # a worker is mid-write or the file is gone
+        return snapshots
+
+    def render(self) -> str:
+        """All workers' metrics, summed, in the Prometheus text exposition format."""
+        counters: dict = {}
+        histograms: dict = {}
+        for snapshot in self._collect():
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                if len(values) != len(self.buckets) + 3:
+                    continue  # written with different buckets
+                merged = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    merged[i] += value
+
+        lines = []
+        for name in sorted({key[0] for key in counters} | {key[0] for key in histograms}):
+            kind, help_text = _HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), values):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(values[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,90 @@
+"""
+Size-based model routing for LegalRAG.
+
+Every LLM call is routed to one of two tiers: "large" (the default model) or
+"light" (a faster, cheaper one). A call goes to the light tier when its
+estimated prompt size is at most that method's threshold, so short documents
+and small bookkeeping prompts don't pay for the large model while long
+documents and advice keep it. Thresholds are per method and can be set with
+ROUTE_LIGHT_MAX_TOKENS_<METHOD>, e.g. ROUTE_LIGHT_MAX_TOKENS_SIMPLIFY_DOCUMENT=2000;
+0 always uses the large model.
+
+Prices (USD per million tokens) are used to report cost per route in /metrics.
+"""
+import os
+from typing import Dict, NamedTuple
+
+LARGE_MODEL_NAME = "gemini-2.5-flash"
+LIGHT_MODEL_NAME = "gemini-2.5-flash-lite"
+
+# Largest estimated prompt (tokens) each method sends to the light tier
+DEFAULT_LIGHT_MAX_TOKENS = {
+    "identify_document": 4000,
+    "summarize_conversation": 4000,
+    "simplify_document": 1000,
+    "ask_question_about_document": 1500,
+    "get_rights": 0,
+    "advise_on_case": 0,
+}
+
+
+class ModelTier(NamedTuple):
+    name: str
+    model: str
+    input_price: float  # USD per million input tokens
+    output_price: float  # USD per million output tokens
+
+    def metadata(self) -> dict:
+        """LangChain run metadata; metrics reads it to report latency and cost per tier."""
+        return {
+            "model_tier": self.name,
+            "model": self.model,
+            "usd_per_million_input": self.input_price,
+            "usd_per_million_output": self.output_price,
+        }
+
+
+class ModelRouter:
+    """Picks the model tier for a call from its method and estimated prompt tokens."""
+
+    def __init__(self, large: ModelTier, light: ModelTier, light_max_tokens: Dict[str, int]):
+        self.large = large
+        self.light = light
+        self.light_max_tokens = light_max_tokens
+
+    @classmethod
+    def from_env(cls, large_model: str = LARGE_MODEL_NAME) -> "ModelRouter":
+        """Build from *_MODEL_* and ROUTE_LIGHT_MAX_TOKENS_* environment variables."""
+        large = ModelTier(
+            "large",
+            os.getenv("LARGE_MODEL_NAME", large_model),
+            float(os.getenv("LARGE_MODEL_INPUT_PRICE", "0.30")),
+            float(os.getenv("LARGE_MODEL_OUTPUT_PRICE", "2.50")),
+        )
+        light = ModelTier(
+            "light",
+            os.getenv("LIGHT_MODEL_NAME", LIGHT_MODEL_NAME),
+            float(os.getenv("LIGHT_MODEL_INPUT_PRICE", "0.10")),
+            float(os.getenv("LIGHT_MODEL_OUTPUT_PRICE", "0.40")),
+        )
+        thresholds = {
+            method: int(os.getenv(f"ROUTE_LIGHT_MAX_TOKENS_{method.upper()}", str(default)))
+            for method, default in DEFAULT_LIGHT_MAX_TOKENS.items()
+        }
+        return cls(large, light, thresholds)
+
+    @property
+    def tiers(self) -> tuple:
+        return (self.large, self.light)
+
+    def route(self, method: str, prompt_tokens: int) -> ModelTier:
+        if prompt_tokens <= self.light_max_tokens.get(method, 0):
+            return self.light
+        return self.large
+
+    def config(self) -> dict:
+        """Models and thresholds in use, for the stats endpoint."""
+        return {
+            "tiers": {tier.name: tier.model for tier in self.tiers},
+            "light_max_tokens": dict(self.light_max_tokens),
+        }
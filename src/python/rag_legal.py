@@ -1,13 +1,75 @@
+import asyncio
 import os
-from typing import List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Iterator, List, Optional, Sequence, Type
 from pydantic.v1 import BaseModel, Field
 
-# --- LangChain & Google Generative AI Imports ---
-from langchain_google_genai import ChatGoogleGenerativeAI
-# --- MODIFIED: Imports moved to langchain_core ---
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+# --- LangChain Imports ---
+# The LangChain stack is most of our cold-start time, so it is imported where
+# chains and the LLM client are built (at warm-up or on first use), not here.
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+
+# --- Local Imports ---
+from response_cache import ResponseCache, make_cache_key
+from semantic_cache import SemanticCache
+from answer_bank import AnswerBank
+from conversation_store import Compaction, Conversation, ConversationStore
+from model_router import ModelRouter, ModelTier
+from single_flight import SingleFlight
+from admission import (
+    AdmissionController, PRIORITY_BULK, PRIORITY_CHAT, PRIORITY_INTERACTIVE,
+)
+from document_chunks import DocumentIndex, estimate_tokens, split_document
+from knowledge_index import KnowledgeIndex
+from metrics import run_config, stage, traced
+
+# --- Model & Prompt Versions ---
+# Bump a prompt version whenever its template changes so stale cached answers are ignored.
+MODEL_NAME = "gemini-2.5-flash"
+PROMPT_VERSIONS = {
+    "get_rights": "2",
+    "simplify_document": "2",
+    "advise_on_case": "1",
+    "ask_question_about_document": "3",
+    "summarize_conversation": "1",
+    "identify_document": "1",
+}
+
+# Admission priority per method: chat turns go ahead of bulk simplification
+METHOD_PRIORITIES = {
+    "get_rights": PRIORITY_INTERACTIVE,
+    "simplify_document": PRIORITY_BULK,
+    "advise_on_case": PRIORITY_INTERACTIVE,
+    "ask_question_about_document": PRIORITY_CHAT,
+    "summarize_conversation": PRIORITY_CHAT,
+    "identify_document": PRIORITY_INTERACTIVE,
+}
+
+# Token-bucket charge for a response, on top of the estimated prompt tokens
+OUTPUT_TOKEN_ALLOWANCE = 1024
+
+# Operations accepted by /api/batch: API name -> (LegalRAG method, input fields in argument order)
+BATCH_OPERATIONS = {
+    "know-your-rights": ("get_rights", ("query",)),
+    "simplify": ("simplify_document", ("text",)),
+    "advise": ("advise_on_case", ("case_text",)),
+    "ask-vakil": ("ask_question_about_document", ("document_text", "question")),
+    "identify": ("identify_document", ("text",)),
+}
+
+# Chain registry: name -> builder method. Chains are compiled once per process.
+CHAIN_BUILDERS = {
+    "rights": "_rights_chain",
+    "simplify": "_simplify_chain",
+    "advise": "_advise_chain",
+    "advise_stream": "_advise_stream_chain",
+    "vakil": "_vakil_chain",
+    "vakil_summary": "_vakil_summary_chain",
+    "identify": "_identify_chain",
+}
 
 # --- Pydantic Models for All API Endpoints ---
 # (These remain the same as before)
@@ -37,46 +99,777 @@ class AnalysisPoint(BaseModel):
 class AdviseResponse(BaseModel):
     analysis_points: List[AnalysisPoint]
 
+class IdentifyResponse(BaseModel):
+    title: str = Field(description="A short name for the document, e.g. 'Residential rental agreement'")
+    summary: str = Field(description="One sentence on what the document is about")
+
+
+def merge_simplified_points(responses: List[SimplifyResponse]) -> SimplifyResponse:
+    """Concatenate per-chunk summaries in order, dropping repeated points."""
+    merged, seen = [], set()
+    for response in responses:
+        for point in response.summary_points:
+            key = " ".join(point.title.lower().split())
+            text_key = " ".join(point.text.lower().split())
+            if key in seen or text_key in seen:
+                continue
+            seen.update((key, text_key))
+            merged.append(point)
+    return SimplifyResponse(summary_points=merged)
+
+
+class _PointCollector:
+    """Turns a stream of partial JSON results into complete list items, in order."""
+
+    def __init__(self, list_key: str, point_model: Type[BaseModel]):
+        self.list_key = list_key
+        self.point_model = point_model
+        self.points: List[BaseModel] = []
+        self._partial: list = []
+
+    def feed(self, partial_result) -> List[BaseModel]:
+        self._partial = (partial_result or {}).get(self.list_key) or []
+        # Every item before the last one in the partial list is complete
+        return self._take(len(self._partial) - 1)
+
+    def finish(self) -> List[BaseModel]:
+        return self._take(len(self._partial))
+
+    def _take(self, upto: int) -> List[BaseModel]:
+        new = []
+        while len(self.points) < upto:
+            self.points.append(self.point_model.parse_obj(self._partial[len(self.points)]))
+            new.append(self.points[-1])
+        return new
+
 
 # --- The Main "LLM" Class (No RAG) ---
 
 class LegalRAG:
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[ResponseCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        admission: Optional[AdmissionController] = None,
+        knowledge_index: Optional[KnowledgeIndex] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        conversations: Optional[ConversationStore] = None,
+        router: Optional[ModelRouter] = None,
+        answer_bank: Optional[AnswerBank] = None,
+    ):
         
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.3, google_api_key=api_key)
-        
-        # --- Add a new simple output parser ---
-        self.string_parser = StrOutputParser()
+        # Short prompts go to a lighter model tier; see model_router.py
+        self.router = router or ModelRouter.from_env(MODEL_NAME)
+        self.model_name = self.router.large.model
+        self.api_key = api_key
+        # With an admission controller, retries and backoff happen there instead of in the client
+        self.llm_options = {"max_retries": 0} if admission else {}
+
+        # LLM clients (one per tier) and compiled chains are created on first use (or by warm_up)
+        self._llms: dict = {}
+        self._llm_override = None
+        self._chains: dict = {}
+        self._lock = threading.Lock()
+
+        # Optional response cache shared by all public methods
+        self.cache = cache
+
+        # Know-your-rights answers are also served for near-duplicate questions
+        self.semantic_cache = semantic_cache
+
+        # Precomputed answers for the common questions (see answer_bank.py)
+        if answer_bank is not None and answer_bank.prompt_version != PROMPT_VERSIONS["get_rights"]:
+            print(f"Answer bank {answer_bank.path} was built for another prompt version; not using it")
+            answer_bank = None
+        self.answer_bank = answer_bank
+
+        # Identical concurrent requests share one upstream call
+        self.single_flight = single_flight or SingleFlight()
+
+        # Rate limiting, queueing, retries and circuit breaking for upstream calls
+        self.admission = admission
+
+        # Vakil retrieval mode: documents above this size are chunked and only the
+        # top-k relevant chunks (within the context budget) are sent to the LLM.
+        self.vakil_full_document_tokens = int(os.getenv("VAKIL_FULL_DOCUMENT_TOKENS", "6000"))
+        self.vakil_context_tokens = int(os.getenv("VAKIL_CONTEXT_TOKENS", "3000"))
+        self.vakil_top_k = int(os.getenv("VAKIL_TOP_K", "8"))
+        self.vakil_chunk_chars = int(os.getenv("VAKIL_CHUNK_CHARS", "2000"))
+
+        # Vakil chat history per session: recent turns verbatim, older ones summarized.
+        # Model-written summaries are made in the background, off the response path.
+        self.conversations = conversations
+        self._summary_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("CONVERSATION_SUMMARY_WORKERS", "2")), thread_name_prefix="vakil-summary"
+        )
+        self._summary_tasks: set = set()
+
+        # Know-your-rights answers are grounded in the top knowledge base sections
+        self.knowledge_index = knowledge_index
+        self.kb_top_k = int(os.getenv("KB_TOP_K", "3"))
+        self.kb_min_score = float(os.getenv("KB_MIN_SCORE", "2.5"))
+
+        # Simplify map-reduce: documents longer than one chunk are summarized
+        # chunk by chunk in parallel, then merged.
+        self.simplify_chunk_chars = int(os.getenv("SIMPLIFY_CHUNK_CHARS", "8000"))
+        self.simplify_max_concurrency = int(os.getenv("SIMPLIFY_MAX_CONCURRENCY", "4"))
+
+        # Identification only needs the opening of a document (title, parties, recitals)
+        self.identify_chars = int(os.getenv("IDENTIFY_CHARS", "2000"))
+
+    # --- LLM Client & Chain Registry ---
+
+    @property
+    def llm(self):
+        """The large-tier client."""
+        return self._client(self.router.large)
+
+    @llm.setter
+    def llm(self, llm) -> None:
+        """Use one model for every tier (None recreates the clients lazily); chains are rebuilt on next use."""
+        with self._lock:
+            self._llm_override = llm
+            self._llms = {}
+            self._chains = {}
+
+    def _client(self, tier: ModelTier):
+        if self._llm_override is not None:
+            return self._llm_override
+        client = self._llms.get(tier.name)
+        if client is None:
+            with self._lock:
+                client = self._llms.get(tier.name)
+                if client is None:
+                    client = self._llms[tier.name] = self._create_llm(tier.model)
+        return client
+
+    def _create_llm(self, model: str):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=model, temperature=0.3, google_api_key=self.api_key, **self.llm_options
+        )
+
+    def _chain(self, name: str, tier: Optional[ModelTier] = None):
+        """The compiled chain for `name` on a model tier (default large), built on first use and then shared."""
+        tier = tier or self.router.large
+        chain = self._chains.get((name, tier.name))
+        if chain is None:
+            # The tier's metadata lets metrics report latency and cost per tier
+            chain = getattr(self, CHAIN_BUILDERS[name])(self._client(tier)).with_config(metadata=tier.metadata())
+            # Two threads may race to build; either result is equivalent
+            chain = self._chains.setdefault((name, tier.name), chain)
+        return chain
+
+    def _route(self, method: str, inputs: Sequence[str]) -> ModelTier:
+        """The model tier for a call, from the estimated size of its prompt inputs."""
+        return self.router.route(method, sum(estimate_tokens(i) for i in inputs))
+
+    def warm_up(self) -> float:
+        """Create the LLM clients and compile every chain on every tier; returns the seconds taken."""
+        started = time.perf_counter()
+        for name in CHAIN_BUILDERS:
+            for tier in self.router.tiers:
+                self._chain(name, tier)
+        return time.perf_counter() - started
+
+    # --- Response Cache Helpers ---
+
+    def _cached(
+        self,
+        method: str,
+        inputs: Sequence[str],
+        compute: Callable[[], object],
+        response_model: Optional[Type[BaseModel]] = None,
+        admit: bool = True,
+    ):
+        """Return a cached result for (method, inputs) or compute and store it.
+
+        Concurrent misses for the same key are coalesced into a single compute().
+        compute() is admitted as one LLM call unless admit is False, for
+        computes that admit each of their calls themselves.
+        """
+        key = self._cache_key(method, inputs)
+        cached = self._cache_get(key, response_model)
+        if cached is not None:
+            return cached
+
+        def compute_and_store():
+            result = self._admit(method, inputs, compute) if admit else compute()
+            self._cache_set(key, result, response_model)
+            return result
+
+        return self.single_flight.do(
+            key, compute_and_store, recheck=lambda: self._cache_get(key, response_model)
+        )
+
+    async def _acached(
+        self,
+        method: str,
+        inputs: Sequence[str],
+        compute: Callable[[], Awaitable[object]],
+        response_model: Optional[Type[BaseModel]] = None,
+        admit: bool = True,
+    ):
+        """Async counterpart of _cached; compute is awaited only on a miss."""
+        key = self._cache_key(method, inputs)
+        # The disk tier is SQLite, so cache reads and writes run off the event loop
+        cached = await asyncio.to_thread(self._cache_get, key, response_model)
+        if cached is not None:
+            return cached
+
+        async def compute_and_store():
+            result = await self._aadmit(method, inputs, compute) if admit else await compute()
+            await asyncio.to_thread(self._cache_set, key, result, response_model)
+            return result
+
+        return await self.single_flight.ado(
+            key, compute_and_store, recheck=lambda: self._cache_get(key, response_model)
+        )
+
+    def _cache_get(self, key: str, response_model: Optional[Type[BaseModel]]):
+        if self.cache is None:
+            return None
+        cached = self.cache.get(key)
+        if cached is not None and response_model:
+            return response_model.parse_obj(cached)
+        return cached
+
+    def _cache_set(self, key: str, result, response_model: Optional[Type[BaseModel]]) -> None:
+        if self.cache is not None:
+            self.cache.set(key, result.dict() if response_model else result)
+
+    def _banked_rights(self, question: str, sections: list) -> Optional[KnowYourRightsResponse]:
+        """The precomputed answer for a common question about the best-matching section."""
+        if self.answer_bank is None or not sections:
+            return None
+        with stage("answer_bank"):
+            answer = self.answer_bank.match(question, self._rights_topic(sections))
+        return KnowYourRightsResponse.parse_obj(answer) if answer is not None else None
+
+    def _similar_rights(self, question: str, sections: list) -> Optional[KnowYourRightsResponse]:
+        """A cached answer to a near-duplicate question about the same knowledge base section."""
+        if self.semantic_cache is None:
+            return None
+        with stage("semantic_cache"):
+            cached = self.semantic_cache.get(question, self._rights_topic(sections))
+        return KnowYourRightsResponse.parse_obj(cached) if cached is not None else None
+
+    def _remember_rights(self, question: str, sections: list, result: KnowYourRightsResponse) -> None:
+        if self.semantic_cache is not None:
+            self.semantic_cache.set(question, result.dict(), self._rights_topic(sections))
+
+    @staticmethod
+    def _rights_topic(sections: list) -> str:
+        # The best-matching section; lower-ranked ones vary between paraphrases
+        return f"{sections[0].source}: {sections[0].title}" if sections else "(none)"
+
+    # --- Admission Helpers ---
+
+    def _admission_args(self, method: str, inputs: Sequence[str]) -> tuple:
+        tokens = sum(estimate_tokens(i) for i in inputs) + OUTPUT_TOKEN_ALLOWANCE
+        return METHOD_PRIORITIES[method], tokens
+
+    def _admit(self, method: str, inputs: Sequence[str], compute: Callable[[], object]):
+        if self.admission is None:
+            return compute()
+        return self.admission.call(compute, *self._admission_args(method, inputs))
+
+    async def _aadmit(self, method: str, inputs: Sequence[str], compute: Callable[[], Awaitable[object]]):
+        if self.admission is None:
+            return await compute()
+        return await self.admission.acall(compute, *self._admission_args(method, inputs))
+
+    def _admit_stream(self, method: str, inputs: Sequence[str], make_stream: Callable[[], Iterator]) -> Iterator:
+        if self.admission is None:
+            return make_stream()
+        return self.admission.stream(make_stream, *self._admission_args(method, inputs))
+
+    def _aadmit_stream(self, method: str, inputs: Sequence[str], make_stream: Callable[[], AsyncIterator]) -> AsyncIterator:
+        if self.admission is None:
+            return make_stream()
+        return self.admission.astream(make_stream, *self._admission_args(method, inputs))
+
+    def _cache_key(self, method: str, inputs: Sequence[str]) -> str:
+        # Keyed on the routed model: tiers answer differently
+        return make_cache_key(method, self._route(method, inputs).model, PROMPT_VERSIONS[method], *inputs)
+
+    def _cache_lookup(self, method: str, inputs: Sequence[str]):
+        """Returns (key, cached value) for the streaming paths; both None without a cache."""
+        if self.cache is None:
+            return None, None
+        key = self._cache_key(method, inputs)
+        return key, self.cache.get(key)
+
+    async def _acache_lookup(self, method: str, inputs: Sequence[str]):
+        return await asyncio.to_thread(self._cache_lookup, method, inputs)
 
     # --- Public Methods for Each API Endpoint ---
 
+    @traced("get_rights")
     def get_rights(self, question: str) -> KnowYourRightsResponse:
-        """Handler for the 'Know Your Rights' feature (without RAG)."""
+        """Handler for the 'Know Your Rights' feature, grounded in the knowledge base."""
+        sections = self._rights_sections(question)
+        precomputed = self._banked_rights(question, sections)
+        if precomputed is not None:
+            return precomputed
+        context = self._rights_context(sections)
+        similar = self._similar_rights(question, sections)
+        if similar is not None:
+            return similar
+        with stage("chain_assembly"):
+            chain = self._chain("rights", self._route("get_rights", (question, context)))
+        result = self._cached(
+            "get_rights", (question, context),
+            lambda: chain.invoke({"question": question, "context": context}, config=run_config()),
+            KnowYourRightsResponse,
+        )
+        self._remember_rights(question, sections, result)
+        return result
+
+    @traced("simplify_document")
+    def simplify_document(self, doc_text: str) -> SimplifyResponse:
+        """Handler for the 'Simplify Document' feature (without RAG)."""
+        with stage("chain_assembly"):
+            chain = self._chain("simplify", self._route("simplify_document", (doc_text,)))
+        if len(doc_text) <= self.simplify_chunk_chars:
+            compute = lambda: chain.invoke(doc_text, config=run_config())
+            return self._cached("simplify_document", (doc_text,), compute, SimplifyResponse)
+        return self._cached(
+            "simplify_document", (doc_text,), lambda: self._simplify_map_reduce(chain, doc_text),
+            SimplifyResponse, admit=False,
+        )
+
+    def _simplify_map_reduce(self, chain, doc_text: str) -> SimplifyResponse:
+        """
+        Summarize clause-aware chunks concurrently and merge the points in order.
+
+        Each chunk is admitted, and retried, as its own call, so rate limits
+        count every upstream request and a transient error on one chunk
+        repeats only that chunk.
+        """
+        config = run_config()
+
+        def summarize(part: str) -> SimplifyResponse:
+            return self._admit("simplify_document", (part,), lambda: chain.invoke(part, config=config))
+
+        with ThreadPoolExecutor(max_workers=self.simplify_max_concurrency) as pool:
+            responses = list(pool.map(summarize, self._simplify_parts(doc_text)))
+        return merge_simplified_points(responses)
+
+    @traced("advise_on_case")
+    def advise_on_case(self, case_text: str) -> AdviseResponse:
+        """Handler for the 'AI Legal Advisor' feature."""
+        with stage("chain_assembly"):
+            chain = self._chain("advise", self._route("advise_on_case", (case_text,)))
+        return self._cached(
+            "advise_on_case", (case_text,),
+            lambda: chain.invoke(case_text, config=run_config()),
+            AdviseResponse,
+        )
+
+    @traced("advise_on_case")
+    def stream_advice(self, case_text: str) -> Iterator[AnalysisPoint]:
+        """Streaming variant of advise_on_case: yields each AnalysisPoint once it is complete."""
+        key, cached = self._cache_lookup("advise_on_case", (case_text,))
+        if cached is not None:
+            yield from AdviseResponse.parse_obj(cached).analysis_points
+            return
+
+        collector = _PointCollector("analysis_points", AnalysisPoint)
+        with stage("chain_assembly"):
+            chain = self._chain("advise_stream", self._route("advise_on_case", (case_text,)))
+        partial_results = self._admit_stream(
+            "advise_on_case", (case_text,),
+            lambda: chain.stream({"case": case_text}, config=run_config()),
+        )
+        for partial_result in partial_results:
+            yield from collector.feed(partial_result)
+        yield from collector.finish()
+
+        if key:
+            self.cache.set(key, AdviseResponse(analysis_points=collector.points).dict())
+
+    @traced("identify_document")
+    def identify_document(self, doc_text: str) -> IdentifyResponse:
+        """Handler for Vakil's intro line: what kind of document this is, from its opening."""
+        excerpt = doc_text[:self.identify_chars]
+        with stage("chain_assembly"):
+            chain = self._chain("identify", self._route("identify_document", (excerpt,)))
+        return self._cached(
+            "identify_document", (excerpt,),
+            lambda: chain.invoke(excerpt, config=run_config()),
+            IdentifyResponse,
+        )
+
+    # --- This is the new method for your Vakil chatbot ---
+    def uses_retrieval(self, doc_text: str) -> bool:
+        """True when the document is too large to send whole to the Vakil prompt."""
+        return estimate_tokens(doc_text) > self.vakil_full_document_tokens
+
+    def build_document_index(self, doc_text: str) -> DocumentIndex:
+        """Chunk and index a document once so later questions can retrieve from it."""
+        return DocumentIndex(doc_text, max_chars=self.vakil_chunk_chars)
+
+    @traced("ask_question_about_document")
+    def ask_question_about_document(
+        self,
+        doc_text: str,
+        question: str,
+        document_index: Optional[DocumentIndex] = None,
+        session_id: Optional[str] = None,
+    ) -> str:
+        """Handler for the 'Vakil' chatbot.
+
+        Small documents are sent whole. Larger ones are answered from the most
+        relevant chunks only; pass a prebuilt document_index to skip re-indexing.
+        With a session_id, earlier turns of that chat are sent along and this
+        turn is added to them.
+        """
+        conversation, history = self._vakil_history(session_id)
+        context = self._vakil_context(doc_text, self._vakil_query(question, conversation), document_index)
+        inputs = (context, history, question)
+        with stage("chain_assembly"):
+            chain = self._chain("vakil", self._route("ask_question_about_document", inputs))
         
+        answer = self._cached(
+            "ask_question_about_document",
+            inputs,
+            lambda: chain.invoke({
+                "document": context,
+                "history": history,
+                "question": question
+            }, config=run_config()),
+        )
+        self._remember_turn(session_id, question, answer)
+        return answer
+
+    @traced("ask_question_about_document")
+    def stream_question_about_document(
+        self,
+        doc_text: str,
+        question: str,
+        document_index: Optional[DocumentIndex] = None,
+        session_id: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Streaming variant of ask_question_about_document: yields answer text as it arrives."""
+        conversation, history = self._vakil_history(session_id)
+        context = self._vakil_context(doc_text, self._vakil_query(question, conversation), document_index)
+        inputs = (context, history, question)
+        key, cached = self._cache_lookup("ask_question_about_document", inputs)
+        if cached is not None:
+            yield cached
+            self._remember_turn(session_id, question, cached)
+            return
+
+        pieces = []
+        with stage("chain_assembly"):
+            chain = self._chain("vakil", self._route("ask_question_about_document", inputs))
+        stream = self._admit_stream(
+            "ask_question_about_document", inputs,
+            lambda: chain.stream(
+                {"document": context, "history": history, "question": question}, config=run_config()
+            ),
+        )
+        for piece in stream:
+            pieces.append(piece)
+            yield piece
+
+        answer = "".join(pieces)
+        if key:
+            self.cache.set(key, answer)
+        self._remember_turn(session_id, question, answer)
+
+    # --- Vakil Conversation History ---
+
+    def _vakil_history(self, session_id: Optional[str]) -> tuple:
+        """(Conversation, history prompt text) for the session; empty without one."""
+        if self.conversations is None or not session_id:
+            return Conversation("", []), "(none)"
+        with stage("history"):
+            conversation = self.conversations.get(session_id)
+        return conversation, conversation.render(self.conversations.recent_tokens)
+
+    @staticmethod
+    def _vakil_query(question: str, conversation: Conversation) -> str:
+        # Follow-ups ("what about clause 4 then?") retrieve with the previous question too
+        if not conversation.turns:
+            return question
+        return f"{conversation.turns[-1][0]}\n{question}"
+
+    def _remember_turn(self, session_id: Optional[str], question: str, answer: str) -> None:
+        if self.conversations is None or not session_id:
+            return
+        compaction = self.conversations.append(session_id, question, answer)
+        if compaction is not None:
+            # The extractive summary is already stored; a model-written one replaces
+            # it when ready, without holding up this response
+            self._summary_pool.submit(self._summarize, compaction)
+
+    async def _aremember_turn(self, session_id: Optional[str], question: str, answer: str) -> None:
+        if self.conversations is None or not session_id:
+            return
+        compaction = await asyncio.to_thread(self.conversations.append, session_id, question, answer)
+        if compaction is not None:
+            task = asyncio.create_task(self._asummarize(compaction))
+            # The loop only keeps weak references to tasks
+            self._summary_tasks.add(task)
+            task.add_done_callback(self._summary_tasks.discard)
+
+    def _summarize(self, compaction: Compaction) -> None:
+        inputs = self._summary_inputs(compaction)
+        try:
+            chain = self._chain("vakil_summary", self._route("summarize_conversation", tuple(inputs.values())))
+            # No request trace: the response this turn belongs to has already been sent
+            summary = self._admit(
+                "summarize_conversation", tuple(inputs.values()), lambda: chain.invoke(inputs)
+            )
+            self.conversations.set_summary(compaction, summary)
+        except Exception as e:
+            print(f"Error in summarize_conversation: {e}")
+
+    async def _asummarize(self, compaction: Compaction) -> None:
+        inputs = self._summary_inputs(compaction)
+        try:
+            chain = self._chain("vakil_summary", self._route("summarize_conversation", tuple(inputs.values())))
+            summary = await self._aadmit(
+                "summarize_conversation", tuple(inputs.values()), lambda: chain.ainvoke(inputs)
+            )
+            await asyncio.to_thread(self.conversations.set_summary, compaction, summary)
+        except Exception as e:
+            print(f"Error in summarize_conversation: {e}")
+
+    @staticmethod
+    def _summary_inputs(compaction: Compaction) -> dict:
+        return {
+            "summary": compaction.previous_summary or "(none)",
+            "turns": "\n\n".join(f"User: {q}\nVakil: {a}" for q, a in compaction.turns),
+        }
+
+    # --- Batch Execution ---
+    # Each item goes through the public method, so caching, request coalescing
+    # and admission apply per item; failures are returned in the item's slot.
+
+    def _batch_runnable(self, operation: str):
+        from langchain_core.runnables import RunnableLambda
+
+        method, _ = BATCH_OPERATIONS[operation]
+        return RunnableLambda(
+            lambda args: getattr(self, method)(*args),
+            afunc=lambda args: getattr(self, f"a{method}")(*args),
+        )
+
+    def batch(self, operation: str, inputs: Sequence[tuple], max_concurrency: int = 4) -> list:
+        """Results (or exceptions) for each input tuple, in input order."""
+        return self._batch_runnable(operation).batch(
+            list(inputs), config={"max_concurrency": max_concurrency}, return_exceptions=True
+        )
+
+    def batch_as_completed(
+        self, operation: str, inputs: Sequence[tuple], max_concurrency: int = 4
+    ) -> Iterator[tuple]:
+        """Yields (index, result or exception) as each item finishes."""
+        return self._batch_runnable(operation).batch_as_completed(
+            list(inputs), config={"max_concurrency": max_concurrency}, return_exceptions=True
+        )
+
+    async def abatch(self, operation: str, inputs: Sequence[tuple], max_concurrency: int = 4) -> list:
+        return await self._batch_runnable(operation).abatch(
+            list(inputs), config={"max_concurrency": max_concurrency}, return_exceptions=True
+        )
+
+    # --- Async Variants (used by the ASGI app in asgi.py) ---
+
+    @traced("get_rights")
+    async def aget_rights(self, question: str) -> KnowYourRightsResponse:
+        sections = self._rights_sections(question)
+        precomputed = self._banked_rights(question, sections)
+        if precomputed is not None:
+            return precomputed
+        context = self._rights_context(sections)
+        similar = self._similar_rights(question, sections)
+        if similar is not None:
+            return similar
+        with stage("chain_assembly"):
+            chain = self._chain("rights", self._route("get_rights", (question, context)))
+        result = await self._acached(
+            "get_rights", (question, context),
+            lambda: chain.ainvoke({"question": question, "context": context}, config=run_config()),
+            KnowYourRightsResponse,
+        )
+        self._remember_rights(question, sections, result)
+        return result
+
+    @traced("simplify_document")
+    async def asimplify_document(self, doc_text: str) -> SimplifyResponse:
+        with stage("chain_assembly"):
+            chain = self._chain("simplify", self._route("simplify_document", (doc_text,)))
+
+        if len(doc_text) <= self.simplify_chunk_chars:
+            return await self._acached(
+                "simplify_document", (doc_text,),
+                lambda: chain.ainvoke(doc_text, config=run_config()), SimplifyResponse,
+            )
+
+        async def map_reduce():
+            # Each chunk admitted on its own, as in _simplify_map_reduce
+            slots = asyncio.Semaphore(self.simplify_max_concurrency)
+
+            async def summarize(part: str) -> SimplifyResponse:
+                async with slots:
+                    return await self._aadmit(
+                        "simplify_document", (part,), lambda: chain.ainvoke(part, config=run_config())
+                    )
+
+            responses = await asyncio.gather(*(summarize(part) for part in self._simplify_parts(doc_text)))
+            return merge_simplified_points(list(responses))
+
+        return await self._acached("simplify_document", (doc_text,), map_reduce, SimplifyResponse, admit=False)
+
+    @traced("advise_on_case")
+    async def aadvise_on_case(self, case_text: str) -> AdviseResponse:
+        with stage("chain_assembly"):
+            chain = self._chain("advise", self._route("advise_on_case", (case_text,)))
+        return await self._acached(
+            "advise_on_case", (case_text,),
+            lambda: chain.ainvoke(case_text, config=run_config()),
+            AdviseResponse,
+        )
+
+    @traced("advise_on_case")
+    async def astream_advice(self, case_text: str) -> AsyncIterator[AnalysisPoint]:
+        key, cached = await self._acache_lookup("advise_on_case", (case_text,))
+        if cached is not None:
+            for point in AdviseResponse.parse_obj(cached).analysis_points:
+                yield point
+            return
+
+        collector = _PointCollector("analysis_points", AnalysisPoint)
+        with stage("chain_assembly"):
+            chain = self._chain("advise_stream", self._route("advise_on_case", (case_text,)))
+        partial_results = self._aadmit_stream(
+            "advise_on_case", (case_text,),
+            lambda: chain.astream({"case": case_text}, config=run_config()),
+        )
+        async for partial_result in partial_results:
+            for point in collector.feed(partial_result):
+                yield point
+        for point in collector.finish():
+            yield point
+
+        if key:
+            result = AdviseResponse(analysis_points=collector.points).dict()
+            await asyncio.to_thread(self.cache.set, key, result)
+
+    @traced("identify_document")
+    async def aidentify_document(self, doc_text: str) -> IdentifyResponse:
+        excerpt = doc_text[:self.identify_chars]
+        with stage("chain_assembly"):
+            chain = self._chain("identify", self._route("identify_document", (excerpt,)))
+        return await self._acached(
+            "identify_document", (excerpt,),
+            lambda: chain.ainvoke(excerpt, config=run_config()),
+            IdentifyResponse,
+        )
+
+    @traced("ask_question_about_document")
+    async def aask_question_about_document(
+        self,
+        doc_text: str,
+        question: str,
+        document_index: Optional[DocumentIndex] = None,
+        session_id: Optional[str] = None,
+    ) -> str:
+        # The conversation store and BM25 indexing are blocking, so keep them off the event loop
+        conversation, history = await asyncio.to_thread(self._vakil_history, session_id)
+        context = await asyncio.to_thread(
+            self._vakil_context, doc_text, self._vakil_query(question, conversation), document_index
+        )
+        inputs = (context, history, question)
+        with stage("chain_assembly"):
+            chain = self._chain("vakil", self._route("ask_question_about_document", inputs))
+        answer = await self._acached(
+            "ask_question_about_document",
+            inputs,
+            lambda: chain.ainvoke(
+                {"document": context, "history": history, "question": question}, config=run_config()
+            ),
+        )
+        await self._aremember_turn(session_id, question, answer)
+        return answer
+
+    @traced("ask_question_about_document")
+    async def astream_question_about_document(
+        self,
+        doc_text: str,
+        question: str,
+        document_index: Optional[DocumentIndex] = None,
+        session_id: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        conversation, history = await asyncio.to_thread(self._vakil_history, session_id)
+        context = await asyncio.to_thread(
+            self._vakil_context, doc_text, self._vakil_query(question, conversation), document_index
+        )
+        inputs = (context, history, question)
+        key, cached = await self._acache_lookup("ask_question_about_document", inputs)
+        if cached is not None:
+            yield cached
+            await self._aremember_turn(session_id, question, cached)
+            return
+
+        pieces = []
+        with stage("chain_assembly"):
+            chain = self._chain("vakil", self._route("ask_question_about_document", inputs))
+        stream = self._aadmit_stream(
+            "ask_question_about_document", inputs,
+            lambda: chain.astream(
+                {"document": context, "history": history, "question": question}, config=run_config()
+            ),
+        )
+        async for piece in stream:
+            pieces.append(piece)
+            yield piece
+
+        answer = "".join(pieces)
+        if key:
+            await asyncio.to_thread(self.cache.set, key, answer)
+        await self._aremember_turn(session_id, question, answer)
+
+    # --- Chain Builders ---
+
+    def _rights_chain(self, llm):
+        from langchain_core.prompts import ChatPromptTemplate
+
         # --- MODIFIED: Added language instruction ---
         prompt = ChatPromptTemplate.from_template(
             """
-            You are a helpful legal assistant. Answer the user's question based on your general knowledge.
+            You are a helpful legal assistant. Answer the user's question about Indian law.
             Provide a clear explanation, cite relevant legal principles, and give actionable guidance.
 
+            Base your answer on the 'Reference Material' below where it is relevant, and
+            use your general knowledge for anything it does not cover.
+
             **CRITICAL**: You MUST respond in the *same language* as the "User's Question".
             If the question is in Hindi, your answer MUST be in Hindi.
 
+            --- REFERENCE MATERIAL ---
+            {context}
+            --- END REFERENCE MATERIAL ---
+
             User's Question: {question}
             """
         )
-        structured_llm = self.llm.with_structured_output(KnowYourRightsResponse)
+        structured_llm = llm.with_structured_output(KnowYourRightsResponse)
         
-        chain = (
-            {"question": RunnablePassthrough()}
-            | prompt
+        return (
+            prompt
             | structured_llm
         )
-        return chain.invoke(question)
 
-    def simplify_document(self, doc_text: str) -> SimplifyResponse:
-        """Handler for the 'Simplify Document' feature (without RAG)."""
-        
+    def _simplify_chain(self, llm):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.runnables import RunnablePassthrough
+
         # --- MODIFIED: Added language instruction ---
         prompt = ChatPromptTemplate.from_template(
             """
@@ -90,20 +883,55 @@ class LegalRAG:
             {document}
             """
         )
-        structured_llm = self.llm.with_structured_output(SimplifyResponse)
+        structured_llm = llm.with_structured_output(SimplifyResponse)
         
-        chain = (
+        return (
             {"document": RunnablePassthrough()}
             | prompt
             | structured_llm
         )
-        return chain.invoke(doc_text)
 
-    def advise_on_case(self, case_text: str) -> AdviseResponse:
-        """Handler for the 'AI Legal Advisor' feature."""
+    def _simplify_parts(self, doc_text: str) -> List[str]:
+        """Clause-aware parts of a long document, each up to simplify_chunk_chars."""
+        chunks = split_document(doc_text, max_chars=self.simplify_chunk_chars)
+        # Tiny adjacent sections are packed together so we don't pay one call per heading
+        parts, current = [], ""
+        for chunk in chunks:
+            text = f"{chunk.title}\n{chunk.text}" if chunk.title and chunk.title not in chunk.text else chunk.text
+            if current and len(current) + len(text) + 2 > self.simplify_chunk_chars:
+                parts.append(current)
+                current = ""
+            current = f"{current}\n\n{text}" if current else text
+        if current:
+            parts.append(current)
+        return parts
+
+    def _advise_chain(self, llm):
+        from langchain_core.runnables import RunnablePassthrough
+
+        structured_llm = llm.with_structured_output(AdviseResponse)
         
+        return (
+            {"case": RunnablePassthrough()}
+            | self._advise_prompt()
+            | structured_llm
+        )
+
+    def _advise_stream_chain(self, llm):
+        from langchain_core.output_parsers import JsonOutputParser
+
+        # Structured output only arrives whole, so stream plain JSON and parse it incrementally
+        parser = JsonOutputParser(pydantic_object=AdviseResponse)
+        prompt = self._advise_prompt(
+            "\n\n{format_instructions}"
+        ).partial(format_instructions=parser.get_format_instructions())
+        return prompt | llm | parser
+
+    def _advise_prompt(self, suffix: str = "") -> "ChatPromptTemplate":
+        from langchain_core.prompts import ChatPromptTemplate
+
         # --- MODIFIED: Added language instruction ---
-        prompt = ChatPromptTemplate.from_template(
+        return ChatPromptTemplate.from_template(
             """
             You are an AI Legal Advisor. Analyze the user's situation described in 'User's Case'.
             Provide grounded, accurate analysis and actionable recommendations based on general legal principles.
@@ -113,27 +941,74 @@ class LegalRAG:
 
             User's Case:
             {case}
+            """ + suffix
+        )
+
+    def _rights_sections(self, question: str) -> list:
+        """The knowledge base sections most relevant to the question, best first."""
+        if self.knowledge_index is None:
+            return []
+        with stage("retrieval"):
+            hits = self.knowledge_index.search(question, k=self.kb_top_k, min_score=self.kb_min_score)
+        return [section for section, _ in hits]
+
+    @staticmethod
+    def _rights_context(sections: list) -> str:
+        """Sections as prompt text."""
+        if not sections:
+            return "(none)"
+        return "\n\n".join(f"[{section.title}]\n{section.text}" for section in sections)
+
+    def _identify_chain(self, llm):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.runnables import RunnablePassthrough
+
+        prompt = ChatPromptTemplate.from_template(
+            """
+            Identify the legal document from its opening below: give it a short name
+            and say in one sentence what it is about.
+
+            **CRITICAL**: You MUST respond in the *same language* as the document.
+
+            Opening of the document:
+            {document}
             """
         )
-        structured_llm = self.llm.with_structured_output(AdviseResponse)
+        structured_llm = llm.with_structured_output(IdentifyResponse)
         
-        chain = (
-            {"case": RunnablePassthrough()}
+        return (
+            {"document": RunnablePassthrough()}
             | prompt
             | structured_llm
         )
-        return chain.invoke(case_text)
 
-    # --- This is the new method for your Vakil chatbot ---
-    def ask_question_about_document(self, doc_text: str, question: str) -> str:
-        """Handler for the 'Vakil' chatbot."""
-        
+    def _vakil_context(
+        self, doc_text: str, question: str, document_index: Optional[DocumentIndex]
+    ) -> str:
+        if not self.uses_retrieval(doc_text):
+            return doc_text
+        with stage("retrieval"):
+            document_index = document_index or self.build_document_index(doc_text)
+            chunks = document_index.retrieve(
+                question, token_budget=self.vakil_context_tokens, k=self.vakil_top_k
+            )
+        return "\n\n[...]\n\n".join(
+            f"[{c.title}]\n{c.text}" if c.title else c.text for c in chunks
+        )
+
+    def _vakil_chain(self, llm):
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate
+
         # --- MODIFIED: Added language instruction ---
         prompt = ChatPromptTemplate.from_template(
             """
             You are a helpful legal assistant named 'Vakil'. 
             A user has provided you with the following document and has a question about it.
             Answer the user's question based *only* on the document's contents.
+            Long documents are shown as the most relevant excerpts, separated by [...].
+            Use the conversation so far to understand follow-up questions
+            (e.g. "what about clause 4 then?"), but still answer from the document.
 
             **CRITICAL**: You MUST respond in the *same language* as the "User's Question".
             If the question is in Hindi, your answer MUST be in Hindi.
@@ -142,17 +1017,46 @@ class LegalRAG:
             {document}
             --- END DOCUMENT ---
 
+            --- CONVERSATION SO FAR ---
+            {history}
+            --- END CONVERSATION ---
+
             User's Question: {question}
             """
         )
         
-        chain = (
+        return (
             prompt
-            | self.llm
-            | self.string_parser
+            | llm
+            | StrOutputParser()
         )
+
+    def _vakil_summary_chain(self, llm):
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate
+
+        prompt = ChatPromptTemplate.from_template(
+            """
+            You keep a running summary of a chat between a user and 'Vakil', a legal
+            assistant answering questions about the user's document.
+            Update the summary below with the new exchanges. Keep what the user may
+            refer back to: clauses and sections discussed, names, amounts, dates and
+            what Vakil concluded. Write at most {max_words} words, in the language
+            the user writes in. Reply with the summary only.
+
+            --- SUMMARY SO FAR ---
+            {summary}
+            --- END SUMMARY ---
+
+            --- NEW EXCHANGES ---
+            {turns}
+            --- END EXCHANGES ---
+            """
+        )
+        summary_tokens = self.conversations.summary_tokens if self.conversations else 400
         
-        return chain.invoke({
-            "document": doc_text,
-            "question": question
-        })
+        return (
+            prompt.partial(max_words=str(summary_tokens * 3 // 4))
+            | llm
+            | StrOutputParser()
+        )
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+
+# --- Key Helpers ---
+
+def normalize_text(text: str) -> str:
+    """Normalize user input so trivially different copies share a cache key."""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split())
+
+
+def make_cache_key(method: str, model: str, prompt_version: str, *inputs: str) -> str:
+    """Content-addressed key over (method, model, prompt version, normalized inputs)."""
+    payload = json.dumps(
+        [method, model, prompt_version, [normalize_text(i) for i in inputs]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# --- Two-Tier Response Cache ---
+
+class ResponseCache:
+    """
+    In-process LRU cache with TTL, backed by an optional SQLite file.
+
+    The SQLite tier is shared by every gunicorn worker that points at the same
+    path, so an answer computed by one worker is a hit for all the others.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 24 * 3600,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 20000,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "disk_errors": 0,
+        }
+
+        if self.disk_path:
+            self._init_disk()
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Build a cache from RESPONSE_CACHE_* environment variables."""
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(24 * 3600))),
+            disk_path=os.getenv("RESPONSE_CACHE_PATH") or None,
+            max_disk_entries=int(os.getenv("RESPONSE_CACHE_MAX_DISK_ENTRIES", "20000")),
+        )
+
+    # --- Public API ---
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self._counters["expirations"] += 1
+
+        found = self._disk_get(key, now) if self.disk_path else None
+        with self._lock:
+            if found is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+        # Promote into memory with the remaining TTL from disk
+        value, expires_at = found
+        self._memory_set(key, value, expires_at)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_set(key, value, expires_at)
+        with self._lock:
+            self._counters["sets"] += 1
+        if self.disk_path:
+            self._disk_set(key, value, expires_at)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM responses")
+            except sqlite3.Error as e:
+                print(f"Response cache disk error: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
+
+    # --- Memory Tier ---
+
+    def _memory_set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    # --- Disk Tier (SQLite, shared across workers) ---
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A fresh connection per operation keeps this safe across gunicorn forks
+        conn = sqlite3.connect(self.disk_path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_disk(self) -> None:
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)"
+            )
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                value, expires_at = row
+                if expires_at <= now:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    with self._lock:
+                        self._counters["expirations"] += 1
+                    return None
+                conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+            return json.loads(value), expires_at
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Response cache disk error: {e}")
+            with self._lock:
+                self._counters["disk_errors"] += 1
+            return None
+
+    def _disk_set(self, key: str, value: Any, expires_at: float) -> None:
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+                )
+                conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+                overflow = count - self.max_disk_entries
+                if overflow > 0:
+                    conn.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        "SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                        (overflow,),
+                    )
+                    with self._lock:
+                        self._counters["evictions"] += overflow
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Response cache disk error: {e}")
+            with self._lock:
+                self._counters["disk_errors"] += 1
@@ -0,0 +1,385 @@
+"""
+Near-duplicate answer cache for know-your-rights.
+
+The response cache only matches questions that are identical after whitespace
+normalization, but users ask the same thing in many ways ("my boss hasn't
+paid my salary" / "employer not paying wages"). This cache embeds each
+question locally (hashed word and character n-gram features, with the
+knowledge base glossary mapping informal and Hindi terms onto the legal ones)
+and finds earlier questions with a random-hyperplane LSH index, so a lookup
+costs well under a millisecond and no API call.
+
+A cached answer is served only when all of these hold:
+  * cosine similarity >= SEMANTIC_CACHE_THRESHOLD
+  * both questions have the same guard terms (guard_terms): negations, time
+    qualifiers and quantities, which the similarity alone barely sees ("can the landlord
+    keep" / "can the landlord not keep", "2 months" / "6 months")
+  * the detected language (Hindi, romanized Hindi or English) is the same,
+    since answers are written in the language of the question
+  * the question's best-matching knowledge base section (its topic) is the
+    same, so the answer was grounded in the same material
+
+Hits are counted by similarity band and the most recent ones are kept with
+both questions side by side, so false positives can be audited in
+/api/cache/stats and the threshold tuned. benchmarks/semantic_pairs.py scores
+labelled paraphrase and contrast pairs to calibrate it.
+
+The cache is off unless SEMANTIC_CACHE_MAX_ENTRIES is set.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from knowledge_index import canonical_terms
+from response_cache import normalize_text
+
+_WORD_RE = re.compile(r"[\w\u0900-\u097F]+")
+_DEVANAGARI_RE = re.compile(r"[\u0900-\u097F]")
+_NEGATION_RE = re.compile(r"n['\u2019]t\b")
+
+# Common romanized Hindi words; enough of them marks a Latin-script question as Hinglish
+_HINGLISH_WORDS = frozenset(
+    "hai hain ka ki ke ko mein se kya kaise kyu kyon mera meri mere mujhe nahi "
+    "nahin aur ya par bhi tha thi raha rahi kar karna karta diya liya wala gaya "
+    "hoga sakta sakti chahiye".split()
+)
+
+# Negations are stopwords for retrieval, so they are compared separately
+NEGATIONS = frozenset(
+    "not no never none nothing nobody nor neither without cannot "
+    "refuse refuses refused refusing deny denies denied denying "
+    "nahi nahin mat नहीं नही मत न बिना".split()
+)
+# When something happens relative to an event changes the answer ("fired during / after leave")
+TIME_QUALIFIERS = frozenset("before after during pehle baad dauran पहले बाद दौरान".split())
+_NUMBER_WORDS = {
+    word: n for n, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve".split()
+    )
+}
+_NUMBER_WORDS.update({"एक": 1, "दो": 2, "तीन": 3, "चार": 4, "पांच": 5, "पाँच": 5, "छह": 6})
+# Durations are compared in days (or hours), so "2 months" and "60 days" agree
+_UNITS = {
+    "day": (1, "d"), "days": (1, "d"), "week": (7, "d"), "weeks": (7, "d"),
+    "month": (30, "d"), "months": (30, "d"), "year": (365, "d"), "years": (365, "d"),
+    "din": (1, "d"), "hafte": (7, "d"), "mahina": (30, "d"), "mahine": (30, "d"), "saal": (365, "d"),
+    "दिन": (1, "d"), "हफ्ते": (7, "d"), "महीना": (30, "d"), "महीने": (30, "d"),
+    "साल": (365, "d"), "वर्ष": (365, "d"),
+    "hour": (1, "h"), "hours": (1, "h"), "घंटे": (1, "h"),
+}
+
+# Character n-grams catch spelling variants ("salery", "landlords")
+CHAR_NGRAM = 3
+CHAR_NGRAM_WEIGHT = 0.3
+
+
+def detect_language(text: str) -> str:
+    """"hi" (Devanagari), "hi-latn" (romanized Hindi) or "en"."""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return "en"
+    if sum(1 for w in words if _DEVANAGARI_RE.search(w)) * 2 >= len(words):
+        return "hi"
+    if sum(1 for w in words if w in _HINGLISH_WORDS) * 5 >= len(words):
+        return "hi-latn"
+    return "en"
+
+
+def embed(text: str) -> Dict[str, float]:
+    """Sparse, L2-normalized feature vector: canonical word terms plus their character n-grams."""
+    vector: Dict[str, float] = {}
+    # "hasn't" and "has not" should look the same
+    for term in canonical_terms(_NEGATION_RE.sub(" not", text.lower())):
+        vector[term] = vector.get(term, 0.0) + 1.0
+        padded = f"#{term}#"
+        for i in range(len(padded) - CHAR_NGRAM + 1):
+            gram = "#" + padded[i:i + CHAR_NGRAM]
+            vector[gram] = vector.get(gram, 0.0) + CHAR_NGRAM_WEIGHT
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    return {f: w / norm for f, w in vector.items()} if norm else {}
+
+
+def _number(word: str) -> Optional[int]:
+    if word.isdigit():
+        return int(word)
+    return _NUMBER_WORDS.get(word)
+
+
+def guard_terms(text: str) -> FrozenSet[str]:
+    """
+    Terms two questions must share for one's answer to serve the other: "not"
+    for any negation, "before"/"after"/"during", and numbers, with durations
+    converted to days ("2 months" -> "60d", "a year" -> "365d").
+    """
+    words = _WORD_RE.findall(_NEGATION_RE.sub(" not", text.lower()))
+    guards = set()
+    for i, word in enumerate(words):
+        if word in NEGATIONS:
+            guards.add("not")
+            continue
+        if word in TIME_QUALIFIERS:
+            guards.add(word)
+            continue
+        n = _number(word)
+        if n is not None:
+            unit = _UNITS.get(words[i + 1]) if i + 1 < len(words) else None
+            guards.add(f"{n * unit[0]}{unit[1]}" if unit else str(n))
+        elif word in _UNITS and (i == 0 or _number(words[i - 1]) is None):
+            scale, suffix = _UNITS[word]
+            guards.add(f"{scale}{suffix}")
+    return frozenset(guards)
+
+
+def cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(f, 0.0) for f, w in a.items())
+
+
+# --- LSH Index ---
+
+@lru_cache(maxsize=65536)
+def _feature_planes(feature: str, planes: int) -> Tuple[int, ...]:
+    """This feature's +1/-1 coordinate in each random hyperplane, derived from its hash."""
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=(planes + 7) // 8).digest()
+    bits = int.from_bytes(digest, "big")
+    return tuple(1 if bits >> i & 1 else -1 for i in range(planes))
+
+
+class SimHashLSH:
+    """
+    Random-hyperplane LSH over sparse vectors.
+
+    Each of `tables` tables hashes a vector to the signs of its projections on
+    `bits` hyperplanes; vectors with a small angle between them collide in at
+    least one table with high probability. Candidates are then re-ranked by
+    exact cosine similarity.
+    """
+
+    def __init__(self, tables: int = 16, bits: int = 8):
+        self.tables = tables
+        self.bits = bits
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(tables)]
+
+    def signatures(self, vector: Dict[str, float]) -> Tuple[int, ...]:
+        planes = self.tables * self.bits
+        projections = [0.0] * planes
+        for feature, weight in vector.items():
+            for i, sign in enumerate(_feature_planes(feature, planes)):
+                projections[i] += sign * weight
+        signatures = []
+        for t in range(self.tables):
+            signature = 0
+            for projection in projections[t * self.bits:(t + 1) * self.bits]:
+                signature = signature << 1 | (projection > 0)
+            signatures.append(signature)
+        return tuple(signatures)
+
+    def add(self, item_id: int, signatures: Tuple[int, ...]) -> None:
+        for buckets, signature in zip(self._buckets, signatures):
+            buckets.setdefault(signature, set()).add(item_id)
+
+    def remove(self, item_id: int, signatures: Tuple[int, ...]) -> None:
+        for buckets, signature in zip(self._buckets, signatures):
+            bucket = buckets.get(signature)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del buckets[signature]
+
+    def candidates(self, signatures: Tuple[int, ...], limit: int = 32) -> List[int]:
+        """Up to `limit` ids, those colliding in the most tables (i.e. the closest) first."""
+        collisions: Counter = Counter()
+        for buckets, signature in zip(self._buckets, signatures):
+            collisions.update(buckets.get(signature, ()))
+        return [item_id for item_id, _ in collisions.most_common(limit)]
+
+
+# --- Semantic Cache ---
+
+def _topic_key(topic: str) -> str:
+    return hashlib.sha256(topic.encode("utf-8")).hexdigest()
+
+
+class _Entry(NamedTuple):
+    question: str
+    vector: Dict[str, float]
+    signatures: Tuple[int, ...]
+    language: str
+    guards: FrozenSet[str]
+    topic_key: str
+    value: Any
+    expires_at: float
+
+
+# Hits are counted per similarity band, to see how close to the threshold they land
+SIMILARITY_BANDS = (0.99, 0.95, 0.9, 0.85, 0.8, 0.75, 0.7)
+# Misses this close below the threshold are counted as near misses
+NEAR_MISS_MARGIN = 0.05
+
+
+class SemanticCache:
+    """Bounded LRU (with TTL) of question -> answer, looked up by similar question."""
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        threshold: float = 0.8,
+        ttl_seconds: float = 24 * 3600,
+        audit_size: int = 50,
+        tables: int = 16,
+        bits: int = 8,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+
+        self._index = SimHashLSH(tables, bits)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_question: Dict[str, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._audit: deque = deque(maxlen=audit_size)
+        self._counters = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "language_mismatches": 0,
+            "guard_mismatches": 0,
+            "topic_mismatches": 0,
+            "near_misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+        self._hit_bands = {band: 0 for band in SIMILARITY_BANDS}
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        """Build from SEMANTIC_CACHE_* environment variables; None unless MAX_ENTRIES is set."""
+        # Opt-in: a false positive serves another question's legal answer
+        max_entries = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "0"))
+        if max_entries <= 0:
+            return None
+        return cls(
+            max_entries=max_entries,
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8")),
+            ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(24 * 3600))),
+            audit_size=int(os.getenv("SEMANTIC_CACHE_AUDIT_SIZE", "50")),
+        )
+
+    # --- Public API ---
+
+    def get(self, question: str, topic: str = "") -> Optional[Any]:
+        """The answer cached for the most similar earlier question, if it qualifies."""
+        question = normalize_text(question)
+        topic_key = _topic_key(topic)
+        vector = embed(question)
+        signatures = self._signatures(vector)
+        language = detect_language(question)
+        guards = guard_terms(question)
+        now = time.time()
+
+        with self._lock:
+            self._counters["lookups"] += 1
+            best, best_score, rejected = None, 0.0, None
+            for item_id in self._index.candidates(signatures):
+                entry = self._entries[item_id]
+                if entry.expires_at <= now:
+                    self._drop(item_id)
+                    self._counters["expirations"] += 1
+                    continue
+                score = cosine(vector, entry.vector)
+                # A miss is counted under the most telling reason a candidate was rejected
+                if score < self.threshold:
+                    if rejected is None and score >= self.threshold - NEAR_MISS_MARGIN:
+                        rejected = "near_misses"
+                    continue
+                if entry.language != language:
+                    rejected = "language_mismatches"
+                elif entry.guards != guards:
+                    if rejected != "language_mismatches":
+                        rejected = "guard_mismatches"
+                elif entry.topic_key != topic_key:
+                    if rejected not in ("language_mismatches", "guard_mismatches"):
+                        rejected = "topic_mismatches"
+                elif score > best_score:
+                    best, best_score = item_id, score
+
+            if best is None:
+                self._counters["misses"] += 1
+                if rejected:
+                    self._counters[rejected] += 1
+                return None
+
+            entry = self._entries[best]
+            self._entries.move_to_end(best)
+            self._counters["hits"] += 1
+            for band in SIMILARITY_BANDS:
+                if best_score >= band:
+                    self._hit_bands[band] += 1
+                    break
+            self._audit.append({
+                "question": question,
+                "matched": entry.question,
+                "similarity": round(best_score, 4),
+                "language": language,
+                "at": now,
+            })
+            return entry.value
+
+    def set(self, question: str, value: Any, topic: str = "") -> None:
+        question = normalize_text(question)
+        vector = embed(question)
+        if not vector:
+            return
+        entry = _Entry(
+            question, vector, self._signatures(vector), detect_language(question),
+            guard_terms(question), _topic_key(topic), value, time.time() + self.ttl_seconds,
+        )
+        with self._lock:
+            previous = self._by_question.get(question)
+            if previous is not None:
+                self._drop(previous)
+            item_id = self._next_id
+            self._next_id += 1
+            self._entries[item_id] = entry
+            self._by_question[question] = item_id
+            self._index.add(item_id, entry.signatures)
+            self._counters["sets"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for item_id in list(self._entries):
+                self._drop(item_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["threshold"] = self.threshold
+            stats["hits_by_similarity"] = {f">={band}": n for band, n in self._hit_bands.items()}
+            stats["recent_hits"] = list(self._audit)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+    def _signatures(self, vector: Dict[str, float]) -> Tuple[int, ...]:
+        # Hash on the word terms only: a handful of features instead of dozens of
+        # n-grams keeps hashing cheap, and candidates are re-ranked on the full vector
+        return self._index.signatures({f: w for f, w in vector.items() if not f.startswith("#")})
+
+    def _drop(self, item_id: int) -> None:
+        # Caller holds the lock
+        entry = self._entries.pop(item_id)
+        self._index.remove(item_id, entry.signatures)
+        if self._by_question.get(entry.question) == item_id:
+            del self._by_question[entry.question]
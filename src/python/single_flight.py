@@ -0,0 +1,206 @@
+import asyncio
+import fcntl
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+# How often a waiting worker re-polls a cross-worker lock file
+_POLL_SECONDS = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    Within a process, followers wait for the leader's result (threads and
+    asyncio tasks are tracked separately). When lock_dir is set, leaders in
+    different worker processes also serialize on a per-key lock file; a leader
+    that had to wait calls recheck() first, so it can pick up the result the
+    other worker just stored in the shared response cache.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, lock_timeout: float = 120):
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+        self._calls: dict = {}
+        self._async_calls: dict = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "coalesced": 0, "cross_worker_saved": 0}
+
+    @classmethod
+    def from_env(cls) -> "SingleFlight":
+        return cls(
+            lock_dir=os.getenv("SINGLE_FLIGHT_LOCK_DIR") or None,
+            lock_timeout=float(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS", "120")),
+        )
+
+    # --- Threaded Callers ---
+
+    def do(self, key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]] = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._counters["leaders" if leader else "coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._process_lock(key) as waited:
+                result = recheck() if waited and recheck else None
+                if result is not None:
+                    self._count("cross_worker_saved")
+                else:
+                    result = fn()
+            call.result = result
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    # --- Asyncio Callers ---
+
+    async def ado(
+        self, key: str, fn: Callable[[], Awaitable[Any]], recheck: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        future = self._async_calls.get(key)
+        if future is not None:
+            self._count("coalesced")
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled (e.g. timed out); take over as leader
+                return await self.ado(key, fn, recheck)
+
+        future = asyncio.get_running_loop().create_future()
+        # Avoid "exception was never retrieved" warnings when nobody is waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._async_calls[key] = future
+        self._count("leaders")
+        try:
+            async with self._aprocess_lock(key) as waited:
+                result = await asyncio.to_thread(recheck) if waited and recheck else None
+                if result is not None:
+                    self._count("cross_worker_saved")
+                else:
+                    result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._async_calls[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["calls_saved"] = stats["coalesced"] + stats["cross_worker_saved"]
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    # --- Cross-Worker File Locks ---
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, f"{key[:32]}.lock")
+
+    def _try_lock(self, path: str, fd: int) -> tuple:
+        """
+        (locked, fd, raced). The holder unlinks the file on release, so a lock
+        taken on a file no longer at `path` is dropped and the path reopened;
+        raced is then True (another worker just finished this key).
+        """
+        raced = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False, fd, raced
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            opened = os.fstat(fd)
+            if current is not None and (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino):
+                return True, fd, raced
+            # Closing drops the lock on the unlinked file
+            os.close(fd)
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+            raced = True
+
+    def _release(self, path: str, fd: int, locked: bool) -> None:
+        if locked:
+            # Safe to unlink while locked: waiters re-check the path after locking
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    @contextmanager
+    def _process_lock(self, key: str):
+        """Yields True if another worker held the lock and we had to wait for it."""
+        if not self.lock_dir:
+            yield False
+            return
+        path = self._lock_path(key)
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        deadline = time.monotonic() + self.lock_timeout
+        locked, fd, waited = self._try_lock(path, fd)
+        while not locked and time.monotonic() < deadline:
+            waited = True
+            time.sleep(_POLL_SECONDS)
+            locked, fd, _ = self._try_lock(path, fd)
+        try:
+            # On timeout we proceed unlocked rather than fail the request
+            yield waited
+        finally:
+            self._release(path, fd, locked)
+
+    @asynccontextmanager
+    async def _aprocess_lock(self, key: str):
+        if not self.lock_dir:
+            yield False
+            return
+        path = self._lock_path(key)
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        deadline = time.monotonic() + self.lock_timeout
+        locked, fd, waited = self._try_lock(path, fd)
+        while not locked and time.monotonic() < deadline:
+            waited = True
+            await asyncio.sleep(_POLL_SECONDS)
+            locked, fd, _ = self._try_lock(path, fd)
+        try:
+            yield waited
+        finally:
+            self._release(path, fd, locked)